@@ -1,34 +1,136 @@
 # ws_hub.py — minimal (websockets 15.x), reemite en JSON {"source": "..."}
 import asyncio
 import json
+import time
+import struct
 import signal
+import socket
+import logging
+import threading
+from collections import deque
 import websockets
+from config.settings import AVATAR_AMPLITUDE_FPS
 
 HOST = "localhost"
 PORT = 9030
 URL_DEFAULT = f"ws://{HOST}:{PORT}"
 VALID_MODES = {"USER", "TTS"}
-CLIENTS = set()
+CLIENTS = {} # ws -> ClientChannel
+
+# Binary amplitude frame (little endian, 8 bytes): type=0x01, seq (uint16), t_ms (uint32, monotonic ms), level (uint8 0-255)
+# The level is the RMS of the TTS audio at that instant, the avatar uses it as mouth/viseme opening.
+FRAME_AMPLITUDE = 0x01
+FRAME_STRUCT = struct.Struct("<BHIB")
+STALE_FRAME_S = 1.0 / AVATAR_AMPLITUDE_FPS #Frames older than one frame period are not sent, a newer one is coming anyway
+MAX_CLIENT_LAG_S = 0.1 #A client whose last ping is unanswered for longer is behind: frames are dropped until it catches up
+WRITE_LIMIT = 1024 #Bytes buffered per client before send() waits, small so a stalled client shows up as backpressure
+SNDBUF = 4096 #Kernel send buffer per client socket, for the same reason
+NOTSENT_LOWAT = 128 #Linux: unsent bytes the kernel may hold, the rest waits in our queue where it can be dropped
+
+def pack_amplitude(seq: int, level: int, t: float | None = None) -> bytes:
+    t_ms = int((time.monotonic() if t is None else t) * 1000.0) & 0xFFFFFFFF
+    return FRAME_STRUCT.pack(FRAME_AMPLITUDE, seq & 0xFFFF, t_ms, max(0, min(255, int(level))))
+
+
+class ClientChannel:
+    """
+    Outbound queue of one hub client with its own writer task, so a slow client never delays the rest.
+    Mode messages are delivered in order (a repeat of the last queued one is skipped, at most `max_modes`); amplitude frames are kept in a tiny deque and dropped when:
+    - they waited more than one frame period, or earlier writes are still in the asyncio write buffer;
+    - the client has not consumed what it already got. Frames are 8 bytes, so hundreds fit in the kernel
+      buffers and would reach a stalled avatar seconds late; a ping travels behind them and its pong
+      only comes back once the client has read up to it.
+    """
+
+    def __init__(self, ws, max_frames: int = 2, max_modes: int = 8):
+        self.ws = ws
+        self.modes: deque[str] = deque(maxlen=max_modes)
+        self.frames: deque[tuple[float, bytes]] = deque(maxlen=max_frames)
+        self.dropped = 0
+        self.pong = None #Pong waiter of the ping sent behind the last frames
+        self.ping_at = 0.0
+        self.wake = asyncio.Event()
+        self.task = asyncio.create_task(self.writer())
+
+    def lagging(self, now: float) -> bool:
+        return self.pong is not None and not self.pong.done() and now - self.ping_at > MAX_CLIENT_LAG_S
+
+    async def send_frame(self, data: bytes, now: float) -> None:
+        await self.ws.send(data)
+        if self.pong is None or self.pong.done():
+            self.pong = await self.ws.ping()
+            self.ping_at = now
+
+    def push_mode(self, payload: str) -> None:
+        if self.modes and self.modes[-1] == payload:
+            return
+        self.modes.append(payload)
+        self.wake.set()
+
+    def push_frame(self, data: bytes) -> None:
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append((time.monotonic(), data))
+        self.wake.set()
+
+    async def writer(self) -> None:
+        try:
+            while True:
+                await self.wake.wait()
+                self.wake.clear()
+                while self.modes or self.frames:
+                    if self.modes:
+                        await self.ws.send(self.modes.popleft())
+                        continue
+                    queued_at, data = self.frames.popleft()
+                    now = time.monotonic()
+                    if (now - queued_at > STALE_FRAME_S or self.lagging(now)
+                            or self.ws.transport.get_write_buffer_size() > 0):
+                        self.dropped += 1
+                        continue
+                    await self.send_frame(data, now)
+        except websockets.ConnectionClosed:
+            pass
+
 
 async def broadcast_json(mode: str):
     """Send {"source": MODE} to every client."""
     if mode not in VALID_MODES or not CLIENTS:
         return
     payload = json.dumps({"source": mode})
-    await asyncio.gather(*(ws.send(payload) for ws in list(CLIENTS)), return_exceptions=True)
+    for ch in list(CLIENTS.values()):
+        ch.push_mode(payload)
+
+def fanout_frame(data: bytes, sender=None) -> None:
+    """Forward one binary amplitude frame to every client except the one that produced it."""
+    if len(data) != FRAME_STRUCT.size:
+        return
+    for ws, ch in list(CLIENTS.items()):
+        if ws is not sender:
+            ch.push_frame(data)
 
 async def handler(ws):
-    CLIENTS.add(ws)
+    sock = ws.transport.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SNDBUF)
+        if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, NOTSENT_LOWAT)
+    CLIENTS[ws] = ClientChannel(ws)
     try:
         async for raw in ws:
+            if isinstance(raw, bytes):
+                fanout_frame(raw, sender=ws)
+                continue
             mode =  raw if isinstance(raw, str) else ""
             if mode:
                 await broadcast_json(mode)
     finally:
-        CLIENTS.discard(ws)
+        ch = CLIENTS.pop(ws, None)
+        if ch is not None:
+            ch.task.cancel()
 
 async def run_server(host=HOST, port=PORT):
-    async with websockets.serve(handler, host, port):
+    async with websockets.serve(handler, host, port, write_limit=WRITE_LIMIT):
         print(f"WS Hub en ws://{host}:{port} (modes: USER/TTS, broadcast JSON)")
         loop = asyncio.get_running_loop()
         stop = loop.create_future()
@@ -52,5 +154,197 @@ async def send_mode(mode: str, url: str = URL_DEFAULT, as_json: bool = True, tim
 def send_mode_sync(mode: str, url: str = URL_DEFAULT, as_json: bool = True, timeout: float = 3.0):
     asyncio.run(send_mode(mode, url=url, as_json=as_json, timeout=timeout))
 
+
+class AvatarClient:
+    """
+    Persistent hub client for real-time callers (the 10 ms audio loop).
+    - One websocket kept open by a background thread with its own event loop, reconnecting with backoff.
+    - `send_mode_nowait()` only appends to a bounded deque and wakes the loop: it never waits on the network.
+    - The queue coalesces: a mode equal to the last pending one is ignored and, when full, the oldest is dropped.
+    - `send_envelope_nowait()` streams a precomputed amplitude envelope as binary frames, paced to playback.
+    - Whatever the hub broadcasts (modes, other clients' frames) is read and discarded, so the socket
+      never fills up and keepalive pings keep getting answered.
+    """
+
+    def __init__(self, url: str = URL_DEFAULT, as_json: bool = True, max_pending: int = 8, timeout: float = 3.0):
+        self.log = logging.getLogger("Avatar_Client")
+        self.url = url
+        self.as_json = as_json
+        self.timeout = timeout
+        self.pending: deque[str] = deque(maxlen=max_pending)
+        self.frames: deque[bytes] = deque(maxlen=2)
+        self.dropped = 0
+        self._seq = 0
+        self._envelope_task = None
+        self._loop = asyncio.new_event_loop()
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="AvatarClient", daemon=True)
+        self._thread.start()
+
+    def send_mode_nowait(self, mode: str) -> None:
+        """Queue USER/TTS for the hub without blocking the caller"""
+        m = (mode or "").upper()
+        if m not in VALID_MODES or self._closed:
+            return
+        payload = json.dumps({"source": m}) if self.as_json else m
+        if self.pending and self.pending[-1] == payload:
+            return
+        if len(self.pending) == self.pending.maxlen:
+            self.dropped += 1
+        self.pending.append(payload)
+        self._loop.call_soon_threadsafe(self._wake.set)
+
+    def send_envelope_nowait(self, levels, fps: float, t_start: float | None = None) -> None:
+        """
+        Publish `levels` (uint8 per frame) at `fps`, frame i at `t_start + i/fps` (time.monotonic clock,
+        now if None). A new envelope replaces the one that is still being published.
+        """
+        if self._closed or levels is None or len(levels) == 0:
+            return
+        t0 = time.monotonic() if t_start is None else t_start
+        self._loop.call_soon_threadsafe(self._start_envelope, bytes(bytearray(levels)), float(fps), t0)
+
+    def _start_envelope(self, levels: bytes, fps: float, t0: float) -> None:
+        if self._envelope_task is not None:
+            self._envelope_task.cancel()
+        self._envelope_task = self._loop.create_task(self._publish_envelope(levels, fps, t0))
+
+    async def _publish_envelope(self, levels: bytes, fps: float, t0: float) -> None:
+        # loop.time() is time.monotonic() on the default event loop
+        for i, level in enumerate(levels):
+            delay = t0 + i / fps - self._loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.frames.append(pack_amplitude(self._seq, level))
+            self._seq += 1
+            self._wake.set()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._sender())
+
+    async def _sender(self) -> None:
+        backoff = 0.2
+        while not self._closed:
+            try:
+                async with websockets.connect(self.url, open_timeout=self.timeout, close_timeout=self.timeout) as ws:
+                    self.log.info(f"Conectado al hub del avatar en {self.url}")
+                    backoff = 0.2
+                    reader = asyncio.create_task(self._drain(ws))
+                    try:
+                        while not self._closed:
+                            if reader.done():
+                                raise ConnectionError("el hub cerró la conexión")
+                            while self.pending:
+                                payload = self.pending.popleft()
+                                try:
+                                    await asyncio.wait_for(ws.send(payload), timeout=self.timeout)
+                                except Exception:
+                                    if len(self.pending) < self.pending.maxlen: #Resend after reconnecting
+                                        self.pending.appendleft(payload)
+                                    else:
+                                        self.dropped += 1
+                                    raise
+                            while self.frames and not self.pending:
+                                await asyncio.wait_for(ws.send(self.frames.popleft()), timeout=self.timeout)
+                            self._wake.clear()
+                            if not self.pending and not self.frames and not reader.done():
+                                await self._wake.wait()
+                    finally:
+                        reader.cancel()
+            except Exception as e:
+                if self._closed:
+                    break
+                self.log.debug(f"Hub del avatar no disponible ({e}), reintento en {backoff:.1f}s")
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=backoff)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+                backoff = min(backoff * 2.0, 5.0)
+
+    async def _drain(self, ws) -> None:
+        """Read and drop what the hub sends us, closing the socket wakes the sender so it reconnects"""
+        try:
+            async for _ in ws:
+                pass
+        except websockets.ConnectionClosed:
+            pass
+        self._wake.set()
+
+    def close(self) -> None:
+        """Stop the background loop (pending modes are discarded)"""
+        self._closed = True
+        self._loop.call_soon_threadsafe(self._wake.set)
+        self._thread.join(timeout=self.timeout)
+
+async def bench(n_clients: int = 50, slow_every: int = 10, seconds: float = 10.0, fps: float = 60.0, port: int = PORT + 1):
+    """Latency/jitter of amplitude frames with many simulated avatars, 1 of every `slow_every` reads slowly."""
+    import statistics
+    url = f"ws://{HOST}:{port}"
+    async with websockets.serve(handler, HOST, port, write_limit=WRITE_LIMIT):
+        stats = []
+
+        async def avatar(slow: bool):
+            # Slow avatars have a tiny receive buffer and stall (no reads) during the first half of the run, then read at 20 Hz
+            lat, arrivals = [], []
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            if slow:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 2048)
+            sock.setblocking(False)
+            await asyncio.get_running_loop().sock_connect(sock, (HOST if HOST != "localhost" else "127.0.0.1", port))
+            async with websockets.connect(url, sock=sock, max_queue=1) as ws:
+                ready.append(ws)
+                if slow:
+                    await asyncio.sleep(seconds / 2)
+                try:
+                    async for raw in ws:
+                        if isinstance(raw, bytes):
+                            now = time.monotonic()
+                            _, _, t_ms, _ = FRAME_STRUCT.unpack(raw)
+                            lat.append(((int(now * 1000.0) & 0xFFFFFFFF) - t_ms) % 2**32)
+                            arrivals.append(now)
+                            if slow:
+                                await asyncio.sleep(0.05)
+                except websockets.ConnectionClosed:
+                    pass
+            gaps = [1000.0 * (b - a) for a, b in zip(arrivals, arrivals[1:])]
+            stats.append((slow, lat, gaps))
+
+        ready = []
+        tasks = [asyncio.create_task(avatar(i % slow_every == 0)) for i in range(n_clients)]
+        while len(ready) < n_clients:
+            await asyncio.sleep(0.01)
+
+        sent = int(seconds * fps)
+        async with websockets.connect(url) as producer:
+            t0 = time.monotonic()
+            for i in range(sent):
+                await asyncio.sleep(max(0.0, t0 + i / fps - time.monotonic()))
+                await producer.send(pack_amplitude(i, i % 256))
+            await asyncio.sleep(0.3)
+        dropped = sum(ch.dropped for ch in CLIENTS.values())
+        for ws in ready:
+            await ws.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    for slow in (False, True):
+        group = [x for x in stats if x[0] is slow]
+        if not group:
+            continue
+        lat = sorted(v for _, l, _ in group for v in l)
+        jit = [statistics.pstdev(g) for _, _, g in group if len(g) > 1]
+        recv = sum(len(l) for _, l, _ in group) / (len(group) * sent)
+        print(f"{'lentos ' if slow else 'rápidos'} x{len(group)}: recibidos {100.0 * recv:.1f}%, "
+              f"latencia p50 {lat[len(lat) // 2]} ms p99 {lat[int(len(lat) * 0.99) - 1]} ms max {lat[-1]} ms, "
+              f"jitter medio {statistics.mean(jit):.2f} ms")
+    print(f"Frames descartados en el hub: {dropped}")
+
 if __name__ == "__main__":
-    asyncio.run(run_server())
+    import sys
+    if "--bench" in sys.argv:
+        idx = sys.argv.index("--bench")
+        asyncio.run(bench(int(sys.argv[idx + 1]) if len(sys.argv) > idx + 1 else 50))
+    else:
+        asyncio.run(run_server())
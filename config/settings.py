@@ -11,6 +11,10 @@ AUDIO_LISTENER_DEVICE_ID: int | None = None #The system is prepared to detect th
 AUDIO_LISTENER_CHANNELS = 1 # "mono" or "stereo"
 AUDIO_LISTENER_SAMPLE_RATE = 16000
 AUDIO_LISTENER_FRAMES_PER_BUFFER = 1000
+AUDIO_LISTENER_NATIVE_CAPTURE = False #Open the mic at its own rate/channels and resample to AUDIO_LISTENER_SAMPLE_RATE mono in NumPy (skips Pulse/ALSA resampling)
+AUDIO_LISTENER_NATIVE_SAMPLE_RATE: int | None = None #None = use the default rate of the device (e.g. 44100 or 48000)
+AUDIO_LISTENER_NATIVE_CHANNELS: int | None = None #None = use every input channel of the device, they are averaged to mono
+AUDIO_LISTENER_RESAMPLER_TAPS = 48 #Taps per polyphase branch, more taps = less aliasing but more CPU
 
 """LLM"""
 USE_LLM = True #If you disable this flag, and the question is not in the Categories we don't call the general knowledge.
@@ -20,12 +24,93 @@ N_BACH_LLM = 512 #The size of the info that gpu or cpu is going to process
 GPU_LAYERS_LLM = 0 #How many layers your model is going to use in GPU, for CPU use "0"
 MAX_MOVE_DISTANCE_LLM = 5.0 #Max distance in meters of the robot movement
 CHAT_FORMAT_LLM = "chatml-function-calling" #NOT recommended to change unless you change the model
+SPECULATIVE_LLM = "off" #Speculative decoding: "off", "prompt_lookup" (n-grams of the prompt, no extra model) or "draft" (small GGUF of the llm_draft section of models.yml)
+SPECULATIVE_NUM_PRED_TOKENS = 10 #Draft tokens proposed per round, fewer if the acceptance is low (python -m llm.llm_speculative)
+SPECULATIVE_NGRAM_SIZE = 2 #Max n-gram searched in the prompt by "prompt_lookup"
+USE_LLM_TIERING = False #Simple general questions go to the small model of the llm_small section of models.yml, the rest (and unsure answers) to the large one
+TIER_SMALL_MAX_SCORE = 0 #Max complexity score answered by the small model (python -m llm.llm_tiering shows the score of each question)
+TIER_MIN_CONFIDENCE = 0.55 #Min geometric-mean token probability of a small answer, lower escalates to the large model
+LLM_POOL_SIZE = 1 #llama.cpp contexts of the LLM sharing the mmapped weights, >1 answers that many requests at once (server mode)
+LLM_POOL_THREADS: int | None = None #Threads per context, None = THREADS_LLM split between the contexts
+LLM_POOL_AGING_S = 2.0 #A waiting general question gains the priority of a motion plan after this long
+
+USE_SESSION_MEMORY = False #Keep each conversation in the LLM context so follow-ups ("¿y cuándo nació?") have the previous turns
+SESSION_MAX_TOKENS = 768 #Token budget of a conversation, keep it under CONTEXT_LLM minus the answer (100)
+SESSION_EVICTION = "summary" #Over the budget drop the oldest turns: "window" forgets them, "summary" keeps their questions in one line
+SESSION_KEEP_RATIO = 0.6 #Eviction drops turns until the conversation is back to this fraction of the budget
+SESSION_IDLE_S = 120.0 #A question after this long starts a new conversation
+SESSION_MAX_SESSIONS = 8 #Conversations kept at once (server mode), least recently used first out
+SESSION_SAVE_STATE = True #Save the KV of the conversation after each turn (~36 KB/token on Qwen2.5-3B, up to ~28 MB per session), restoring it is faster than re-evaluating if another prompt used the context
 
 """Information - data"""
 FUZZY_LOGIC_ACCURACY_GENERAL_RAG = 0.70
 FUZZY_LOGIC_ACCURACY_POSE = 0.70
 PATH_GENERAL_RAG = "config/data/general_rag.json"
 PATH_POSES = "config/data/poses.json"
+NEARBY_RADIUS_M = 5.0 #"¿Qué hay cerca?" lists the places within this distance of the robot
+NEARBY_MAX_PLACES = 3 #Max places spoken in that answer
+NORM_CACHE_SIZE = 1024 #Memoized norm_text results (LRU, keyed on the raw text)
+PLAN_CACHE_SIZE = 256 #Memoized action plans of split_and_prioritize (LRU, keyed on the normalized utterance)
+USE_SEMANTIC_RAG = False #When the fuzzy match misses, look the question up by embeddings before calling the LLM (build them first: python -m llm.llm_semantic --build)
+SEMANTIC_RAG_ENCODER = "llm" #"llm" (the GGUF model in embedding mode) or "hashing" (lexical stand-in, no model needed)
+PATH_RAG_EMBEDDINGS = "config/data/general_rag_emb" #.npy (float16 matrix) + .json (answers, encoder, digest)
+SEMANTIC_RAG_THRESHOLD = 0.80 #Min cosine similarity to answer from GENERAL_RAG
+SEMANTIC_RAG_TOP_K = 3
+PATH_BENCH_CORPUS = "config/data/bench_corpus.json" #Versioned utterances of the micro-benchmarks (python -m llm.llm_bench --build-corpus)
+PATH_BENCH_BASELINE = "config/data/bench_baseline.json" #Results stored with python -m llm.llm_bench --save-baseline (local, not versioned)
+BENCH_REGRESSION_TOLERANCE = 0.25 #p50 this much over the baseline is flagged as a regression
+
+"""Memory"""
+USE_MEMORY_MANAGER = False #Unload idle engines (LLM, Whisper, Piper) and keep the process within MEMORY_BUDGET_MB, they reload on use
+MEMORY_BUDGET_MB = 3000 #Max RSS of the process, e.g. 3000 on a 4 GB board
+MEMORY_CHECK_S = 10.0 #How often the idle/budget policy runs
+MEMORY_IDLE_LLM_S: float | None = 300.0 #Unload the LLM after this long without a general/navigate question, None = only under memory pressure
+MEMORY_IDLE_STT_S: float | None = 600.0 #Unload Whisper after this long without a wake word
+MEMORY_IDLE_TTS_S: float | None = None #Piper is small, by default only unloaded under memory pressure
+MEMORY_PREFETCH_ON_WAKE = True #Reload Whisper and the LLM in background as soon as the wake word is heard
+
+"""Motion bridge"""
+USE_MOTION_BRIDGE = False #Send natural_move/goto/cancel to a long-lived bridge instead of forking ros2 per move, start it first with python -m llm.llm_motion (moves fall back to ros2 run while it is down)
+MOTION_BRIDGE_HOST = "127.0.0.1"
+MOTION_BRIDGE_PORT = 9040
+MOTION_BRIDGE_TIMEOUT_S = 1.0 #Connection timeout, commands are queued meanwhile
+
+"""Telemetry"""
+USE_TELEMETRY = True #Keep the latest battery and pose of the robot from a live feed (llm/llm_telemetry.py)
+TELEMETRY_SOURCE = "udp" #"udp" (stand-in feed of JSON datagrams) or "ros2" (needs a sourced ROS 2 environment)
+TELEMETRY_UDP_HOST = "127.0.0.1"
+TELEMETRY_UDP_PORT = 9050
+TELEMETRY_ROS_BATTERY_TOPIC = "/battery_state" #sensor_msgs/BatteryState
+TELEMETRY_ROS_POSE_TOPIC = "/amcl_pose" #geometry_msgs/PoseWithCovarianceStamped
+TELEMETRY_STALE_S = 5.0 #Readings older than this are reported as stale
+
+"""Server"""
+LLM_SERVER_URL: str | None = None #e.g. "http://192.168.1.10:9060": ask a shared AgentServer (python -m llm.llm_server) instead of running the LLM on this robot
+SERVER_HOST = "0.0.0.0"
+SERVER_HTTP_PORT = 9060 #POST /ask (JSON text or audio/L16 PCM), GET /health
+SERVER_WS_PORT = 9061
+SERVER_MAX_CONCURRENCY = 2 #Requests answered at once, each one takes THREADS_LLM cores
+SERVER_MAX_QUEUE = 8 #Requests waiting for a slot, past that new ones are refused with "busy" (HTTP 503)
+SERVER_REQUEST_TIMEOUT_S = 30.0 #Deadline of a request, waiting in the queue included
+SERVER_READ_TIMEOUT_S = 5.0 #Time a client has to send its request and to take each streamed answer
+SERVER_MAX_BODY_BYTES = 2_000_000 #~60 s of PCM int16 16 kHz
+
+"""Tracing"""
+USE_TRACING = False #Write the timing of every stage of a turn (end of speech, STT, actions, LLM, TTS) to PATH_TRACE, summary: python -m utils.tracing
+PATH_TRACE = "logs/trace.jsonl" #JSON lines, one per span
+TRACE_MAX_BYTES = 5_000_000 #Rotate the trace file at this size
+TRACE_BACKUPS = 3 #Rotated files kept (trace.jsonl.1 ... .3)
+
+"""Metrics"""
+USE_METRICS = False #Serve live counters of the engines (wake, VAD, STT/TTS real-time factor, LLM tokens/s and waits, caches, memory) for Prometheus
+METRICS_HOST = "0.0.0.0"
+METRICS_PORT = 9070 #GET /metrics
+
+"""Maps backend"""
+MAPS_BACKEND_URL = "http://0.0.0.0:9009/maps/maps"
+MAPS_TIMEOUT_S = 2.0 #Only the first request (empty cache) waits on it
+MAPS_CACHE_TTL_S = 30.0 #After this the cached list is served stale while it is refreshed in background
+MAPS_REFRESH_S: float | None = None #Background refresh period (e.g. 20.0), None = only refresh on demand
 
 """Audio Publisher"""
 AUDIO_PUBLISHER_DEVICE_ID = -1 #This is the default output
@@ -39,7 +124,10 @@ VOLUME_TTS = 2.0 #Volume  of the TTS
 SPEED_TTS = 1.0 # 1.0 = Fast and 2.0 = slow
 PATH_TO_SAVE_TTS = "tts/audios" #Specify the PATH where we are going to save the Info
 NAME_OF_OUTS_TTS = "test" #This is the name that your file is going to revive Ex: test_0.wav -> A subfolder /test is gonna be created
-SAVE_WAV_TTS = False
+SAVE_WAV_TTS = False #Archive every TTS output in a background thread (no extra synthesis)
+USE_TTS_CACHE = True #Reuse the audio of phrases already synthesized (RAG answers, router replies...)
+PATH_TTS_CACHE = "~/.cache/Local-LLM-for-Robots/tts_cache" #Raw PCM files + index.json, pre-warm it with "python -m tts.tts_cache"
+MAX_ENTRIES_TTS_CACHE = 256 #Max dynamic phrases kept (LRU), pre-warmed phrases are never evicted
 
 """Speech-to-Text"""
 SAMPLE_RATE_STT = 16000 #Whisper works at this sample_rate doesn't change unless it is necessary
@@ -47,10 +135,18 @@ SAMPLE_RATE_STT = 16000 #Whisper works at this sample_rate doesn't change unless
 LISTEN_SECONDS_STT = 5.0 #The time of the phrase that the tts is going to be active after de wake_word detection
 MIN_SILENCE_MS_TO_DRAIN_STT = 50 # 500 ms of time required to drain the buffer, if you want 1 second, put 100. Its divided by 10 cause we sample at 10ms
 SELF_VOCABULARY_STT = "Octybot, ve a la enfermería, DatIA Demographics" 
+SAVE_WAV_STT = False #Archive every utterance sent to Whisper (same writer as SAVE_WAV_TTS)
+PATH_TO_SAVE_STT = "stt/audios" #The files are saved as stt/audios/stt/stt_<date>_<n>.wav
+
+"""Audio Archive (SAVE_WAV_TTS / SAVE_WAV_STT)"""
+ARCHIVE_FORMAT = "wav" # "wav" or "flac" (flac is encoded with ffmpeg)
+ARCHIVE_MAX_MB = 500 #Disk quota per folder, the oldest files are deleted first
+ARCHIVE_MAX_FILES = 2000 #Max files per folder
 
 """Wake-Word"""
 ACTIVATION_PHRASE_WAKE_WORD = "ok robot" #The Activation Word that the model is going to detect
 VARIANTS_WAKE_WORD =  ["ok robot", "okay robot", "hey robot"] #variations
 
 """"Use Avatar"""
-AVATAR = False #If you want to use the avatar
\ No newline at end of file
+AVATAR = False #If you want to use the avatar
+AVATAR_AMPLITUDE_FPS = 60 #Rate of the TTS amplitude frames streamed to the avatar
\ No newline at end of file
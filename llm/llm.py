@@ -1,53 +1,107 @@
 from __future__ import annotations
-from typing import List
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
 import logging, json, os
 
-from config.settings import PATH_GENERAL_RAG
-from llm.llm_intentions import split_and_prioritize
+from config.settings import PATH_GENERAL_RAG, USE_SEMANTIC_RAG, SPECULATIVE_LLM, USE_LLM_TIERING, LLM_POOL_SIZE
+from llm.llm_intentions import split_and_prioritize, Utterance
 from llm.llm_data import GENERAL_RAG
+from llm.llm_semantic import SemanticRAG
 from llm.llm_client import LLM
+from llm.llm_pool import LlmPool
+from llm.llm_tiering import TieredLLM, SmallModel
+from llm.llm_session import CURRENT_SESSION
 from llm.llm_router import Router
 from llm.llm_tools import GetInfo
+from utils.tracing import TRACER
+
+
+#Intents answered with the robot's own telemetry: in remote mode the robot that asked runs them
+ROBOT_KINDS = ("battery", "pose", "nearby")
+
+#Motion commands emitted by the action being handled (remote mode), returned instead of executed
+_ROBOT_ACTIONS: ContextVar[Optional[List[Dict[str, Any]]]] = ContextVar("ROBOT_ACTIONS", default=None)
+
+
+def _capture_action(payload: Dict[str, Any]) -> None:
+    actions = _ROBOT_ACTIONS.get()
+    if actions is not None:
+        actions.append(payload)
 
 
 class LlmAgent:
     def __init__(
         self,
         model_path: str,
+        draft_path: str | None = None,
+        small_path: str | None = None,
+        remote: bool = False,
     ) -> None:
-        
+        """ remote=True (agent server): motion commands and telemetry questions are not run on this machine,
+            ask_iter() returns them as the 'action' of each answer for the robot to run (RemoteAgent) """
         self.log = logging.getLogger("LLM")     
+        self.remote = remote
         self.general_rag = GENERAL_RAG(os.path.expanduser(PATH_GENERAL_RAG)) 
-        self.llm = LLM(model_path =  model_path)
-        self.get_info = GetInfo()
+        if USE_SEMANTIC_RAG:
+            tier = SemanticRAG.from_settings(self.general_rag.items, model_path)
+            if tier is not None:
+                self.general_rag.attach_semantic(tier)
+        if LLM_POOL_SIZE > 1:
+            self.llm = LlmPool(model_path, size = LLM_POOL_SIZE, draft_path = draft_path)
+        else:
+            self.llm = LLM(model_path =  model_path, draft_path = draft_path)
+        if USE_LLM_TIERING and small_path:
+            self.llm = TieredLLM(self.llm, SmallModel(small_path))
+        self.get_info = GetInfo(on_nav_cmd=_capture_action, execute=False) if remote else GetInfo()
         self.router = Router(self.llm, self.get_info)
         
         self.log.info("LLM initialized - Octybot listo ✅ ")
 
-    def ask(self, text: str) -> None:
+    def ask(self, text: str, session: str | None = "local") -> None:
         """ Process a user input:
-        - classify into actions (battery/pose/navigate/general)
-        - execute via router.handle()"""
-        outs: List[str] = []
+        - parse it once (Utterance) and classify into actions (battery/pose/navigate/general)
+        - execute via router.handle(), the clause Utterance is passed as data
+        - general questions continue the conversation `session` (USE_SESSION_MEMORY), None = stateless"""
         if not isinstance(text, str) or not text.strip():
             text = "No tengo mensaje para procesar."
             return [text]
-        
+        return [out["answer"] for out in self.ask_iter(text, session)]
+
+    def ask_iter(self, text: str, session: str | None = "local") -> Iterator[Dict[str, str]]:
+        """ Same as ask() but yield {'kind', 'answer'} as soon as each action is answered (server streaming).
+            In remote mode an answer also carries 'action': the motion command (goto, natural_move, cancel) or
+            the telemetry question ({'type': 'battery'|'pose'|'nearby'}, empty answer) the robot must run """
+        token = CURRENT_SESSION.set(session)
         try:
-            actions = split_and_prioritize(text, self.general_rag)
+            with TRACER.span("plan") as sp:
+                actions = split_and_prioritize(Utterance(text), self.general_rag)
+                sp.set(actions=[a.get("kind") for a in actions])
             for action in actions:
                 data = action.get("params", {}).get("data")
                 kind = action.get("kind")
-                ans = self.router.handle(data, kind)
+                if self.remote and kind in ROBOT_KINDS:
+                    yield {"kind": kind, "answer": "", "action": {"type": kind}}
+                    continue
+                actions = []
+                action_token = _ROBOT_ACTIONS.set(actions)
+                try:
+                    with TRACER.span(f"action.{kind}"):
+                        ans = self.router.handle(data, kind)
+                finally:
+                    _ROBOT_ACTIONS.reset(action_token)
                 if not isinstance(ans, str):
                     ans = json.dumps(ans, ensure_ascii=False)
                 self.log.info(ans)
-                outs.append(ans)
+                out = {"kind": kind, "answer": ans}
+                if actions:
+                    out["action"] = actions[-1]
+                yield out
 
         except Exception as e:
             self.log.exception("Error procesando ask()")
             ans = json.dumps({"error": type(e).__name__, "msg": str(e)}, ensure_ascii=False)
-        return outs
+        finally:
+            CURRENT_SESSION.reset(token)
 
  #———— Example Usage ————
 if "__main__" == __name__:
@@ -55,7 +109,9 @@ if "__main__" == __name__:
 
     from utils.utils import LoadModel
     model =  LoadModel()
-    app = LlmAgent(model_path = str(model.ensure_model("llm")[0]))
+    draft = str(model.ensure_model("llm_draft")[0]) if SPECULATIVE_LLM == "draft" else None
+    small = str(model.ensure_model("llm_small")[0]) if USE_LLM_TIERING else None
+    app = LlmAgent(model_path = str(model.ensure_model("llm")[0]), draft_path = draft, small_path = small)
     
     last_batt=app.get_info.set_battery(percentage=0.67),
 
@@ -0,0 +1,260 @@
+"""
+Micro-benchmark suite of the text understanding pipeline (offline, the LLM is a stand-in):
+norm_text, detect_intent, extract_place_query, split_and_prioritize, GENERAL_RAG.lookup, PosesIndex.lookup
+and Router.handle, each over a versioned corpus of utterances (config/data/bench_corpus.json).
+
+    python -m llm.llm_bench                    # run and compare with the stored baseline (exit 1 on regression)
+    python -m llm.llm_bench --save-baseline    # run and store the results as the new baseline
+    python -m llm.llm_bench --build-corpus     # regenerate the corpus from general_rag.json and poses.json
+    python -m llm.llm_bench --only general_rag.lookup,router.handle --repeat 5
+
+The memoization (norm_text LRU and action plans) is off while measuring, so the numbers are the cost of a
+new utterance; the baseline is only comparable on the same machine and corpus version, so it is kept out of
+the repository: save it locally from the commit to compare against, then check the change.
+"""
+from __future__ import annotations
+from typing import Any, Callable, Dict, List, Tuple
+import contextlib, hashlib, io, json, logging, os, platform, random, sys, time
+
+from config.settings import (PATH_GENERAL_RAG, PATH_POSES, PATH_BENCH_CORPUS, PATH_BENCH_BASELINE,
+                             BENCH_REGRESSION_TOLERANCE)
+
+CORPUS_VERSION = 1
+MIN_CALLS = 500 #Calls per pass of every function
+MIN_DELTA_US = 1.0 #Sub-µs differences (e.g. a dict dispatch) are timer noise, never a regression
+
+#Spoken commands of the robot (README, main.py and the module examples), the robot-intent side of the corpus
+COMMANDS = (
+    "¿Dónde estoy?", "¿Cuál es tu batería?", "Ve a la enfermería", "Por favor ve a la enfermería y luego dime tu batería",
+    "¿Cuándo fue la Independencia de México y cuál es mi batería?", "¿Dónde queda la cocina?",
+    "Oye robot, ¿cuántos mapas tenemos?", "¿Qué mapas tienes?", "Gracias, avanza hacia la recepción y después gira a la derecha",
+    "cancela la navegación por favor", "detente", "¿qué hay cerca?", "gira a la derecha", "gira 90 grados a la izquierda",
+    "avanza un metro", "retrocede dos metros", "¿quién eres?", "ve a la cocina por favor", "llévame al cargador",
+    "¿cuánta batería te queda y dónde estás?", "¿Qué es la fotosíntesis?", "¿Por qué el cielo es azul?",
+    "Cuéntame un chiste corto sobre robots.", "señálame dónde está el baño", "ve a la sala de juntas y luego regresa al cargador",
+)
+#How a place alias shows up in a command
+PLACE_TEMPLATES = ("ve a {}", "¿dónde queda {}?", "llévame a {} por favor")
+
+
+def build_corpus(rag_path: str = PATH_GENERAL_RAG, poses_path: str = PATH_POSES, seed: int = 0) -> Dict[str, Any]:
+    """ Deterministic corpus: GENERAL_RAG triggers, place aliases inside commands, robot commands and compounds """
+    with open(os.path.expanduser(rag_path), encoding="utf-8") as f:
+        rag = json.load(f)
+    with open(os.path.expanduser(poses_path), encoding="utf-8") as f:
+        poses = json.load(f)
+    items: List[Dict[str, str]] = []
+    for k in rag.get("knowledge", []):
+        items += [{"text": t, "source": "general_rag"} for t in k.get("triggers", [])]
+    for p in poses.get("poses", []):
+        for i, alias in enumerate([p.get("name", "")] + p.get("aliases", [])):
+            if alias.strip():
+                items.append({"text": PLACE_TEMPLATES[i % len(PLACE_TEMPLATES)].format(alias.strip()), "source": "poses"})
+    items += [{"text": c, "source": "commands"} for c in COMMANDS]
+    rng = random.Random(seed)
+    singles = [it["text"] for it in items]
+    for _ in range(40):
+        a, b = rng.sample(singles, 2)
+        items.append({"text": f"{a} y luego {b}", "source": "compound"})
+    return {"version": CORPUS_VERSION, "items": items}
+
+
+def corpus_digest(corpus: Dict[str, Any]) -> str:
+    return hashlib.sha1(json.dumps(corpus["items"], ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+
+
+def load_corpus(path: str = PATH_BENCH_CORPUS) -> Dict[str, Any]:
+    with open(os.path.expanduser(path), encoding="utf-8") as f:
+        return json.load(f)
+
+
+class StubLLM:
+    """ Stand-in of LLM for the Router: constant answers, no model """
+
+    def answer_general(self, user_prompt: str) -> str:
+        return "Respuesta de prueba."
+
+    def plan_motion(self, user_prompt: str) -> Dict[str, Any]:
+        return {"yaw": 0.0, "distance": 1.0, "flag": False}
+
+
+class _StubMaps:
+    def get_maps(self) -> List[str]:
+        return ["piso_1", "piso_2"]
+
+
+class _StubMotion:
+    def reachable(self) -> bool:
+        return True
+
+    def send(self, payload: Dict[str, Any]) -> None:
+        pass
+
+    def cancel(self) -> Dict[str, Any]:
+        return {"ok": True}
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def measure(fn: Callable, args: List[Tuple], repeat: int) -> Dict[str, float]:
+    """
+    Time every call of fn(*a) for a in args, `repeat` passes after one warm-up pass.
+    The pass with the lowest p50 is kept: noise (other processes, frequency scaling) only adds time.
+    """
+    for a in args:
+        fn(*a)
+    args = args * max(1, MIN_CALLS // max(1, len(args))) #small sets (e.g. places) get enough samples for p95/p99
+    best: Dict[str, float] | None = None
+    clock = time.perf_counter_ns
+    for _ in range(repeat):
+        lat: List[float] = []
+        for a in args:
+            t0 = clock()
+            fn(*a)
+            lat.append((clock() - t0) / 1000.0)
+        lat.sort()
+        r = {"calls": len(lat), "p50_us": round(percentile(lat, 0.50), 2), "p95_us": round(percentile(lat, 0.95), 2),
+             "p99_us": round(percentile(lat, 0.99), 2), "ops_s": round(len(lat) / (sum(lat) / 1e6), 1)}
+        if best is None or r["p50_us"] < best["p50_us"]:
+            best = r
+    return best
+
+
+def calibrate(repeat: int = 30) -> float:
+    """
+    µs of a fixed pure-Python workload (string and dict work like the pipeline's), best of `repeat`.
+    The baseline is scaled by the ratio of this number now and when it was saved, which cancels most of
+    the difference of CPU frequency between runs of the same machine.
+    """
+    words = [f"palabra{i % 97}" for i in range(2_000)]
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter_ns()
+        counts: Dict[str, int] = {}
+        for w in words:
+            w = w.lower().replace("a", "e")
+            counts[w] = counts.get(w, 0) + 1
+        " ".join(sorted(counts)).split()
+        best = min(best, (time.perf_counter_ns() - t0) / 1000.0)
+    return best
+
+
+def run_suite(corpus: Dict[str, Any], repeat: int = 5, only: List[str] | None = None) -> Dict[str, Dict[str, float]]:
+    import llm.llm_intentions as intentions
+    from llm.llm_intentions import Utterance, detect_intent, extract_place_query, split_and_prioritize
+    from llm.llm_data import GENERAL_RAG, PosesIndex
+    from llm.llm_router import Router
+    from llm.llm_tools import GetInfo
+
+    logging.disable(logging.WARNING) #the Router/GetInfo log every command, and the maps backend is not there
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag = GENERAL_RAG(os.path.expanduser(PATH_GENERAL_RAG))
+        poses = PosesIndex(os.path.expanduser(PATH_POSES))
+        get_info = GetInfo(on_nav_cmd=lambda payload: None)
+    get_info.maps.close()
+    get_info.maps, get_info.motion = _StubMaps(), _StubMotion()
+    router = Router(StubLLM(), get_info)
+
+    #No memoization: every call pays for a new utterance
+    cached_norm = intentions.norm_text
+    intentions.norm_text = cached_norm.__wrapped__
+    max_plans = intentions.PLAN_CACHE.max_entries
+    intentions.PLAN_CACHE.max_entries = 0
+    intentions.invalidate_caches()
+
+    texts = [it["text"] for it in corpus["items"]]
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            clauses = [c for t in texts for c in Utterance(t).clauses]
+            plans = [a for t in texts for a in split_and_prioritize(Utterance(t), rag)]
+            places = [extract_place_query(t) for t in texts if detect_intent(Utterance(t)) == "navigate"]
+            cases: Dict[str, Tuple[Callable, List[Tuple]]] = {
+                "norm_text": (cached_norm.__wrapped__, [(t, True) for t in texts]),
+                "detect_intent": (detect_intent, [(str(c),) for c in clauses]),
+                "extract_place_query": (extract_place_query, [(t,) for t in texts]),
+                "split_and_prioritize": (lambda t: split_and_prioritize(Utterance(t), rag), [(t,) for t in texts]),
+                "general_rag.lookup": (lambda c: rag.lookup(Utterance.normalized(c)), [(str(c),) for c in clauses]),
+                "poses.lookup": (poses.lookup, [(p,) for p in places or texts]),
+                "router.handle": (router.handle, [(a["params"].get("data", ""), a["kind"]) for a in plans]),
+            }
+            results = {}
+            for name, (fn, args) in cases.items():
+                if only and name not in only:
+                    continue
+                results[name] = measure(fn, args, repeat)
+    finally:
+        intentions.norm_text = cached_norm
+        intentions.PLAN_CACHE.max_entries = max_plans
+        logging.disable(logging.NOTSET)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], scale: float = 1.0,
+            tolerance: float = BENCH_REGRESSION_TOLERANCE) -> List[str]:
+    """
+    Names of the functions whose p50 is over the baseline (times `scale`, see calibrate()) by more than
+    `tolerance` and MIN_DELTA_US; p95/p99 are reported but too noisy to gate on.
+    """
+    regressions = []
+    for name, r in results.items():
+        b = baseline.get("results", {}).get(name)
+        expected = b["p50_us"] * scale if b else 0.0
+        if b and r["p50_us"] > expected * (1.0 + tolerance) and r["p50_us"] - expected > MIN_DELTA_US:
+            regressions.append(name)
+    return regressions
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    args = sys.argv[1:]
+    if "--build-corpus" in args:
+        corpus = build_corpus()
+        with open(PATH_BENCH_CORPUS, "w", encoding="utf-8") as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=1)
+        print(f"Corpus v{corpus['version']} ({corpus_digest(corpus)}): {len(corpus['items'])} enunciados en {PATH_BENCH_CORPUS}")
+        exit(0)
+
+    corpus = load_corpus()
+    digest = corpus_digest(corpus)
+    repeat = int(args[args.index("--repeat") + 1]) if "--repeat" in args else 5
+    only = args[args.index("--only") + 1].split(",") if "--only" in args else None
+    calib = calibrate()
+    results = run_suite(corpus, repeat, only)
+    calib = (calib + calibrate()) / 2.0 #before and after, the CPU frequency may change during the run
+
+    baseline = None
+    if os.path.exists(PATH_BENCH_BASELINE):
+        with open(PATH_BENCH_BASELINE, encoding="utf-8") as f:
+            baseline = json.load(f)
+    scale = calib / baseline["calibration_us"] if baseline and baseline.get("calibration_us") else 1.0
+    print(f"Corpus v{corpus['version']} ({digest}), {len(corpus['items'])} enunciados, mejor de {repeat} pasadas, "
+          f"calibración {calib:.0f} µs (x{scale:.2f} la de la línea base)")
+    print(f"{'función':22s} {'llamadas':>8s} {'p50 µs':>9s} {'p95 µs':>9s} {'p99 µs':>9s} {'ops/s':>10s}  vs base p50")
+    for name, r in results.items():
+        b = (baseline or {}).get("results", {}).get(name)
+        delta = f"{100.0 * (r['p50_us'] / (b['p50_us'] * scale) - 1.0):+6.1f}%" if b and b["p50_us"] else "     -"
+        print(f"{name:22s} {r['calls']:8d} {r['p50_us']:9.2f} {r['p95_us']:9.2f} {r['p99_us']:9.2f} {r['ops_s']:10.1f}  {delta}")
+
+    if "--save-baseline" in args:
+        with open(PATH_BENCH_BASELINE, "w", encoding="utf-8") as f:
+            json.dump({"corpus_version": corpus["version"], "corpus_digest": digest, "python": platform.python_version(),
+                       "machine": platform.machine(), "cpus": os.cpu_count(), "date": time.strftime("%Y-%m-%d"),
+                       "calibration_us": round(calib, 1), "results": results}, f, ensure_ascii=False, indent=1)
+        print(f"Línea base guardada en {PATH_BENCH_BASELINE} ✅")
+    elif baseline is None:
+        print("Sin línea base, guárdala con --save-baseline")
+    elif baseline.get("corpus_digest") != digest:
+        print(f"La línea base es de otro corpus ({baseline.get('corpus_digest')}), vuelve a guardarla con --save-baseline")
+    else:
+        regressions = compare(results, baseline, scale)
+        if regressions: #confirm on a second run of just those functions, a busy CPU must not fail the check
+            calib2 = calibrate()
+            again = run_suite(corpus, repeat, regressions)
+            scale2 = (calib2 + calibrate()) / 2.0 / baseline["calibration_us"] if baseline.get("calibration_us") else 1.0
+            regressions = [n for n in compare(again, baseline, scale2) if n in regressions]
+        if regressions:
+            print(f"❌ Regresiones de más del {100.0 * BENCH_REGRESSION_TOLERANCE:.0f}% sobre la línea base: {', '.join(regressions)}")
+            exit(1)
+        print(f"Sin regresiones frente a la línea base del {baseline.get('date')} ✅")
@@ -1,19 +1,55 @@
 from __future__ import annotations
-import threading
+import threading, time
 import os
 import json
 from typing import Optional, Dict, Any
 from typing import Any
+import llama_cpp
 from llama_cpp import Llama
 
-from config.settings import CONTEXT_LLM,THREADS_LLM,N_BACH_LLM,GPU_LAYERS_LLM,CHAT_FORMAT_LLM,USE_LLM
+from config.settings import CONTEXT_LLM,THREADS_LLM,N_BACH_LLM,GPU_LAYERS_LLM,CHAT_FORMAT_LLM,USE_LLM,SPECULATIVE_LLM,USE_SESSION_MEMORY
 from config.llm_system_prompt_def import NAVIGATE_SYSTEM_PROMPT, GENERAL_SYSTEM_PROMPT
+from llm.llm_speculative import make_draft_model, DraftStats
+from llm.llm_session import SessionStore, CURRENT_SESSION
+from utils.memory import Reloadable
+from utils.tracing import TRACER
+from utils.metrics import METRICS, SECONDS_BUCKETS, TOKENS_S_BUCKETS
 
-class LLM:
-    def __init__(self, model_path:str, system_prompt: str | None = None):
+LLM_SECONDS = METRICS.histogram("octybot_llm_seconds", "LLM completion time (s)", SECONDS_BUCKETS)
+LLM_TOKENS = METRICS.counter("octybot_llm_completion_tokens_total", "Tokens generated by the LLM")
+LLM_TOKENS_S = METRICS.histogram("octybot_llm_tokens_per_second", "LLM decode speed (tokens/s)", TOKENS_S_BUCKETS)
+
+
+def perf_reset(llm: Llama) -> None:
+    try:
+        llama_cpp.llama_perf_context_reset(llm.ctx)
+    except Exception:
+        pass
+
+def perf_split(llm: Llama) -> Dict[str, Any]:
+    """ Prompt-eval vs decode time and tokens since perf_reset(), from llama.cpp's counters ({} if not available) """
+    try:
+        p = llama_cpp.llama_perf_context(llm.ctx)
+    except Exception:
+        return {}
+    if not (p.n_p_eval or p.n_eval):
+        return {}
+    return {"prompt_eval_ms": round(p.t_p_eval_ms, 1), "prompt_eval_tokens": p.n_p_eval,
+            "decode_ms": round(p.t_eval_ms, 1), "decode_tokens": p.n_eval}
+
+def observe_generation(call: str, seconds: float, tokens: int | None, decode_ms: float | None = None) -> None:
+    """ Metrics of one completion: latency, generated tokens and decode speed (llama.cpp decode time when known) """
+    LLM_SECONDS.observe(seconds, call=call)
+    if tokens:
+        LLM_TOKENS.inc(tokens, call=call)
+        LLM_TOKENS_S.observe(tokens / ((decode_ms or 0) / 1000.0 or seconds), call=call)
+
+class LLM(Reloadable):
+    def __init__(self, model_path:str, system_prompt: str | None = None, draft_path: str | None = None,
+                 speculative: str = SPECULATIVE_LLM):
         self.system = system_prompt or GENERAL_SYSTEM_PROMPT
         self._llm = None
-        self._lock = threading.Lock()
+        self._lock = threading.RLock()
 
         # Defaults sensatos (CPU-only). Ajusta por env si quieres.
         self.model_path = model_path
@@ -22,10 +58,29 @@ class LLM:
         self.n_batch = N_BACH_LLM   # 256–512 bien en CPU
         self.n_gpu_layers = GPU_LAYERS_LLM  # 0 si no hay CUDA
         self.chat_format = CHAT_FORMAT_LLM.strip()
+        self.speculative = speculative   # "off", "prompt_lookup" o "draft"
+        self.draft_path = draft_path
+        self.draft_stats: DraftStats | None = None
+        self.last_usage: Dict[str, int] = {}
+        self.sessions = SessionStore() if USE_SESSION_MEMORY else None
+        size_mb = os.path.getsize(model_path) / 2**20 if os.path.exists(model_path) else 0.0
+        self._init_reloadable("llm", size_mb, self._lock)
+
+    def engines(self):
+        """ Reloadable engines behind this client, for the memory manager """
+        return [self]
+
+    def _is_loaded(self) -> bool:
+        return self._llm is not None
+
+    def _unload(self):
+        self._llm.close()
+        self._llm = None
+        self.draft_stats = None
 
-    def ensure(self):
-        """ Initialize the LLM instance if not already done """
-        if self._llm is None and USE_LLM:
+    def _load(self):
+        """ Initialize the LLM instance (ensure() calls it only if not already done) """
+        if USE_LLM:
             if not os.path.exists(self.model_path):
                 raise FileNotFoundError(f"Modelo no encontrado: {self.model_path}")
             kwargs = dict(
@@ -40,29 +95,52 @@ class LLM:
             )
             if self.chat_format:
                 kwargs["chat_format"] = self.chat_format
+            draft = make_draft_model(self.speculative, self.draft_path)
+            if draft is not None:
+                self.draft_stats = DraftStats(draft)
+                kwargs["draft_model"] = self.draft_stats
             self._llm = Llama(**kwargs)
 
     def answer_general(self, user_prompt: str) -> str:
-        """ Answer a general question with the LLM """
-        self.ensure()
+        """ Answer a general question with the LLM, inside the current conversation if session memory is on """
+        session_id = CURRENT_SESSION.get()
+        if self.sessions is not None and session_id is not None:
+            with TRACER.span("llm.general", session=session_id, cold=not self.loaded) as sp, self.using():
+                session = self.sessions.get(session_id)
+                answer = session.ask(self._llm, user_prompt)
+                st = session.stats[-1]
+                decode_ms = round(st["total_ms"] - st["prompt_ms"], 1)
+                sp.set(prompt_eval_ms=st["prompt_ms"], prompt_eval_tokens=st["eval_tokens"],
+                       decode_ms=decode_ms, decode_tokens=st["answer_tokens"])
+                observe_generation("general", st["total_ms"] / 1000.0, st["answer_tokens"], decode_ms)
+            return answer or "No tengo una respuesta."
         general_system = GENERAL_SYSTEM_PROMPT
         messages = [
             {"role": "system", "content": general_system},
             {"role": "user", "content": user_prompt},
         ]
-        with self._lock:
+        with TRACER.span("llm.general", cold=not self.loaded) as sp, self.using():
+            perf_reset(self._llm)
+            t0 = time.perf_counter()
             out = self._llm.create_chat_completion(
                 messages=messages,
                 temperature=0.2,
                 top_p=0.9,
                 max_tokens=100,
             )
+            elapsed = time.perf_counter() - t0
+            self.last_usage = out.get("usage") or {}
+            split = perf_split(self._llm)
+            sp.set(prompt_tokens=self.last_usage.get("prompt_tokens"), completion_tokens=self.last_usage.get("completion_tokens"),
+                   **split)
+            observe_generation("general", elapsed, self.last_usage.get("completion_tokens"), split.get("decode_ms"))
+            if self.draft_stats is not None:
+                self.draft_stats.end(self.last_usage.get("total_tokens", 0))
         msg = out["choices"][0]["message"]
         return (msg.get("content") or "").strip() or "No tengo una respuesta."
     
     def plan_motion(self, user_prompt: str) -> Optional[Dict[str, Any]]:
         """ Given a user prompt, return a dict with 'yaw' (radians) and 'distance' (meters), or None if not understood """
-        self.ensure()
         system = NAVIGATE_SYSTEM_PROMPT
         
         messages = [
@@ -85,7 +163,9 @@ class LLM:
                 }
             }
         }]
-        with self._lock:
+        with TRACER.span("llm.motion", cold=not self.loaded) as sp, self.using():
+            perf_reset(self._llm)
+            t0 = time.perf_counter()
             out = self._llm.create_chat_completion(
                 messages=messages,
                 tools=tools,
@@ -94,6 +174,12 @@ class LLM:
                 top_p=0.8,
                 max_tokens=64,
             )
+            elapsed = time.perf_counter() - t0
+            usage = out.get("usage") or {}
+            split = perf_split(self._llm)
+            sp.set(prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+                   **split)
+            observe_generation("motion", elapsed, usage.get("completion_tokens"), split.get("decode_ms"))
         msg = out["choices"][0]["message"]
 
         # llama.cpp puede devolver tool_calls o function_call
@@ -1,5 +1,7 @@
 import json
-from typing import List, Dict, Any
+import math
+from typing import List, Dict, Any, Iterable, Tuple
+import numpy as np
 from difflib import SequenceMatcher
 from dataclasses import dataclass 
 from rapidfuzz import fuzz as rf_fuzz
@@ -7,7 +9,8 @@ HAS_RF = True
 
 
 from config.settings import FUZZY_LOGIC_ACCURACY_GENERAL_RAG, FUZZY_LOGIC_ACCURACY_POSE
-from llm.llm_intentions import norm_text, extract_place_query
+from llm.llm_intentions import norm_text, utterance, invalidate_caches
+from llm.llm_places import PlaceMatcher
 
 @dataclass
 class Battery:
@@ -25,6 +28,8 @@ class Pose:
 class GENERAL_RAG:
     def __init__(self, path: str):
         self.items: List[Dict[str,str]] = []
+        self.version = 0 #bumped on every load, part of the action plan cache key
+        self.semantic = None #optional SemanticRAG tier (llm/llm_semantic.py)
         self.load(path)
     
     def load(self, path: str) -> None:
@@ -56,12 +61,15 @@ class GENERAL_RAG:
         except Exception as e:
             self.items = []
             print("[llm_data] No se pudo abrir", flush=True)
+        self.version += 1
+        invalidate_caches()
     
-    def lookup(self, query: str) -> Dict[str, Any]:
-        """ Simple exact or fuzzy match in the GENERAL_RAG. Returns dict with 'answer' and 'score' (0.0–1.0) """
+    def lookup(self, query: str, semantic: bool = True) -> Dict[str, Any]:
+        """ Simple exact or fuzzy match in the GENERAL_RAG. Returns dict with 'answer' and 'score' (0.0–1.0)
+            On a fuzzy miss the semantic tier (an embedding pass) is tried only if `semantic` """
         if not self.items:
             return {"error":"general_rag_vacia","answer":"","score":FUZZY_LOGIC_ACCURACY_GENERAL_RAG}
-        query = norm_text(query, False)
+        query = utterance(query).plain
         best, best_s = None, 0.0
 
         for item in self.items:
@@ -73,12 +81,116 @@ class GENERAL_RAG:
         print(f"[llm_data] GENERAL_RAG lookup '{query}' -> '{best.get('a','') if best else ''}' ({best_s})", flush=True)
         if best and best_s >= FUZZY_LOGIC_ACCURACY_GENERAL_RAG:
             return {"answer": best.get('a',''), "score": round(best_s,3)}
+        if semantic and self.semantic is not None and query:
+            hit = self.semantic.lookup(query)
+            if hit:
+                print(f"[llm_data] GENERAL_RAG semantic '{query}' -> '{hit['answer']}' ({hit['score']})", flush=True)
+                return hit
         return {"answer":"","score": round(best_s,3)}
 
+    def attach_semantic(self, tier) -> None:
+        """ Use a SemanticRAG as second tier of lookup() (the memoized plans are dropped) """
+        self.semantic = tier
+        self.version += 1
+        invalidate_caches()
+
+
+class _FrameGrid:
+    """ Uniform grid over the poses of one frame: points sorted by cell key (col * n_rows + row),
+        so every column of a query box is one contiguous slice found with searchsorted """
+
+    def __init__(self, poses: List[Pose], cell: float | None = None):
+        self.poses = poses
+        self.xy = np.array([(p.x, p.y) for p in poses], dtype=np.float64).reshape(-1, 2)
+        self.lo = self.xy.min(axis=0)
+        span = np.maximum(self.xy.max(axis=0) - self.lo, 1e-6)
+        #~2 points per cell on average
+        self.cell = float(cell or max(math.sqrt(span[0] * span[1] * 2.0 / len(poses)), 1e-3))
+        self.n_cols, self.n_rows = (span // self.cell).astype(np.int64) + 1
+        cells = self._cells(self.xy)
+        keys = cells[:, 0] * self.n_rows + cells[:, 1]
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+        self.diag = float(np.hypot(*span))
+
+    def _cells(self, xy: np.ndarray) -> np.ndarray:
+        return np.clip(((xy - self.lo) // self.cell).astype(np.int64), 0, [self.n_cols - 1, self.n_rows - 1])
+
+    def candidates(self, x: float, y: float, r: float) -> np.ndarray:
+        """ Indices of the points inside the cells covered by the square of half side r around (x, y) """
+        (c0, r0), (c1, r1) = self._cells(np.array([[x - r, y - r], [x + r, y + r]]))
+        cols = np.arange(c0, c1 + 1, dtype=np.int64) * self.n_rows
+        starts = np.searchsorted(self.keys, cols + r0, side="left")
+        ends = np.searchsorted(self.keys, cols + r1, side="right")
+        if len(cols) == 1:
+            return self.order[starts[0]:ends[0]]
+        return self.order[np.concatenate([np.arange(a, b) for a, b in zip(starts, ends) if b > a] or [np.empty(0, np.int64)])]
+
+    def within(self, x: float, y: float, radius: float) -> List[Tuple[float, int]]:
+        idx = self.candidates(x, y, radius)
+        d = np.hypot(self.xy[idx, 0] - x, self.xy[idx, 1] - y)
+        keep = d <= radius
+        idx, d = idx[keep], d[keep]
+        s = np.argsort(d, kind="stable")
+        return list(zip(d[s].tolist(), idx[s].tolist()))
+
+    def nearest(self, x: float, y: float, k: int) -> List[Tuple[float, int]]:
+        k = min(k, len(self.poses))
+        r = self.cell
+        while True:
+            #Past the extent of the map the box holds every point anyway
+            far = r >= self.diag + abs(x - self.lo[0]) + abs(y - self.lo[1])
+            idx = np.arange(len(self.poses)) if far else self.candidates(x, y, r)
+            if len(idx) >= k:
+                d = np.hypot(self.xy[idx, 0] - x, self.xy[idx, 1] - y)
+                part = np.argpartition(d, k - 1)[:k] if k < len(d) else np.arange(len(d))
+                part = part[np.argsort(d[part], kind="stable")]
+                #The box only guarantees points up to distance r, widen it to the k-th distance if needed
+                if far or d[part[-1]] <= r:
+                    return list(zip(d[part].tolist(), idx[part].tolist()))
+                r = float(d[part[-1]])
+            else:
+                r *= 2.0
+
+
+class SpatialIndex:
+    """
+    Nearest-k and radius queries over pose coordinates, one grid per frame_id.
+    Queries only touch the cells around the point, so the cost does not grow with the size of the map.
+    """
+
+    def __init__(self, poses: Iterable[Pose] = (), cell: float | None = None):
+        self.cell = cell
+        self.frames: Dict[str, _FrameGrid] = {}
+        self.build(poses)
+
+    def build(self, poses: Iterable[Pose]) -> None:
+        by_frame: Dict[str, List[Pose]] = {}
+        for p in poses:
+            if p.x is not None and p.y is not None:
+                by_frame.setdefault(p.frame_id, []).append(p)
+        self.frames = {f: _FrameGrid(lst, self.cell) for f, lst in by_frame.items()}
+
+    def nearest(self, x: float, y: float, frame_id: str = "map", k: int = 1) -> List[Tuple[float, Pose]]:
+        """ The k closest poses to (x, y) as [(distance, Pose)], closest first """
+        grid = self.frames.get(frame_id)
+        if grid is None or k <= 0:
+            return []
+        return [(d, grid.poses[i]) for d, i in grid.nearest(float(x), float(y), k)]
+
+    def within(self, x: float, y: float, radius: float, frame_id: str = "map") -> List[Tuple[float, Pose]]:
+        """ Every pose at most `radius` from (x, y) as [(distance, Pose)], closest first """
+        grid = self.frames.get(frame_id)
+        if grid is None or radius < 0:
+            return []
+        return [(d, grid.poses[i]) for d, i in grid.within(float(x), float(y), float(radius))]
+
 
 class PosesIndex:
     def __init__(self, path: str):
         self.by_key: Dict[str,Pose] = {}
+        self.spatial = SpatialIndex()
+        self.matcher = PlaceMatcher([])
         self.load(path)
 
     def load(self, path: str):
@@ -88,7 +200,7 @@ class PosesIndex:
             with open(path,'r',encoding='utf-8') as f:
                 data = json.load(f)
             for p in data.get('poses', []):
-                pose = Pose(x=p.get('x'), y=p.get('y'), yaw=p.get('yaw_deg',0.0), frame_id=p.get('frame','map'), name=p.get('name',''))
+                pose = Pose(x=p.get('x'), y=p.get('y'), yaw=p.get('yaw_deg', p.get('yaw',0.0)), frame_id=p.get('frame', p.get('frame_id','map')), name=p.get('name',''))
                 keys = [p.get('name','')] + p.get('aliases',[])
                 for k in keys:
                     nk = norm_text(k, True)
@@ -97,21 +209,61 @@ class PosesIndex:
         except Exception:
             self.by_key = {}
             print("[llm_data] No se pudo cargar las poses", flush=True)
+        self.spatial.build({id(p): p for p in self.by_key.values()}.values())
+        self.matcher = PlaceMatcher(list(self.by_key), FUZZY_LOGIC_ACCURACY_POSE)
+        invalidate_caches()
 
     def lookup(self, name: str) -> Dict[str,Any]:
-        """ Exact or fuzzy match of a place name to a Pose. Returns the Pose as dict, or {'error':'no_encontrado'} """
-        key = norm_text(extract_place_query(name) or name, True)
+        """ Exact, phonetic or fuzzy match of a place name to a Pose (see PlaceMatcher). Returns the Pose as dict, or {'error':'no_encontrado'} """
+        u = utterance(name)
+        key = u.place or u.clean
         #print(f"[llm_tools] {self.by_key}", flush=True)
         if key in self.by_key:
             p = self.by_key[key]
             #print(f"[llm_tools] {p}", flush=True)
             return p.__dict__
-        # fuzzy simple
-        best_k, best_s = None, 0.0
-        for k in self.by_key.keys():
-            s = (rf_fuzz.ratio(key,k)/100.0) if HAS_RF else SequenceMatcher(None, key, k).ratio()
-        if s > best_s:
-            best_k, best_s = k, s
-        if best_k and best_s >= FUZZY_LOGIC_ACCURACY_POSE:
-            return {**self.by_key[best_k].__dict__, "note":"fuzzy"}
-        return {"error":"no_encontrado"}
\ No newline at end of file
+        # spaceless / phonetic / batched fuzzy over every alias
+        hit = self.matcher.match(key)
+        if hit:
+            best_k, best_s, how = hit
+            return {**self.by_key[best_k].__dict__, "note": "fuzzy" if how == "fuzzy" else "phonetic", "score": round(best_s,3)}
+        return {"error":"no_encontrado"}
+
+    def nearest(self, x: float, y: float, frame_id: str = "map", k: int = 1) -> List[Tuple[float, Pose]]:
+        """ The k places closest to (x, y) in frame_id, as [(distance, Pose)] """
+        return self.spatial.nearest(x, y, frame_id, k)
+
+    def within(self, x: float, y: float, radius: float, frame_id: str = "map") -> List[Tuple[float, Pose]]:
+        """ The places at most `radius` meters from (x, y) in frame_id, as [(distance, Pose)] """
+        return self.spatial.within(x, y, radius, frame_id)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Benchmark: grid index vs a linear scan on a large labeled map
+    import time
+    rng = np.random.default_rng(0)
+    n, queries = 50_000, 2_000
+    poses = [Pose(x=float(x), y=float(y), frame_id=f"piso_{i % 2}", name=f"lugar {i}")
+             for i, (x, y) in enumerate(rng.uniform(0.0, 500.0, size=(n, 2)))]
+    t0 = time.perf_counter()
+    index = SpatialIndex(poses)
+    print(f"{n} poses, 2 frames: índice construido en {1000.0 * (time.perf_counter() - t0):.1f} ms")
+
+    q = rng.uniform(-20.0, 520.0, size=(queries, 2))
+    xy0 = np.array([(p.x, p.y) for p in poses if p.frame_id == "piso_0"])
+
+    def brute(x, y, k):
+        d = np.hypot(xy0[:, 0] - x, xy0[:, 1] - y)
+        return np.sort(d)[:k]
+
+    for label, fn in (("k=5 índice", lambda x, y: index.nearest(x, y, "piso_0", 5)),
+                      ("k=5 lineal", lambda x, y: brute(x, y, 5)),
+                      ("r=5 m índice", lambda x, y: index.within(x, y, 5.0, "piso_0"))):
+        t0 = time.perf_counter()
+        for x, y in q:
+            fn(x, y)
+        print(f"{label:13s} {1e6 * (time.perf_counter() - t0) / queries:8.1f} µs/consulta")
+
+    ok = all(np.allclose([d for d, _ in index.nearest(x, y, "piso_0", 5)], brute(x, y, 5)) for x, y in q[:200])
+    print(f"Mismos vecinos que la búsqueda lineal: {ok} ✅")
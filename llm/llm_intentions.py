@@ -1,12 +1,18 @@
 import re
+import threading
 import unicodedata
-from typing import List, Dict, Any, Optional, Iterable
-from config.settings import FUZZY_LOGIC_ACCURACY_GENERAL_RAG
+from collections import OrderedDict
+from functools import cached_property, lru_cache
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from config.settings import FUZZY_LOGIC_ACCURACY_GENERAL_RAG, NORM_CACHE_SIZE, PLAN_CACHE_SIZE
+from .llm_matcher import IntentMatcher
+from utils.metrics import collect_cache
 from .llm_patterns import (COURTESY_RE, NEXOS_RE, SPLIT_RE, INTENT_RES, INTENT_PRIORITY, INTENT_ROUTING, 
                            BEST_CONNECTOR_RE, MOVE_PREFIX_RE, TAIL_NEXOS_TRIM_RE, ARTICLE_PREFIX_RE)
 
+@lru_cache(maxsize=NORM_CACHE_SIZE)
 def norm_text(s: str, courtesy_flag: bool) -> str:
-    """ Normalize text for matching:
+    """ Normalize text for matching (memoized, spoken commands repeat a lot):
     - lowercase
     - remove accents
     - remove punctuation (keep spaces)
@@ -19,10 +25,8 @@ def norm_text(s: str, courtesy_flag: bool) -> str:
         s = COURTESY_RE.sub(' ', s)
     return re.sub(r'\s+',' ', s).strip()
 
-def extract_place_query(t: str) -> str:
-    """ From a text with a navigation intent, extract the place name or description.
-    E.g. "ve a la cocina y luego para en el salón" -> "cocina" """
-    t = norm_text(t, True)
+def _place_from_clean(t: str) -> str:
+    """ extract_place_query over an already normalized (courtesy stripped) text """
     # quita prefijo al inicio (ve/dirígete/dónde queda/etc.)
     t = MOVE_PREFIX_RE.sub('', t, count=1).strip()
 
@@ -38,53 +42,171 @@ def extract_place_query(t: str) -> str:
 
     return place
 
+class Utterance(str):
+    """
+    One user utterance parsed once: it is still the original `str` (so it can go anywhere a text goes,
+    e.g. the LLM prompt), plus the forms every stage of the pipeline needs, computed on first use:
+    - plain: norm_text(text, False)     - clean: norm_text(text, True)
+    - tokens: words of clean            - place: extract_place_query(text)
+    - clauses: the clauses of clean (SPLIT_RE), as already normalized Utterances
+    Functions of llm_data/llm_tools/llm_intentions accept either a str or an Utterance.
+    """
+
+    @classmethod
+    def normalized(cls, clean: str) -> "Utterance":
+        """ Utterance of a text that is already normalized (e.g. a clause), skipping norm_text """
+        u = cls(clean)
+        u.__dict__.update(plain=clean, clean=clean)
+        return u
+
+    @cached_property
+    def plain(self) -> str:
+        return norm_text(self, False)
+
+    @cached_property
+    def clean(self) -> str:
+        #Same as norm_text(self, True) but reusing the accent/punctuation pass of `plain`
+        return re.sub(r'\s+', ' ', COURTESY_RE.sub(' ', self.plain)).strip()
+
+    @cached_property
+    def tokens(self) -> Tuple[str, ...]:
+        return tuple(self.clean.split())
+
+    @cached_property
+    def place(self) -> str:
+        return _place_from_clean(self.clean)
+
+    @cached_property
+    def clauses(self) -> Tuple["Utterance", ...]:
+        parts = SPLIT_RE.split(self.clean)
+        return tuple(Utterance.normalized(p.strip()) for p in parts if p and p.strip() and not NEXOS_RE.fullmatch(p.strip()))
+
+def utterance(text: str) -> Utterance:
+    """ The Utterance of a text, parsing it only if it is not one already """
+    return text if isinstance(text, Utterance) else Utterance(text)
+
+def extract_place_query(t: str) -> str:
+    """ From a text with a navigation intent, extract the place name or description.
+    E.g. "ve a la cocina y luego para en el salón" -> "cocina" """
+    return utterance(t).place
+
 def best_hit(res) -> Dict[str, Any]:
     """ From the result of general_rag.lookup (dict or list of dicts), return the best one (highest score)"""
     if isinstance(res, list) and res:
         return max((x for x in res if isinstance(x, dict)), key=lambda x: x.get('score', 0.0), default={})
     return res if isinstance(res, dict) else {}
 
+_MATCHERS: Dict[Tuple[str, ...], IntentMatcher] = {}
+
 def detect_intent(t: str, order: Optional[Iterable[str]] = None, normalizer=None) -> Optional[str]:
-    """ From a text, detect the intent by matching regexes in order.
+    """ From a text, detect the intent by matching regexes in order (one IntentMatcher scan per text).
     If 'order' is given, use that order (otherwise use INTENT_PRIORITY).
     If 'normalizer' is given, use it to normalize the text before matching (otherwise use norm_text).
     Return the name of the first matching intent, or None if no match. """
-    nt = normalizer(t, True) if normalizer else t
-    for name in (order or INTENT_PRIORITY):
-        rex = INTENT_RES.get(name)
-        if rex and rex.search(nt):
-            return name
-    return None
-
-def split_and_prioritize(text: str, general_rag) -> List[Dict[str, Any]]:
+    if isinstance(t, Utterance):
+        nt = t.clean
+    else:
+        nt = normalizer(t, True) if normalizer else t
+    key = tuple(order or INTENT_PRIORITY)
+    matcher = _MATCHERS.get(key)
+    if matcher is None:
+        matcher = _MATCHERS[key] = IntentMatcher(INTENT_RES, key)
+    return matcher.detect(nt)
+
+class PlanCache:
+    """
+    Bounded LRU of action plans keyed on the normalized utterance (+ the GENERAL_RAG instance and version).
+    Cleared by GENERAL_RAG/PosesIndex when their data is (re)loaded.
+    """
+
+    def __init__(self, max_entries: int = PLAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries: OrderedDict[Any, List[Tuple[str, str, Dict[str, Any]]]] = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> Optional[List[Dict[str, Any]]]:
+        with self.lock:
+            plan = self.entries.get(key)
+            if plan is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return [{"kind": k, "params": dict(p)} for k, p in plan]
+
+    def put(self, key, plan: List[Dict[str, Any]]) -> None:
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[key] = [(a["kind"], dict(a["params"])) for a in plan]
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+PLAN_CACHE = PlanCache()
+
+def invalidate_caches() -> None:
+    """ Forget the memoized action plans (call it when the RAG or poses data change) """
+    PLAN_CACHE.clear()
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """ Hit-rate stats of the norm_text and action plan caches """
+    info = norm_text.cache_info()
+    total = info.hits + info.misses
+    return {"norm_text": {"entries": info.currsize, "hits": info.hits, "misses": info.misses,
+                          "hit_rate": round(info.hits / total, 3) if total else 0.0},
+            "plan": PLAN_CACHE.stats()}
+
+collect_cache("norm_text", lambda: cache_stats()["norm_text"])
+collect_cache("plan", PLAN_CACHE.stats)
+
+def split_and_prioritize(text: str | Utterance, general_rag) -> List[Dict[str, Any]]:
     """
     From a text, split it into clauses (by connectors) and classify each clause
     into an action type: "battery", "pose", "navigate", "general", or
-    "rag" (if a high-confidence GENERAL_RAG answer is found).
+    "rag" (if a high-confidence GENERAL_RAG answer is found). Intents about the robot itself
+    (over_rag: battery, pose, nearby, maps) are checked before GENERAL_RAG.
     Return a list of actions with parameters, prioritizing short answers first.
+    The 'data' of each action is the clause as an (already normalized) Utterance.
+    Plans are memoized in PLAN_CACHE, so a repeated command skips the RAG lookups and intent detection.
 
     E.g. "Por favor ve a la cocina y luego dime tu batería" ->
     [{"kind": "battery", "params": {}},
      {"kind": "navigate", "params": {"data": "ve a la cocina"}}]    
     """
-    t = norm_text(text, True)
-
-    parts = SPLIT_RE.split(t)
-    clauses = [p.strip() for p in parts if p and not NEXOS_RE.fullmatch(p.strip())]
+    u = utterance(text)
+    key = (u.clean or "\0" + u.plain, id(general_rag), getattr(general_rag, "version", 0))
+    plan = PLAN_CACHE.get(key)
+    if plan is not None:
+        return plan
+    clauses = list(u.clauses)
 
     if not clauses:
-        clauses.append(norm_text(text, False))
+        clauses.append(Utterance(u.plain))
 
     accions = []
     for c in clauses:
         print(c, flush=True)
-        # 1) Respuestas cortas por GENERAL_RAG si hay alta confianza
-        var = best_hit(general_rag.lookup(c))
-        if var.get('answer') and var.get('score', 0.0) >= FUZZY_LOGIC_ACCURACY_GENERAL_RAG:
-            accions.append(("first", "rag", {"data": var['answer'].strip()}))
-            continue
-        intent = detect_intent(c, order=INTENT_PRIORITY, normalizer=norm_text)
+        intent = detect_intent(c, order=INTENT_PRIORITY)
         spec = INTENT_ROUTING.get(intent)
+        # 1) Respuestas cortas por GENERAL_RAG si hay alta confianza (salvo preguntas sobre el propio robot);
+        #    el nivel semántico (un embedding) solo para lo que iría al LLM, una orden no lo paga
+        if not (spec and spec.get("over_rag")):
+            var = best_hit(general_rag.lookup(c, semantic=spec is None))
+            if var.get('answer') and (var.get('note') == 'semantic' or var.get('score', 0.0) >= FUZZY_LOGIC_ACCURACY_GENERAL_RAG):
+                accions.append(("first", "rag", {"data": var['answer'].strip()}))
+                continue
 
         if spec:
             params = {"data": c} if spec.get("need_user_input") else {}
@@ -96,4 +218,80 @@ def split_and_prioritize(text: str, general_rag) -> List[Dict[str, Any]]:
     print(clauses, flush=True)
     print(accions, flush=True)
     accions.sort(key=lambda x: 0 if x[0] == "first" else 1)
-    return [{"kind": k, "params": p} for _, k, p in accions]
\ No newline at end of file
+    plan = [{"kind": k, "params": p} for _, k, p in accions]
+    PLAN_CACHE.put(key, plan)
+    return plan
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Micro-benchmark: classification cost per utterance when every stage gets a plain str (and normalizes it
+    # again) vs when the parsed Utterance is threaded through
+    import contextlib, io, os, time
+    import llm.llm_intentions as intentions #the copy llm_data uses, not this __main__ one
+    from llm.llm_intentions import split_and_prioritize, Utterance, utterance
+    from config.settings import PATH_GENERAL_RAG, PATH_POSES
+    from llm.llm_data import GENERAL_RAG, PosesIndex
+    from llm.llm_patterns import ORIENT_INTENT_RE, MAPS_COUNT_RE
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag = GENERAL_RAG(os.path.expanduser(PATH_GENERAL_RAG))
+        poses = PosesIndex(os.path.expanduser(PATH_POSES))
+    corpus = ["Por favor ve a la enfermería y luego dime tu batería", "¿Dónde queda la cocina?",
+              "Oye robot, ¿cuántos mapas tenemos?", "Gracias, avanza hacia la recepción y después gira a la derecha",
+              "¿Cuándo fue la Independencia de México y cuál es mi batería?", "cancela la navegación por favor"]
+
+    cached_norm_text = intentions.norm_text
+    intentions.PLAN_CACHE.max_entries = 0 #measure the pipeline itself, the caches are measured below
+    calls = 0
+    def counted(s, courtesy_flag, _norm=cached_norm_text.__wrapped__):
+        global calls
+        calls += 1
+        return _norm(s, courtesy_flag)
+    intentions.norm_text = counted
+
+    def pipeline(text, as_str: bool):
+        for action in split_and_prioritize(str(text) if as_str else Utterance(text), rag):
+            data = action["params"].get("data")
+            data = str(data) if as_str and data is not None else data
+            if action["kind"] == "navigate":
+                poses.lookup(data)
+                ORIENT_INTENT_RE.findall(utterance(data).clean)
+            elif action["kind"] == "maps":
+                MAPS_COUNT_RE.findall(utterance(data).clean)
+
+    for label, as_str in (("str por etapa", True), ("Utterance", False)):
+        calls, n = 0, 200
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for _ in range(n):
+                for text in corpus:
+                    pipeline(text, as_str)
+            dt = time.perf_counter() - t0
+        print(f"{label:14s} {1e6 * dt / (n * len(corpus)):7.1f} µs/enunciado, "
+              f"norm_text {calls / (n * len(corpus)):.1f} veces/enunciado")
+
+    # Repeated spoken commands (Zipf-like): memoized norm_text + action plans vs recomputing every turn
+    import random
+    rng = random.Random(0)
+    commands = corpus + ["ve a la enfermería", "¿cuál es tu batería?", "¿Dónde estoy?", "ve a la cocina por favor",
+                         "¿qué hay cerca?", "gira a la derecha", "avanza un metro", "¿quién eres?"]
+    turns = rng.choices(commands, weights=[1.0 / (i + 1) for i in range(len(commands))], k=2_000)
+    for label, cached in (("sin memoización", False), ("con memoización", True)):
+        intentions.norm_text = cached_norm_text if cached else cached_norm_text.__wrapped__
+        intentions.PLAN_CACHE.max_entries = PLAN_CACHE_SIZE if cached else 0
+        intentions.invalidate_caches()
+        intentions.PLAN_CACHE.hits = intentions.PLAN_CACHE.misses = 0
+        cached_norm_text.cache_clear()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            for text in turns:
+                split_and_prioritize(Utterance(text), rag)
+            dt = time.perf_counter() - t0
+        print(f"{label:16s} {1e6 * dt / len(turns):7.1f} µs/turno")
+    print(f"Estadísticas: {intentions.cache_stats()}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag.load(os.path.expanduser(PATH_GENERAL_RAG))
+        before = intentions.PLAN_CACHE.misses
+        split_and_prioritize(Utterance(turns[0]), rag)
+    print(f"Tras recargar GENERAL_RAG el plan se recalcula: {intentions.PLAN_CACHE.misses == before + 1} ✅")
@@ -0,0 +1,144 @@
+from __future__ import annotations
+from typing import List, Optional
+import json, logging, threading, time
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import MAPS_BACKEND_URL, MAPS_TIMEOUT_S, MAPS_CACHE_TTL_S, MAPS_REFRESH_S
+
+
+MAX_BACKOFF_S = 600.0 #Longest wait of the refresh thread between attempts while the backend is down
+
+
+class MapsClient:
+    """
+    Client of the maps backend that answers from memory:
+    - One pooled keep-alive `requests.Session` instead of a new connection per request.
+    - The map list is cached for `ttl` seconds; after that the stale list is still served
+      while a background fetch revalidates it (stale-while-revalidate).
+    - Optionally a daemon thread refreshes the list every `refresh` seconds, so the cache is always warm
+      (backing off up to MAX_BACKOFF_S while the backend is down).
+    Only the very first call (nothing cached yet) waits on the network.
+    """
+
+    def __init__(self, url: str = MAPS_BACKEND_URL, timeout: float = MAPS_TIMEOUT_S,
+                 ttl: float = MAPS_CACHE_TTL_S, refresh: float | None = MAPS_REFRESH_S):
+        self.log = logging.getLogger("Maps")
+        self.url = url
+        self.timeout = timeout
+        self.ttl = ttl
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=2))
+
+        self._maps: Optional[List[str]] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = threading.Event()
+        self._stop = threading.Event()
+        if refresh:
+            threading.Thread(target=self._refresh_loop, args=(refresh,), name="MapsRefresh", daemon=True).start()
+
+    def fetch(self) -> Optional[List[str]]:
+        """ Ask the backend for the maps, return the list of names or None if it failed """
+        try:
+            response = self.session.get(self.url, timeout=self.timeout)
+            if not response.ok:
+                self.log.warning(f"Servidor de mapas respondió {response.status_code}")
+                return None
+            response_body = response.json()
+        except (requests.exceptions.RequestException, ValueError) as ex:
+            self.log.warning(f"Servidor de mapas NO disponible. {ex}")
+            return None
+
+        # Check if the 'data' key exists and is a list
+        if not isinstance(response_body, dict) or not isinstance(response_body.get('data'), list):
+            self.log.warning("Error: 'data' key not found or not a list in the response.")
+            return None
+        maps = [item.get('name') for item in response_body['data'] if isinstance(item, dict) and 'name' in item]
+        with self._lock:
+            self._maps, self._fetched_at = maps, time.monotonic()
+        return maps
+
+    def _revalidate(self) -> None:
+        try:
+            self.fetch()
+        finally:
+            self._refreshing.clear()
+
+    def _revalidate_async(self) -> None:
+        if not self._refreshing.is_set():
+            self._refreshing.set()
+            threading.Thread(target=self._revalidate, name="MapsRevalidate", daemon=True).start()
+
+    def _refresh_loop(self, every: float) -> None:
+        wait = every
+        while not self._stop.is_set():
+            wait = every if self.fetch() is not None else min(2.0 * wait, MAX_BACKOFF_S)
+            self._stop.wait(wait)
+
+    def get_maps(self) -> List[str]:
+        """ Return the cached maps (revalidating in background when stale), fetching only if nothing is cached """
+        with self._lock:
+            maps, age = self._maps, time.monotonic() - self._fetched_at
+        if maps is None:
+            return self.fetch() or []
+        if age > self.ttl:
+            self._revalidate_async()
+        return list(maps)
+
+    def invalidate(self) -> None:
+        """ Force the next get_maps() to revalidate (e.g. after a map was uploaded) """
+        with self._lock:
+            self._fetched_at = 0.0
+
+    def close(self) -> None:
+        self._stop.set()
+        self.session.close()
+
+
+def serve_stub_maps(maps: List[str], host: str = "127.0.0.1", port: int = 0, delay: float = 0.0):
+    """ Local stand-in of the maps backend (GET /maps/maps), runs in a daemon thread. Returns (server, url) """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" #keep-alive
+        hits = 0
+
+        def do_GET(self):
+            Handler.hits += 1
+            time.sleep(delay)
+            body = json.dumps({"data": [{"name": m} for m in maps]}).encode("utf-8")
+            self.send_response(200 if self.path == "/maps/maps" else 404)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.hits = lambda: Handler.hits
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/maps/maps"
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+
+    server, url = serve_stub_maps(["planta baja", "primer piso", "estacionamiento"], delay=0.05)
+    client = MapsClient(url=url, ttl=0.5, refresh=None)
+
+    for label in ("primera (red)", "cache", "cache"):
+        t0 = time.perf_counter()
+        maps = client.get_maps()
+        print(f"{label:14s} {1000.0 * (time.perf_counter() - t0):7.2f} ms -> {maps}")
+    time.sleep(0.6)
+    t0 = time.perf_counter()
+    client.get_maps()
+    print(f"{'stale (SWR)':14s} {1000.0 * (time.perf_counter() - t0):7.2f} ms, revalidando en segundo plano")
+    time.sleep(0.2)
+    print(f"Peticiones al backend: {server.hits()} ✅")
+    server.shutdown()
@@ -0,0 +1,189 @@
+from __future__ import annotations
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import re
+
+try:
+    from re import _parser as sre_parse, _constants as sre_c #Python 3.11+
+except ImportError:
+    import sre_parse, sre_constants as sre_c
+
+_ANY = "\0" #any character (class, category, dot...)
+_WORD_START_RE = re.compile(r"\b\w{1,4}") #first chars of every word
+
+class _Unknown(Exception):
+    pass
+
+def _concat(a: Set[str], b: Set[str], k: int) -> Set[str]:
+    out = set()
+    for x in a:
+        if len(x) >= k:
+            out.add(x[:k])
+        else:
+            out.update((x + y)[:k] for y in b)
+    return out
+
+def _first_seq(items, ic: bool, k: int) -> Set[str]:
+    res = {""}
+    for op, av in items:
+        res = _concat(res, _first_node(op, av, ic, k), k)
+        if all(len(s) >= k for s in res):
+            break
+    return res
+
+def _first_node(op, av, ic: bool, k: int) -> Set[str]:
+    if op is sre_c.LITERAL:
+        c = chr(av)
+        return {c.lower() if ic else c}
+    if op is sre_c.IN:
+        out = set()
+        for o, a in av:
+            if o is sre_c.LITERAL:
+                out.add(chr(a).lower() if ic else chr(a))
+            elif o is sre_c.RANGE and a[1] - a[0] <= 64:
+                out.update(chr(x).lower() if ic else chr(x) for x in range(a[0], a[1] + 1))
+            else:
+                return {_ANY}
+        return out
+    if op in (sre_c.ANY, sre_c.NOT_LITERAL):
+        return {_ANY}
+    if op in (sre_c.AT, sre_c.ASSERT, sre_c.ASSERT_NOT):
+        return {""} #zero width, ignoring a lookaround only makes the set larger
+    if op is sre_c.SUBPATTERN:
+        _, add_flags, del_flags, sub = av
+        return _first_seq(sub, (ic or bool(add_flags & re.I)) and not del_flags & re.I, k)
+    if op is getattr(sre_c, "ATOMIC_GROUP", None):
+        return _first_seq(av, ic, k)
+    if op is sre_c.BRANCH:
+        out = set()
+        for alt in av[1]:
+            out |= _first_seq(alt, ic, k)
+        return out
+    if op in (sre_c.MAX_REPEAT, sre_c.MIN_REPEAT, getattr(sre_c, "POSSESSIVE_REPEAT", None)):
+        lo, hi, sub = av
+        f, cur, out = _first_seq(sub, ic, k), {""}, set()
+        for i in range(k + 1):
+            if i >= lo:
+                out |= cur
+            if i >= hi:
+                break
+            cur = _concat(cur, f, k)
+        return out | {s for s in cur if len(s) >= k}
+    if op is sre_c.GROUPREF:
+        return {"", _ANY}
+    raise _Unknown(op)
+
+def word_prefixes(rex: re.Pattern, k: int = 4) -> Optional[Set[str]]:
+    """
+    Prefixes (up to k word chars, lowercase) that the word where a match of `rex` starts must have,
+    derived from the parsed pattern. None if they can't be used as a filter: the pattern may start
+    outside a word boundary, is case sensitive, or can start with any character.
+    """
+    if not rex.flags & re.I:
+        return None
+    try:
+        items = list(sre_parse.parse(rex.pattern, rex.flags))
+        if not items or items[0][0] is not sre_c.AT or items[0][1] is not sre_c.AT_BOUNDARY:
+            return None
+        prefixes = {s.split(_ANY)[0] for s in _first_seq(items, True, k)}
+    except (_Unknown, re.error, ValueError):
+        return None
+    if any(not re.fullmatch(r"\w+", p) for p in prefixes):
+        return None
+    return prefixes
+
+
+class IntentMatcher:
+    """
+    Intent detection in a single scan of the text instead of one full regex search per intent:
+    - When built, the first chars (up to 4) that each intent regex can match are derived from the
+      parsed pattern and indexed in one dict {prefix: bitmask of intents}.
+    - To classify, the first chars of every word are looked up in that dict, and only the candidate
+      intents are confirmed with their own regex, in priority order.
+    The result is always the same as trying every regex in priority order (see `python -m llm.llm_matcher`).
+    """
+
+    def __init__(self, res: Dict[str, re.Pattern], priority: Iterable[str], k: int = 4):
+        self.order = [name for name in priority if name in res]
+        self.res = [res[name] for name in self.order]
+        self.always = 0 #intents that can't be prefiltered, always confirmed
+        self.index: Dict[str, int] = {}
+        for i, rex in enumerate(self.res):
+            prefixes = word_prefixes(rex, k)
+            if prefixes is None:
+                self.always |= 1 << i
+                continue
+            for p in prefixes:
+                self.index[p] = self.index.get(p, 0) | 1 << i
+
+    def candidates(self, text: str) -> int:
+        """ Bitmask (bit i = self.order[i]) of the intents that may match `text` """
+        mask, get = self.always, self.index.get
+        for w in _WORD_START_RE.findall(text.lower()):
+            mask |= get(w, 0) | get(w[:3], 0) | get(w[:2], 0) | get(w[:1], 0)
+        return mask
+
+    def detect(self, text: str) -> Optional[str]:
+        """ Name of the highest-priority intent whose regex matches `text`, or None """
+        mask, i = self.candidates(text), 0
+        while mask:
+            if mask & 1 and self.res[i].search(text):
+                return self.order[i]
+            mask >>= 1
+            i += 1
+        return None
+
+    def detect_loop(self, text: str) -> Optional[str]:
+        """ Reference implementation: every regex in priority order """
+        for name, rex in zip(self.order, self.res):
+            if rex.search(text):
+                return name
+        return None
+
+
+#Clauses used to check the matcher: the intents of llm_patterns plus general questions
+SAMPLE_CLAUSES = (
+    "cual es tu bateria", "cuanta carga te queda", "nivel de pila", "ve a la cocina", "dirigete al laboratorio",
+    "donde queda la enfermeria", "gira 90 grados", "avanza medio metro", "cancela la navegacion", "detente ya",
+    "no te muevas", "cuantos mapas tenemos", "muestrame la lista de mapas", "donde estoy", "cual es tu ubicacion",
+    "que hay cerca", "lugares cercanos", "cuando fue la independencia de mexico", "cuentame un chiste",
+    "quien escribio el quijote", "cual es la capital de francia y cuantos habitantes tiene", "que hora es",
+    "a donde vamos", "battery status", "where am i", "para", "alto", "espera un momento",
+)
+
+_VOCABULARY = (
+    "a", "al", "la", "el", "de", "en", "y", "que", "cual", "cuanto", "donde", "estoy", "estas", "cerca", "hay",
+    "bateria", "pila", "carga", "nivel", "mapas", "lista", "ve", "vete", "gira", "avanza", "para", "alto",
+    "cancela", "navegacion", "ruta", "objetivo", "cocina", "bano", "recepcion", "mexico", "presidente", "hora",
+    "tu", "mi", "posicion", "lugares", "alrededor", "no", "te", "muevas", "espera", "momento", "hacia", "hasta",
+    "orientate", "senala", "dime", "cuantos", "tenemos", "todos", "los", "regresa", "abanza", "soc", "ya",
+)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Self-check (same intent as the regex loop on every clause) and clauses/second benchmark
+    import random, time
+    from llm.llm_patterns import INTENT_RES, INTENT_PRIORITY
+
+    matcher = IntentMatcher(INTENT_RES, INTENT_PRIORITY)
+    always = [n for i, n in enumerate(matcher.order) if matcher.always >> i & 1]
+    print(f"Prefiltro: {len(matcher.index)} prefijos, intenciones sin prefiltro: {always or 'ninguna'}")
+
+    rng = random.Random(0)
+    corpus: List[str] = list(SAMPLE_CLAUSES)
+    corpus += [" ".join(rng.choice(_VOCABULARY) for _ in range(rng.randint(1, 9))) for _ in range(20_000)]
+    mismatches: List[Tuple[str, Optional[str], Optional[str]]] = [
+        (c, matcher.detect_loop(c), matcher.detect(c)) for c in corpus if matcher.detect_loop(c) != matcher.detect(c)]
+    assert not mismatches, mismatches[:10]
+    print(f"Clasificación idéntica en {len(corpus)} cláusulas ✅")
+
+    long_questions = [c for c in SAMPLE_CLAUSES if len(c.split()) >= 5] + [
+        "quien fue el primer presidente de mexico y en que ano termino su mandato",
+        "cuentame un chiste largo sobre robots que viven en marte con sus amigos"]
+    for name, clauses in (("cláusulas de ejemplo", list(SAMPLE_CLAUSES) * 500), ("preguntas largas", long_questions * 2_000),
+                          ("vocabulario aleatorio", corpus)):
+        for label, fn in (("regex por intención", matcher.detect_loop), ("IntentMatcher", matcher.detect)):
+            t0 = time.perf_counter()
+            for c in clauses:
+                fn(c)
+            print(f"{name:22s} {label:20s} {len(clauses) / (time.perf_counter() - t0):10,.0f} cláusulas/s")
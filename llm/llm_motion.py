@@ -0,0 +1,281 @@
+"""
+Motion channel between the agent and the robot.
+
+Instead of forking `ros2 run ...` from the agent for every move, the agent keeps one connection to a
+long-lived motion bridge and sends it newline-delimited JSON commands:
+    {"id": 7, "type": "natural_move", "yaw": 1.57, "distance": 0.0, "flag": false}
+    {"id": 8, "type": "goto", "simulate": false, "target": {...}}
+    {"id": 9, "type": "cancel"}
+The bridge answers every command with an acknowledgment {"id": 7, "ack": true, "status": "queued"}.
+Run the bridge with `python -m llm.llm_motion` (inside your ROS 2 environment) or `--stub` to test.
+Only the transport changes: the bridge's SubprocessExecutor still starts `drive_calibrator.py` per move,
+so the ROS 2 start-up cost of a move stays until it is replaced by an rclpy executor.
+"""
+from __future__ import annotations
+from typing import Dict, Any, Optional
+import itertools, json, logging, queue, socket, socketserver, subprocess, threading, time
+
+from config.settings import MOTION_BRIDGE_HOST, MOTION_BRIDGE_PORT, MOTION_BRIDGE_TIMEOUT_S
+
+
+class MotionClient:
+    """
+    Persistent connection to the motion bridge.
+    - `send()` only queues the command (a background thread writes it and reconnects if needed).
+    - `cancel()` drops the commands still queued here and jumps the queue to the bridge.
+    - Acks are matched by id; `send(..., wait=seconds)` blocks until the ack arrives (acks nobody waits
+      for are dropped).
+    - `reachable()` tells the caller whether the bridge is up, to fall back to the legacy path.
+    """
+
+    def __init__(self, host: str = MOTION_BRIDGE_HOST, port: int = MOTION_BRIDGE_PORT, timeout: float = MOTION_BRIDGE_TIMEOUT_S):
+        self.log = logging.getLogger("Motion")
+        self.addr = (host, port)
+        self.timeout = timeout
+        self.q: "queue.PriorityQueue[tuple[int, int, Dict[str, Any]]]" = queue.PriorityQueue(maxsize=64)
+        self._ids = itertools.count(1)
+        self._acks: Dict[int, Dict[str, Any]] = {}
+        self._ack_evt: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._probe = (0.0, False) #(time, result) of the last reachability check
+        threading.Thread(target=self._sender, name="MotionSender", daemon=True).start()
+
+    def send(self, payload: Dict[str, Any], wait: float | None = None) -> Dict[str, Any]:
+        """ Queue a natural_move/goto command. Returns the ack if `wait` is given, else {'id', 'queued'} """
+        cmd_id = next(self._ids)
+        evt = threading.Event() if wait is not None else None
+        if evt is not None:
+            with self._lock:
+                self._ack_evt[cmd_id] = evt
+        priority = 0 if payload.get("type") == "cancel" else 1
+        try:
+            self.q.put_nowait((priority, cmd_id, {**payload, "id": cmd_id}))
+        except queue.Full:
+            self._forget(cmd_id)
+            self.log.warning("Cola de movimiento llena, comando descartado")
+            return {"id": cmd_id, "ack": False, "error": "cola_llena"}
+        if evt is None:
+            return {"id": cmd_id, "queued": True}
+        got = evt.wait(wait)
+        ack = self._forget(cmd_id)
+        if not got:
+            return {"id": cmd_id, "ack": False, "error": "sin_ack"}
+        return ack or {"id": cmd_id, "ack": True}
+
+    def _forget(self, cmd_id: int) -> Optional[Dict[str, Any]]:
+        """ Stop waiting for `cmd_id`, returns its ack if it arrived """
+        with self._lock:
+            self._ack_evt.pop(cmd_id, None)
+            return self._acks.pop(cmd_id, None)
+
+    def reachable(self, every_s: float = 2.0) -> bool:
+        """ True if connected to the bridge, else try a connection (at most once every `every_s`) """
+        if self._sock is not None:
+            return True
+        t, ok = self._probe
+        if time.monotonic() - t < every_s:
+            return ok
+        try:
+            socket.create_connection(self.addr, timeout=min(self.timeout, 0.2)).close()
+            ok = True
+        except OSError:
+            ok = False
+        self._probe = (time.monotonic(), ok)
+        return ok
+
+    def cancel(self, wait: float | None = None) -> Dict[str, Any]:
+        """ Cancel the current motion: pending local commands are dropped and a cancel is sent first """
+        while True:
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                break
+        return self.send({"type": "cancel"}, wait=wait)
+
+    def _connect(self) -> socket.socket:
+        sock = socket.create_connection(self.addr, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.settimeout(None)
+        threading.Thread(target=self._reader, args=(sock,), name="MotionAcks", daemon=True).start()
+        self.log.info(f"Conectado al puente de movimiento {self.addr[0]}:{self.addr[1]}")
+        return sock
+
+    def _sender(self) -> None:
+        backoff = 0.2
+        while True:
+            _, cmd_id, payload = self.q.get()
+            while True:
+                try:
+                    if self._sock is None:
+                        self._sock = self._connect()
+                    self._sock.sendall((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+                    backoff = 0.2
+                    break
+                except OSError as e:
+                    self._close_sock()
+                    if payload.get("type") != "cancel" and not self.q.empty() and self.q.queue[0][0] == 0:
+                        break #A cancel arrived while we were reconnecting, this command is obsolete
+                    self.log.warning(f"Puente de movimiento no disponible ({e}), reintento en {backoff:.1f}s")
+                    time.sleep(backoff)
+                    backoff = min(backoff * 2.0, 5.0)
+
+    def _reader(self, sock: socket.socket) -> None:
+        try:
+            for line in sock.makefile("r", encoding="utf-8"):
+                try:
+                    ack = json.loads(line)
+                except ValueError:
+                    continue
+                with self._lock:
+                    evt = self._ack_evt.pop(ack.get("id"), None)
+                    if evt is not None:
+                        self._acks[ack.get("id")] = ack
+                if evt is not None:
+                    evt.set()
+        except OSError:
+            pass
+
+    def _close_sock(self) -> None:
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+            self._sock = None
+
+    def close(self) -> None:
+        self._close_sock()
+
+
+class SubprocessExecutor:
+    """
+    Bridge-side executor that keeps the current `drive_calibrator.py` behaviour but owns its children:
+    one motion at a time, and `cancel()` terminates the running one (no orphaned processes).
+    It still pays the ROS 2 start-up of `ros2 run` on every move, an rclpy executor would remove it.
+    """
+
+    def __init__(self):
+        self.log = logging.getLogger("Motion_Executor")
+        self.proc: Optional[subprocess.Popen] = None
+
+    def natural_move(self, cmd: Dict[str, Any]) -> None:
+        dist, yaw = float(cmd.get("distance", 0.0)), float(cmd.get("yaw", 0.0))
+        if dist != 0:
+            args = ['ros2', 'run', 'rp_nav2', 'drive_calibrator.py', 'linear', str(dist)]
+        elif yaw != 0:
+            args = ['ros2', 'run', 'rp_nav2', 'drive_calibrator.py', 'angular', str(yaw)]
+        else:
+            return
+        self.proc = subprocess.Popen(args)
+        self.proc.wait()
+
+    def goto(self, cmd: Dict[str, Any]) -> None:
+        self.log.info(f"[goto] {cmd.get('target')} (simulate={cmd.get('simulate')})")
+
+    def cancel(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+
+class StubExecutor:
+    """ Stand-in executor for tests and benchmarks: records the commands, moves nothing """
+
+    def __init__(self):
+        self.done = []
+
+    def natural_move(self, cmd: Dict[str, Any]) -> None:
+        self.done.append(cmd)
+
+    def goto(self, cmd: Dict[str, Any]) -> None:
+        self.done.append(cmd)
+
+    def cancel(self) -> None:
+        pass
+
+
+def serve_motion_bridge(executor, host: str = MOTION_BRIDGE_HOST, port: int = MOTION_BRIDGE_PORT):
+    """
+    Start the motion bridge: every command is acknowledged as soon as it is read and executed
+    in order by a single worker; `cancel` empties the queue and cancels the running motion.
+    Returns the server (already serving in a daemon thread).
+    """
+    log = logging.getLogger("Motion_Bridge")
+    pending: "queue.Queue[Dict[str, Any]]" = queue.Queue()
+
+    def worker():
+        while True:
+            cmd = pending.get()
+            try:
+                getattr(executor, cmd["type"])(cmd)
+            except Exception as e:
+                log.warning(f"Error ejecutando {cmd.get('type')}: {e}")
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            for line in self.rfile:
+                try:
+                    cmd = json.loads(line)
+                except ValueError:
+                    continue
+                kind = cmd.get("type")
+                if kind == "cancel":
+                    while not pending.empty():
+                        try:
+                            pending.get_nowait()
+                        except queue.Empty:
+                            break
+                    executor.cancel()
+                    ack = {"id": cmd.get("id"), "ack": True, "status": "cancelled"}
+                elif kind in ("natural_move", "goto"):
+                    pending.put(cmd)
+                    ack = {"id": cmd.get("id"), "ack": True, "status": "queued"}
+                else:
+                    ack = {"id": cmd.get("id"), "ack": False, "error": f"tipo_desconocido: {kind}"}
+                self.wfile.write((json.dumps(ack) + "\n").encode("utf-8"))
+                self.wfile.flush()
+
+    socketserver.ThreadingTCPServer.allow_reuse_address = True
+    server = socketserver.ThreadingTCPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=worker, name="MotionWorker", daemon=True).start()
+    threading.Thread(target=server.serve_forever, name="MotionBridge", daemon=True).start()
+    log.info(f"Puente de movimiento escuchando en {host}:{server.server_address[1]}")
+    return server
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    import sys
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+
+    if "--bench" in sys.argv:
+        # Command-issue latency only: ack round trip through a stand-in bridge vs forking a process per move.
+        # The actuation time is not measured (SubprocessExecutor still runs ros2 per move)
+        import statistics
+        server = serve_motion_bridge(StubExecutor(), "127.0.0.1", 0)
+        client = MotionClient("127.0.0.1", server.server_address[1])
+        client.send({"type": "natural_move", "yaw": 0.0, "distance": 0.0, "flag": False}, wait=2.0) #connect
+        lat = []
+        for i in range(500):
+            t0 = time.perf_counter()
+            client.send({"type": "natural_move", "yaw": 0.1, "distance": 0.0, "flag": False}, wait=2.0)
+            lat.append(1000.0 * (time.perf_counter() - t0))
+        lat.sort()
+        print(f"Puente: p50 {lat[len(lat) // 2]:.3f} ms, p99 {lat[int(len(lat) * 0.99)]:.3f} ms")
+        fork = []
+        for i in range(20):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, "-c", "pass"])
+            fork.append(1000.0 * (time.perf_counter() - t0))
+        print(f"Proceso por comando (python -c pass, sin ROS 2): p50 {statistics.median(fork):.1f} ms")
+        exit(0)
+
+    executor = StubExecutor() if "--stub" in sys.argv else SubprocessExecutor()
+    serve_motion_bridge(executor)
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        print(" Saliendo")
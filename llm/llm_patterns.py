@@ -233,6 +233,31 @@ BATTERY_WORDS_RE = re.compile(r"""
 )\b
 """)
 
+#------------------------ Pose - Where am I ------------------------#
+
+POSE_WORDS_RE = re.compile(r"""
+(?xi)
+\b(
+    donde\s+(?:estoy|estas|estamos|te\s+encuentras|nos\s+encontramos)|
+    (?:cual\s+es\s+)?(?:tu|mi|nuestra)\s+(?:posicion|ubicacion|localizacion)|
+    en\s+que\s+(?:lugar|parte|sitio)\s+(?:estoy|estas|estamos)|
+    where\s+am\s+i|where\s+are\s+(?:you|we)
+)\b
+""")
+
+#------------------------ Nearby places ------------------------#
+
+NEARBY_WORDS_RE = re.compile(r"""
+(?xi)
+\b(
+    que\s+(?:hay|lugares\s+hay|tenemos|tengo|tienes)\s+(?:cerca|alrededor|por\s+aqui)|
+    que\s+(?:esta|queda)\s+(?:cerca|a\s+un\s+lado)|
+    lugares\s+(?:cercanos|cerca|alrededor)|
+    (?:cerca|alrededor)\s+de\s+(?:mi|ti|aqui|nosotros)|
+    what(?:'s|\s+is)\s+(?:near(?:by)?|around)
+)\b
+""")
+
 #------------------------ Mapas ------------------------#
 
 """
@@ -296,20 +321,27 @@ MAPS_WORDS_RE = re.compile(r"""
 #Here we define the functions, with the corresponding patterns, that we want to execute
 INTENT_RES = {
     "battery":   BATTERY_WORDS_RE,
+    "pose":      POSE_WORDS_RE,
+    "nearby":    NEARBY_WORDS_RE,
     "navigate":  MOV_VERB_RE,
     "cancel_navigate": CANCEL_NAVIGATION_RE,
     "maps": MAPS_WORDS_RE
 }
 
 #Here we define the priority of the functions to be executed
-INTENT_PRIORITY = ("battery", "cancel_navigate", "navigate", "maps")
+INTENT_PRIORITY = ("battery", "cancel_navigate", "nearby", "pose", "navigate", "maps")
 
 # kind_group: "first" (short) == first or "second" (long) == second determine wich works are executed first
 # need_user_input: True == needs the query to process the action, False == does not need it
 
+# over_rag: True == checked before GENERAL_RAG (specific patterns about the robot itself), False == a close
+# GENERAL_RAG trigger wins (loose patterns: "para", "dónde" also start questions about the company)
+
 INTENT_ROUTING = {
-    "battery":         {"kind_group": "first", "kind": "battery",  "need_user_input": False},
-    "navigate":        {"kind_group": "second", "kind": "navigate", "need_user_input": True},
-    "cancel_navigate": {"kind_group": "first", "kind": "cancel_navigate", "need_user_input": False},
-    "maps":            {"kind_group": "second", "kind": "maps", "need_user_input": True}
+    "battery":         {"kind_group": "first", "kind": "battery",  "need_user_input": False, "over_rag": True},
+    "pose":            {"kind_group": "first", "kind": "pose",     "need_user_input": False, "over_rag": True},
+    "nearby":          {"kind_group": "first", "kind": "nearby",   "need_user_input": False, "over_rag": True},
+    "navigate":        {"kind_group": "second", "kind": "navigate", "need_user_input": True, "over_rag": False},
+    "cancel_navigate": {"kind_group": "first", "kind": "cancel_navigate", "need_user_input": False, "over_rag": False},
+    "maps":            {"kind_group": "second", "kind": "maps", "need_user_input": True, "over_rag": True}
 }
@@ -0,0 +1,148 @@
+from __future__ import annotations
+from typing import Dict, List, Optional, Tuple
+import re
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from config.settings import FUZZY_LOGIC_ACCURACY_POSE
+
+_PHONETIC_RULES = (
+    (re.compile(r"ch"), "X"),
+    (re.compile(r"ll"), "y"),
+    (re.compile(r"qu(?=[ei])"), "k"),
+    (re.compile(r"gu(?=[ei])"), "G"),
+    (re.compile(r"g(?=[ei])"), "j"),
+    (re.compile(r"c(?=[ei])"), "s"),
+    (re.compile(r"[cq]"), "k"),
+    (re.compile(r"z"), "s"),
+    (re.compile(r"x"), "ks"),
+    (re.compile(r"[vw]"), "b"),
+    (re.compile(r"h"), ""),
+    (re.compile(r"y(?![aeiou])"), "i"),
+    (re.compile(r"(.)\1+"), r"\1"),
+)
+
+def phonetic_key(s: str) -> str:
+    """ Spanish sound-alike key of a normalized (ascii, lowercase) text, spaces removed:
+    "en fermeria" / "enfermería" -> "enfermeria", "vaño" / "baño" -> "bano", "cosina" -> "kosina" """
+    s = s.replace(" ", "")
+    for rex, rep in _PHONETIC_RULES:
+        s = rex.sub(rep, s)
+    return s.replace("X", "ch").replace("G", "g")
+
+
+class PlaceMatcher:
+    """
+    Match an (already normalized) place query against every alias of the poses, cheapest stage first:
+    1. exact alias, 2. alias without spaces, 3. phonetic key,
+    4. one batched rapidfuzz pass over the precomputed alias list with ratio and ratio of the phonetic keys,
+       plus token_set_ratio on the aliases sharing a word with the query (token scorers are the expensive ones);
+       the best alias wins if it reaches `cutoff`.
+    """
+
+    def __init__(self, keys: List[str], cutoff: float = FUZZY_LOGIC_ACCURACY_POSE):
+        self.cutoff = 100.0 * cutoff
+        self.choices = list(dict.fromkeys(k for k in keys if k))
+        self.exact = set(self.choices)
+        self.compact = {k.replace(" ", ""): k for k in self.choices}
+        self.phonetic_choices = [phonetic_key(k) for k in self.choices]
+        self.phonetic = {}
+        for pk, k in zip(self.phonetic_choices, self.choices):
+            self.phonetic.setdefault(pk, k)
+        self.by_token: Dict[str, List[int]] = {}
+        for i, k in enumerate(self.choices):
+            for tok in set(k.split()):
+                self.by_token.setdefault(tok, []).append(i)
+
+    def match(self, query: str) -> Optional[Tuple[str, float, str]]:
+        """ Return (alias, score 0.0-1.0, stage) of the best alias, or None if nothing reaches the cutoff """
+        if not query or not self.choices:
+            return None
+        if query in self.exact:
+            return query, 1.0, "exact"
+        compact = query.replace(" ", "")
+        if compact in self.compact:
+            return self.compact[compact], 1.0, "compact"
+        pk = phonetic_key(query)
+        if pk in self.phonetic:
+            return self.phonetic[pk], 1.0, "phonetic"
+
+        scores = np.maximum(
+            process.cdist([query], self.choices, scorer=fuzz.ratio, score_cutoff=self.cutoff, dtype=np.uint8)[0],
+            process.cdist([pk], self.phonetic_choices, scorer=fuzz.ratio, score_cutoff=self.cutoff, dtype=np.uint8)[0],
+        )
+        shared = sorted({i for tok in set(query.split()) for i in self.by_token.get(tok, ())})
+        if shared:
+            token = process.cdist([query], [self.choices[i] for i in shared], scorer=fuzz.token_set_ratio,
+                                  score_cutoff=self.cutoff, dtype=np.uint8)[0]
+            scores[shared] = np.maximum(scores[shared], token)
+        best = int(np.argmax(scores))
+        if scores[best] < self.cutoff or scores[best] == 0:
+            return None
+        return self.choices[best], float(scores[best]) / 100.0, "fuzzy"
+
+
+#Speech-to-text misrecognitions of the places of config/data/poses.json: (heard, expected place)
+MISRECOGNITION_CORPUS = (
+    ("en fermeria", "enfermería"), ("enfermerya", "enfermería"), ("emfermeria", "enfermería"),
+    ("la enfermera", "enfermería"), ("enfermerria", "enfermería"), ("clinika", "enfermería"),
+    ("ospital", "enfermería"), ("hospita", "enfermería"), ("dotor", "enfermería"),
+    ("vano", "baño"), ("banio", "baño"), ("los banos", "baño"), ("sanitarios", "baño"),
+    ("serbicios", "baño"), ("servisios", "baño"),
+    ("cargado", "cargador"), ("carga dor", "cargador"), ("estacion de cargas", "cargador"),
+    ("estasion de carga", "cargador"), ("dokin a", "cargador"), ("docking", "cargador"),
+    ("cosina", "cocina"), ("kocina", "cocina"), ("co cina", "cocina"), ("cozina", "cocina"),
+    ("recepsion", "recepción"), ("resepcion", "recepción"), ("re sepcion", "recepción"),
+    ("resecion", "recepción"), ("fron desk", "recepción"), ("front des", "recepción"),
+    ("laboratoryo", "laboratorio"), ("labo ratorio", "laboratorio"), ("laboratorio principa", "laboratorio"),
+    ("lavoratorio", "laboratorio"), ("el lab", "laboratorio"),
+    ("kosina", "cocina"), ("koxina", "cocina"), ("klinika", "enfermería"), ("ospitall", "enfermería"),
+    ("vanyo", "baño"), ("serbisios", "baño"), ("rresepsion", "recepción"), ("la boratoryo", "laboratorio"),
+    ("kargador", "cargador"), ("dokkin be", "cocina"), ("estasion ve", "cocina"), ("base ve", "cocina"),
+)
+
+#Queries that are not places and must not match anything
+NEGATIVE_CORPUS = ("la luna", "mexico", "gira a la derecha", "tu bateria", "el presidente", "un chiste", "musica")
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Hit rate and latency on the misrecognition corpus: previous linear fuzzy loop vs PlaceMatcher,
+    # both through PosesIndex.lookup with a full utterance ("ve a la <heard>")
+    import os, time
+    from config.settings import PATH_POSES
+    from llm.llm_data import PosesIndex
+    from llm.llm_intentions import norm_text, extract_place_query
+
+    index = PosesIndex(os.path.expanduser(PATH_POSES))
+
+    def linear_lookup(text: str) -> Optional[str]:
+        key = norm_text(extract_place_query(text) or text, True)
+        if key in index.by_key:
+            return index.by_key[key].name
+        best_k, best_s = None, 0.0
+        for k in index.by_key:
+            s = fuzz.ratio(key, k) / 100.0
+            if s > best_s:
+                best_k, best_s = k, s
+        return index.by_key[best_k].name if best_k and best_s >= FUZZY_LOGIC_ACCURACY_POSE else None
+
+    def engine_lookup(text: str) -> Optional[str]:
+        return index.lookup(text).get("name")
+
+    for label, fn in (("lineal (ratio)", linear_lookup), ("PlaceMatcher", engine_lookup)):
+        hits, t0 = 0, time.perf_counter()
+        for heard, place in MISRECOGNITION_CORPUS:
+            hits += fn(f"ve a la {heard}") == place
+        dt = time.perf_counter() - t0
+        false = sum(fn(f"ve a la {q}") is not None for q in NEGATIVE_CORPUS)
+        print(f"{label:15s} aciertos {hits}/{len(MISRECOGNITION_CORPUS)} ({100.0 * hits / len(MISRECOGNITION_CORPUS):.0f}%), "
+              f"falsos positivos {false}/{len(NEGATIVE_CORPUS)}, {1e6 * dt / len(MISRECOGNITION_CORPUS):.1f} µs/consulta")
+
+    # Latency of the fuzzy stage alone with a large alias list
+    many = [f"{k} {i}" for i in range(2_000) for k in index.by_key]
+    big = PlaceMatcher(many)
+    t0 = time.perf_counter()
+    for heard, _ in MISRECOGNITION_CORPUS:
+        big.match(norm_text(heard, True))
+    print(f"{len(many)} alias: {1000.0 * (time.perf_counter() - t0) / len(MISRECOGNITION_CORPUS):.2f} ms/consulta")
@@ -0,0 +1,219 @@
+from __future__ import annotations
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import itertools, logging, threading, time
+
+from config.settings import (THREADS_LLM, LLM_POOL_SIZE, LLM_POOL_THREADS, LLM_POOL_AGING_S, USE_SESSION_MEMORY)
+from llm.llm_client import LLM
+from llm.llm_session import SessionStore, CURRENT_SESSION
+from utils.metrics import METRICS, SECONDS_BUCKETS
+
+QUEUE_WAIT = METRICS.histogram("octybot_llm_queue_wait_seconds", "Wait for a free LLM context (s)", SECONDS_BUCKETS)
+
+#Lower runs first: a plan_motion is ~64 tokens and the robot waits for it, a general answer ~100 and is spoken
+PRIORITY = {"motion": 0, "general": 1}
+
+
+class _Ticket:
+    __slots__ = ("kind", "priority", "seq", "t_enq", "key", "slot")
+
+    def __init__(self, kind: str, seq: int, key: Optional[str]):
+        self.kind = kind
+        self.priority = PRIORITY.get(kind, 1)
+        self.seq = seq
+        self.t_enq = time.monotonic()
+        self.key = key
+        self.slot: Optional[int] = None
+
+
+class FairScheduler:
+    """
+    Hand out `size` slots (llama.cpp contexts) to waiting requests:
+    - by priority (motion before general), FIFO within a priority;
+    - a request gains one priority level every `aging_s` it waits, so long generations are never starved;
+    - requests with the same key (conversation) never run at once, and a free slot that last served
+      that key is preferred (its KV cache already holds the conversation).
+    Metrics: queue depth, wait time per kind, busy slots.
+    """
+
+    def __init__(self, size: int, aging_s: float = LLM_POOL_AGING_S):
+        self.size = size
+        self.aging_s = aging_s
+        self._cv = threading.Condition()
+        self._free: List[int] = list(range(size))
+        self._waiting: List[_Ticket] = []
+        self._running_keys: set = set()
+        self._last_slot: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self.max_depth = 0
+        self.served: Dict[str, int] = {k: 0 for k in PRIORITY}
+        self.wait_ms: Dict[str, deque] = {k: deque(maxlen=1000) for k in PRIORITY}
+
+    def _rank(self, t: _Ticket, now: float):
+        aged = int((now - t.t_enq) / self.aging_s) if self.aging_s > 0 else 0
+        return (t.priority - aged, t.seq)
+
+    def _head(self) -> Optional[_Ticket]:
+        """ Best waiting request that may run now (caller holds the condition) """
+        now = time.monotonic()
+        ready = [t for t in self._waiting if t.key is None or t.key not in self._running_keys]
+        return min(ready, key=lambda t: self._rank(t, now)) if ready else None
+
+    def _dispatch(self) -> bool:
+        """ Hand free slots to the best waiting requests, wake the waiters only if one got a slot """
+        handed = False
+        while self._free:
+            t = self._head()
+            if t is None:
+                break
+            preferred = self._last_slot.get(t.key) if t.key is not None else None
+            slot = preferred if preferred in self._free else self._free[0]
+            self._free.remove(slot)
+            self._waiting.remove(t)
+            if t.key is not None:
+                self._running_keys.add(t.key)
+            t.slot = slot
+            handed = True
+        if handed:
+            self._cv.notify_all()
+        return handed
+
+    def acquire(self, kind: str, key: Optional[str] = None) -> _Ticket:
+        with self._cv:
+            t = _Ticket(kind, next(self._seq), key)
+            self._waiting.append(t)
+            self.max_depth = max(self.max_depth, len(self._waiting))
+            self._dispatch()
+            while t.slot is None:
+                #Slots are handed out by release(); a wake-up without a slot for us just waits again.
+                #Only a timeout re-dispatches, as a safety net at the aging pace
+                if not self._cv.wait(timeout=self.aging_s if self.aging_s > 0 else None):
+                    self._dispatch()
+            waited = time.monotonic() - t.t_enq
+            self.wait_ms.setdefault(kind, deque(maxlen=1000)).append(1000.0 * waited)
+            QUEUE_WAIT.observe(waited, kind=kind)
+            self.served[kind] = self.served.get(kind, 0) + 1
+            return t
+
+    def release(self, t: _Ticket) -> None:
+        with self._cv:
+            self._free.append(t.slot)
+            if t.key is not None:
+                self._running_keys.discard(t.key)
+                self._last_slot[t.key] = t.slot
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, kind: str, key: Optional[str] = None):
+        t = self.acquire(kind, key)
+        try:
+            yield t.slot
+        finally:
+            self.release(t)
+
+    def stats(self) -> Dict[str, Any]:
+        def pct(values, p):
+            v = sorted(values)
+            return round(v[min(len(v) - 1, int(len(v) * p))], 1) if v else None
+        with self._cv:
+            return {"size": self.size, "busy": self.size - len(self._free), "queue_depth": len(self._waiting),
+                    "max_queue_depth": self.max_depth, "served": dict(self.served),
+                    "wait_ms": {k: {"p50": pct(w, 0.5), "p95": pct(w, 0.95), "max": pct(w, 1.0)}
+                                for k, w in self.wait_ms.items()}}
+
+
+class LlmPool:
+    """
+    Drop-in for LLM with `size` llama.cpp contexts of the same GGUF, so up to `size` requests generate at once.
+    Every context maps the same file (use_mmap): the weights live once in the page cache and each extra
+    context only adds its KV cache and compute buffers. The CPU threads are split between the contexts.
+    Requests go through a FairScheduler (plan_motion first), conversations are shared by all the contexts.
+    """
+
+    def __init__(self, model_path: str, size: int = LLM_POOL_SIZE, threads: int | None = LLM_POOL_THREADS,
+                 draft_path: str | None = None, aging_s: float = LLM_POOL_AGING_S):
+        self.log = logging.getLogger("LLM_Pool")
+        self.size = max(1, size)
+        self.contexts: List[LLM] = []
+        self.sessions = SessionStore() if USE_SESSION_MEMORY else None
+        for i in range(self.size):
+            ctx = LLM(model_path=model_path, draft_path=draft_path)
+            ctx.threads = threads or max(1, THREADS_LLM // self.size)
+            ctx.sessions = self.sessions
+            if i:
+                ctx.engine_name = f"llm#{i}"
+                ctx.size_hint_mb = 0.0 #weights already mapped by the first context, the KV cost is measured on load
+            self.contexts.append(ctx)
+        self.scheduler = FairScheduler(self.size, aging_s)
+        METRICS.collect("octybot_llm_queue_depth", "Requests waiting for an LLM context", "gauge",
+                        lambda: [({}, self.scheduler.stats()["queue_depth"])], source="llm_pool")
+        METRICS.collect("octybot_llm_busy_contexts", "LLM contexts generating right now", "gauge",
+                        lambda: [({}, self.scheduler.stats()["busy"])], source="llm_pool")
+        self.log.info(f"Pool de {self.size} contextos LLM, {self.contexts[0].threads} hilos cada uno")
+
+    def ensure(self):
+        for ctx in self.contexts:
+            ctx.ensure()
+
+    def engines(self):
+        return list(self.contexts)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.scheduler.stats()
+
+    def answer_general(self, user_prompt: str) -> str:
+        key = CURRENT_SESSION.get() if self.sessions is not None else None
+        with self.scheduler.slot("general", key) as i:
+            return self.contexts[i].answer_general(user_prompt)
+
+    def plan_motion(self, user_prompt: str) -> Optional[Dict[str, Any]]:
+        with self.scheduler.slot("motion") as i:
+            return self.contexts[i].plan_motion(user_prompt)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Scheduler with simulated work (no model needed): wait of short motion plans mixed with long general answers,
+    # priority vs plain FIFO. With --bench, concurrent general questions on the real model, pool of 1 vs LLM_POOL_SIZE
+    import sys, random
+    from concurrent.futures import ThreadPoolExecutor
+
+    def simulate(aging_s: float, fifo: bool) -> Dict[str, Any]:
+        sched = FairScheduler(2, aging_s)
+        if fifo:
+            sched._rank = lambda t, now: (0, t.seq)
+        rng = random.Random(7)
+        jobs = [("motion", 0.05) if rng.random() < 0.3 else ("general", 0.4) for _ in range(40)]
+
+        def run(job):
+            kind, work = job
+            with sched.slot(kind):
+                time.sleep(work)
+
+        with ThreadPoolExecutor(max_workers=len(jobs)) as ex:
+            for job in jobs:
+                ex.submit(run, job)
+                time.sleep(0.08) #arrivals a bit faster than the 2 slots can serve
+        return sched.stats()
+
+    for label, fifo in (("FIFO", True), ("prioridad + envejecimiento", False)):
+        st = simulate(aging_s=2.0, fifo=fifo)
+        print(f"{label:27s} espera motion {st['wait_ms']['motion']}, general {st['wait_ms']['general']}, "
+              f"cola máx {st['max_queue_depth']}")
+
+    if "--bench" in sys.argv:
+        from utils.utils import LoadModel
+        from llm.llm_speculative import QUESTION_CORPUS
+
+        model_path = str(LoadModel().ensure_model("llm")[0])
+        for size in sorted({1, max(2, LLM_POOL_SIZE)}):
+            pool = LlmPool(model_path, size=size)
+            pool.ensure()
+            pool.answer_general("Hola") #warm-up
+            t0 = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=4) as ex:
+                list(ex.map(pool.answer_general, QUESTION_CORPUS))
+            elapsed = time.perf_counter() - t0
+            print(f"pool {size}: {len(QUESTION_CORPUS) / elapsed:.2f} preguntas/s, {pool.stats()}")
+            del pool
@@ -2,6 +2,19 @@ from __future__ import annotations
 from config.settings import USE_LLM
 from typing import Callable, Dict
 
+#Fixed replies of the publishers, the TTS cache pre-synthesizes them (tts/tts_cache.py)
+FIXED_REPLIES = (
+    "Voy",
+    "Por allá",
+    "Cancelando Navegación",
+    "Aún no tengo lectura de batería.",
+    "Aún no sé dónde estoy.",
+    "Lo lamento, no cuentas con mapas cargados",
+    "No encontré ese destino ni entiendo la orden.",
+    "Lo siento lo que me has pedido no lo tengo en mi base de conocimiento",
+    "Lo siento, el servidor está ocupado.",
+    "No me puedo conectar con el servidor.",
+)
 
 class Router:
     def __init__(self, llm, get_info):
@@ -12,6 +25,8 @@ class Router:
             "rag": self.data_return,
             "general": self.general_response_llm,
             "battery": self.battery_publisher,
+            "pose": self.pose_publisher,
+            "nearby": self.nearby_publisher,
             "navigate": self.navigation_publisher,
             "cancel_navigate": self.cancel_navigate_publisher,
             "maps": self.get_maps
@@ -38,7 +53,32 @@ class Router:
     def battery_publisher(self, data: str)-> str: 
         battery = self.get_info.tool_get_battery() 
         pct = battery.get('percentage') 
-        return f"Mi batería es: {pct:.1f}%" if isinstance(pct,(int,float)) else "Aún no tengo lectura de batería." 
+        if not isinstance(pct,(int,float)):
+            return "Aún no tengo lectura de batería."
+        if battery.get('stale'):
+            return f"Mi última lectura de batería, de hace {battery['age_s']:.0f} segundos, fue: {pct:.1f}%"
+        return f"Mi batería es: {pct:.1f}%"
+    
+    def pose_publisher(self, data: str)-> str: 
+        pose = self.get_info.tool_get_pose()
+        if 'error' in pose:
+            return "Aún no sé dónde estoy."
+        where = f"cerca de {pose['near']}" if pose.get('near') else f"en x {pose['x']:.1f}, y {pose['y']:.1f} del mapa {pose['frame_id']}"
+        if pose.get('stale'):
+            return f"Hace {pose['age_s']:.0f} segundos estaba {where}"
+        return f"Estoy {where}"
+    
+    def nearby_publisher(self, data: str)-> str: 
+        nearby = self.get_info.tool_get_nearby()
+        if 'error' in nearby:
+            return "Aún no sé dónde estoy."
+        when = f"Hace {nearby['age_s']:.0f} segundos " if nearby.get('stale') else ""
+        if not nearby['places']:
+            return f"{when}{'no había' if when else 'No hay'} lugares conocidos a menos de {nearby['radius']:.0f} metros."
+        places = ", ".join(f"{p['name']} a {p['distance']:.1f} metros" for p in nearby['places'])
+        if when:
+            return f"{when}tenía cerca: {places}"
+        return f"Cerca de mí: {places}"
     
     def navigation_publisher(self, data: str)-> str: 
         place = self.get_info.tool_nav_to_place(data) 
@@ -57,6 +97,7 @@ class Router:
                 return "Lo siento, el sistema de Navegación con LLM no se encuentra activado, revisa tu configuración"
         
     def cancel_navigate_publisher(self, data: str)-> str: 
+        self.get_info.tool_cancel_navigation()
         return "Cancelando Navegación"
     
     def get_maps(self, data: str)-> str: 
@@ -0,0 +1,246 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib, json, logging, os, re, threading, zlib
+from pathlib import Path
+import numpy as np
+
+from config.settings import (THREADS_LLM, N_BACH_LLM, SEMANTIC_RAG_ENCODER, PATH_RAG_EMBEDDINGS,
+                             SEMANTIC_RAG_THRESHOLD, SEMANTIC_RAG_TOP_K)
+
+
+class LlamaEmbedder:
+    """
+    Sentence embeddings of a GGUF model with llama.cpp in embedding mode (mean pooling).
+    Use the same file as the chat model: the weights are mmapped, so the pages are shared with it.
+    One llama.cpp context, so calls from several threads (the agent server workers) are serialized.
+    """
+
+    def __init__(self, model_path: str, n_ctx: int = 512, threads: int = THREADS_LLM):
+        self.model_path = model_path
+        self.id = f"llama:{os.path.basename(model_path)}"
+        self.n_ctx = n_ctx
+        self.threads = threads
+        self._llm = None
+        self._lock = threading.Lock()
+
+    def ensure(self):
+        with self._lock:
+            self._ensure()
+
+    def _ensure(self):
+        if self._llm is None:
+            from llama_cpp import Llama, LLAMA_POOLING_TYPE_MEAN
+            self._llm = Llama(model_path=self.model_path, embedding=True, pooling_type=LLAMA_POOLING_TYPE_MEAN,
+                              n_ctx=self.n_ctx, n_threads=self.threads, n_batch=N_BACH_LLM,
+                              use_mmap=True, use_mlock=False, verbose=False)
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """ L2-normalized float32 embeddings, one row per text """
+        with self._lock:
+            self._ensure()
+            vecs = np.asarray(self._llm.embed(list(texts)), dtype=np.float32).reshape(len(texts), -1)
+        return vecs / np.maximum(np.linalg.norm(vecs, axis=1, keepdims=True), 1e-12)
+
+
+class HashingEmbedder:
+    """
+    Dependency-free stand-in encoder: hashed words + character trigrams (lexical, not semantic).
+    Useful for tests and for machines without the GGUF model, it catches reworded questions that keep
+    most of their words but not real paraphrases.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.id = f"hashing:{dim}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = re.findall(r"\w+", text.lower())
+            grams = words + [f" {w} "[i:i + 3] for w in words for i in range(len(w))]
+            for g in grams:
+                out[row, zlib.crc32(g.encode("utf-8")) % self.dim] += 1.0
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+
+def make_embedder(kind: str = SEMANTIC_RAG_ENCODER, model_path: str | None = None):
+    """ "llm" -> LlamaEmbedder over the chat model, "hashing" -> HashingEmbedder """
+    if kind == "llm":
+        if not model_path:
+            raise ValueError("SEMANTIC_RAG_ENCODER='llm' necesita la ruta del modelo")
+        return LlamaEmbedder(model_path)
+    return HashingEmbedder()
+
+
+def items_digest(items: List[Dict[str, str]]) -> str:
+    """ Fingerprint of the GENERAL_RAG items, an index built for other data is not used """
+    return hashlib.sha1(json.dumps(items, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SemanticIndex:
+    """
+    Precomputed trigger embeddings of GENERAL_RAG: one contiguous float16 matrix (n_triggers x dim),
+    saved as `<path>.npy` plus `<path>.json` (answer of each row, encoder id, digest of the RAG).
+    Queries are one matrix-vector product (cosine, rows are normalized) and a top-k.
+    """
+
+    def __init__(self, matrix: np.ndarray, answers: List[str], meta: Dict[str, Any]):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float16)
+        self.answers = answers
+        self.meta = meta
+        #float16 is the stored format; the knowledge base is small, so BLAS works on a float32 copy
+        self._m32 = self.matrix.astype(np.float32)
+
+    @classmethod
+    def build(cls, items: List[Dict[str, str]], embedder, batch: int = 64) -> "SemanticIndex":
+        triggers = [it["q"] for it in items]
+        rows = [embedder.embed(triggers[i:i + batch]) for i in range(0, len(triggers), batch)]
+        matrix = np.concatenate(rows) if rows else np.zeros((0, 1), dtype=np.float32)
+        return cls(matrix, [it["a"] for it in items], {"encoder": embedder.id, "digest": items_digest(items)})
+
+    def save(self, path: str = PATH_RAG_EMBEDDINGS) -> None:
+        base = Path(path).expanduser()
+        base.parent.mkdir(parents=True, exist_ok=True)
+        np.save(base.with_suffix(".npy"), self.matrix)
+        base.with_suffix(".json").write_text(json.dumps({**self.meta, "answers": self.answers}, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: str = PATH_RAG_EMBEDDINGS) -> Optional["SemanticIndex"]:
+        base = Path(path).expanduser()
+        if not base.with_suffix(".npy").exists() or not base.with_suffix(".json").exists():
+            return None
+        meta = json.loads(base.with_suffix(".json").read_text(encoding="utf-8"))
+        answers = meta.pop("answers")
+        return cls(np.load(base.with_suffix(".npy")), answers, meta)
+
+    def search(self, query_vec: np.ndarray, k: int = SEMANTIC_RAG_TOP_K) -> List[Tuple[float, int]]:
+        """ Top-k (cosine, row) for one normalized query vector, best first """
+        if not len(self.answers):
+            return []
+        scores = self._m32 @ np.asarray(query_vec, dtype=np.float32).ravel()
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+
+class SemanticRAG:
+    """ Semantic tier of GENERAL_RAG: answer when the closest trigger is at least `threshold` (cosine) """
+
+    def __init__(self, index: SemanticIndex, embedder, threshold: float = SEMANTIC_RAG_THRESHOLD, k: int = SEMANTIC_RAG_TOP_K):
+        self.log = logging.getLogger("Semantic_RAG")
+        self.index = index
+        self.embedder = embedder
+        self.threshold = threshold
+        self.k = k
+        self.queries = 0
+        self.hits = 0
+        self._lock = threading.Lock() #counters, lookups run on the server worker threads
+
+    @classmethod
+    def from_settings(cls, items: List[Dict[str, str]], model_path: str | None = None,
+                      path: str = PATH_RAG_EMBEDDINGS) -> Optional["SemanticRAG"]:
+        """ Load the precomputed index, None if it is missing or was built for other data/encoder """
+        index = SemanticIndex.load(path)
+        log = logging.getLogger("Semantic_RAG")
+        if index is None:
+            log.warning(f"No hay embeddings en {path}, ejecuta: python -m llm.llm_semantic --build")
+            return None
+        embedder = make_embedder(SEMANTIC_RAG_ENCODER, model_path)
+        if index.meta.get("digest") != items_digest(items) or index.meta.get("encoder") != embedder.id:
+            log.warning("Los embeddings no corresponden a GENERAL_RAG o al codificador actual, vuelve a generarlos")
+            return None
+        return cls(index, embedder)
+
+    def lookup(self, query: str) -> Dict[str, Any]:
+        """ {'answer', 'score', 'note': 'semantic'} if the best trigger reaches the threshold, else {} """
+        hits = self.index.search(self.embedder.embed([query])[0], self.k)
+        found = bool(hits) and hits[0][0] >= self.threshold
+        with self._lock:
+            self.queries += 1
+            self.hits += found
+        if not found:
+            return {}
+        score, row = hits[0]
+        return {"answer": self.index.answers[row], "score": round(score, 3), "note": "semantic"}
+
+
+#Reworded questions of config/data/general_rag.json: (question, start of the expected answer)
+PARAPHRASE_CORPUS = (
+    ("con que nombre te conocen", "Mi nombre es"), ("como debo llamarte", "Mi nombre es"),
+    ("me podrias decir como te llamas", "Mi nombre es"), ("platicame quien eres", "Soy Octybot"),
+    ("que clase de maquina eres", "Soy Octybot"), ("eres un robot o una persona", "Soy Octybot"),
+    ("a quien le debes tu existencia", "Jossue"), ("quien construyo este robot", "Jossue"),
+    ("quien es la persona que te desarrollo", "Jossue"), ("me explicas el negocio de octopi", "Somos una empresa"),
+    ("cual es la actividad principal de su compania", "Somos una empresa"), ("cuentame de octopi", "Somos una empresa"),
+    ("que ventajas tienen frente a la competencia", "Somos fabricantes"), ("por que deberia escogerlos a ustedes", "Somos fabricantes"),
+    ("que precio tiene alquilar uno de sus robots", "La renta de nuestros robots"),
+    ("cuanto me costaria rentar un robot al mes", "La renta de nuestros robots"),
+    ("que robots venden ustedes", "Tenemos tres modelos"), ("cuales robots fabrican ustedes", "Tenemos tres modelos"),
+    ("para que sirve el robot marco", "Es un robot promotor"), ("el robot centinel para que sirve", "Es un robot de vigilancia"),
+    ("para que sirve datia", "Es nuestro software"), ("quiero comprar uno de sus robots", "Para ponerte en contacto"),
+    ("tienen una lista de precios", "Debido a que"), ("como te encuentras robot", "¡Funcionando"),
+)
+
+#Questions the knowledge base does not answer, they must still go to the LLM
+OFF_TOPIC_CORPUS = (
+    "cuando fue la independencia de mexico", "cuanto es dos mas dos", "cual es la capital de francia",
+    "quien escribio el quijote", "que clima hace hoy", "cuentame un chiste", "que es la fotosintesis",
+)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # --build: precompute the trigger embeddings (offline)
+    # --bench: LLM calls avoided on the paraphrase corpus, fuzzy only vs fuzzy + semantic tier
+    import contextlib, io, sys, time
+    from config.settings import PATH_GENERAL_RAG
+    from llm.llm_data import GENERAL_RAG
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        rag = GENERAL_RAG(os.path.expanduser(PATH_GENERAL_RAG))
+    model_path = None
+    if SEMANTIC_RAG_ENCODER == "llm" and "--hashing" not in sys.argv:
+        from utils.utils import LoadModel
+        model_path = str(LoadModel().ensure_model("llm")[0])
+    embedder = HashingEmbedder() if "--hashing" in sys.argv else make_embedder(SEMANTIC_RAG_ENCODER, model_path)
+
+    t0 = time.perf_counter()
+    index = SemanticIndex.build(rag.items, embedder)
+    print(f"{len(index.answers)} triggers -> matriz {index.matrix.shape} float16 ({index.matrix.nbytes / 1024:.0f} KiB) "
+          f"en {time.perf_counter() - t0:.2f} s con {embedder.id}")
+    if "--build" in sys.argv:
+        index.save()
+        print(f"Guardado en {PATH_RAG_EMBEDDINGS}.npy/.json ✅")
+
+    if "--bench" in sys.argv:
+        tier = SemanticRAG(index, embedder)
+        with contextlib.redirect_stdout(io.StringIO()):
+            fuzzy = [rag.lookup(q).get("answer", "") for q, _ in PARAPHRASE_CORPUS]
+            rag.attach_semantic(tier)
+            both = [rag.lookup(q).get("answer", "") for q, _ in PARAPHRASE_CORPUS]
+            t0 = time.perf_counter()
+            off = [rag.lookup(q).get("answer", "") for q in OFF_TOPIC_CORPUS]
+            dt = (time.perf_counter() - t0) / len(OFF_TOPIC_CORPUS)
+        n = len(PARAPHRASE_CORPUS)
+        for label, answers in (("fuzzy", fuzzy), ("fuzzy + semántico", both)):
+            right = sum(a.startswith(exp) for a, (_, exp) in zip(answers, PARAPHRASE_CORPUS))
+            wrong = sum(bool(a) and not a.startswith(exp) for a, (_, exp) in zip(answers, PARAPHRASE_CORPUS))
+            print(f"{label:18s} respondidas {right}/{n} (erróneas {wrong}) -> llamadas al LLM {n - right - wrong}")
+        print(f"Fuera de la base aceptadas por error: {sum(bool(a) for a in off)}/{len(OFF_TOPIC_CORPUS)}, "
+              f"consulta fallida completa {1000.0 * dt:.2f} ms")
+
+        # Robot commands must not pay an embedding: the semantic tier only runs for clauses that would go to the LLM
+        from llm.llm_intentions import split_and_prioritize, PLAN_CACHE
+        PLAN_CACHE.max_entries = 0
+        calls, embed = [0], embedder.embed
+        def counted(texts):
+            calls[0] += 1
+            return embed(texts)
+        embedder.embed = counted
+        commands = ("ve a la cocina", "llévame a la enfermería y luego gira a la derecha", "¿cuál es tu batería?",
+                    "¿dónde estoy?", "¿qué hay cerca?", "cancela la navegación", "avanza dos metros")
+        with contextlib.redirect_stdout(io.StringIO()):
+            plans = [[a["kind"] for a in split_and_prioritize(c, rag)] for c in commands]
+        print(f"Embeddings en {len(commands)} órdenes al robot: {calls[0]} {'✅' if not calls[0] else '❌'} {plans}")
@@ -0,0 +1,413 @@
+"""
+Network serving mode: one on-site box runs LlmAgent and answers for several thin robots.
+
+HTTP (one request per connection, answers streamed as NDJSON lines):
+    POST /ask  {"text": "¿cuál es tu batería?", "session": "robot-1"}
+    POST /ask  Content-Type: audio/L16, X-Session: robot-1, body = PCM int16 mono 16 kHz (needs --stt)
+    GET  /health
+WebSocket (one request at a time per connection): a JSON text message {"text", "session"} or a binary PCM message.
+Both stream the same objects:
+    {"type": "queued"} {"type": "transcript", "text": ...} {"type": "answer", "kind": ..., "answer": ...}
+    {"type": "done", "ms": ...}  or  {"type": "error", "error": "busy" | "timeout" | ...}
+Nothing moves and no telemetry is read on the server: an answer that needs the robot carries an "action",
+run by the robot that asked (RemoteAgent):
+    {"type": "answer", "kind": "navigate", "answer": "Voy", "action": {"type": "goto", "simulate": false, "target": {...}}}
+    {"type": "answer", "kind": "navigate", "answer": "Avanzando", "action": {"type": "natural_move", "yaw": 1.57, "distance": 0.0, ...}}
+    {"type": "answer", "kind": "battery", "answer": "", "action": {"type": "battery"}}   (also "pose", "nearby", and "cancel")
+Run it with `python -m llm.llm_server [--stt]`, and `--load-test` to load-test a local server with a stand-in agent.
+"""
+from __future__ import annotations
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+import asyncio, json, logging, socket, time
+
+import requests
+import websockets
+
+from config.settings import (SERVER_HOST, SERVER_HTTP_PORT, SERVER_WS_PORT, SERVER_MAX_CONCURRENCY, SERVER_MAX_QUEUE,
+                             SERVER_REQUEST_TIMEOUT_S, SERVER_READ_TIMEOUT_S, SERVER_MAX_BODY_BYTES, LLM_SERVER_URL,
+                             USE_METRICS)
+from utils.tracing import TRACER
+from utils.metrics import METRICS, SECONDS_BUCKETS, MetricsServer
+
+QUEUE_WAIT = METRICS.histogram("octybot_server_queue_wait_seconds", "Wait of an admitted request for a worker (s)", SECONDS_BUCKETS)
+REQUEST_SECONDS = METRICS.histogram("octybot_server_request_seconds", "Time of a served request (s)", SECONDS_BUCKETS)
+
+Emit = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class AgentServer:
+    """
+    asyncio front of a (blocking) LlmAgent:
+    - at most `max_concurrency` requests run at once, each in a worker thread;
+    - up to `max_queue` more wait for a slot, past that new requests are refused at once ("busy", HTTP 503);
+    - every request has a deadline (`request_timeout`) covering the wait and the answer, and slow clients
+      get `read_timeout` to send their request and to take each streamed line (TCP backpressure).
+    A request whose deadline passes keeps its slot until its worker finishes: the slots track real CPU use.
+    """
+
+    def __init__(self, agent, stt=None, host: str = SERVER_HOST, http_port: int = SERVER_HTTP_PORT, ws_port: int = SERVER_WS_PORT,
+                 max_concurrency: int = SERVER_MAX_CONCURRENCY, max_queue: int = SERVER_MAX_QUEUE,
+                 request_timeout: float = SERVER_REQUEST_TIMEOUT_S, read_timeout: float = SERVER_READ_TIMEOUT_S,
+                 max_body: int = SERVER_MAX_BODY_BYTES):
+        self.log = logging.getLogger("Agent_Server")
+        self.agent = agent
+        self.stt = stt
+        self.host, self.http_port, self.ws_port = host, http_port, ws_port
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.request_timeout = request_timeout
+        self.read_timeout = read_timeout
+        self.max_body = max_body
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="AgentWorker")
+        self.running = 0
+        self.queued = 0
+        self.stats = {"served": 0, "rejected": 0, "timeouts": 0, "errors": 0}
+        self.latency_ms: deque = deque(maxlen=1000)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._http = None
+        self._ws = None
+        METRICS.collect("octybot_server_requests_total", "Requests to the agent server by outcome", "counter",
+                        lambda: [({"outcome": k}, v) for k, v in self.stats.items()], source="agent_server")
+        METRICS.collect("octybot_server_requests_in_flight", "Requests running or waiting", "gauge",
+                        lambda: [({"state": "running"}, self.running), ({"state": "queued"}, self.queued)], source="agent_server")
+
+    async def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._http = await asyncio.start_server(self._handle_http, self.host, self.http_port)
+        self._ws = await websockets.serve(self._handle_ws, self.host, self.ws_port, max_size=self.max_body)
+        self.http_port = self._http.sockets[0].getsockname()[1]
+        self.ws_port = next(iter(self._ws.sockets)).getsockname()[1]
+        self.log.info(f"Servidor del agente en http://{self.host}:{self.http_port} y ws://{self.host}:{self.ws_port} ✅")
+
+    async def close(self) -> None:
+        self._http.close()
+        self._ws.close()
+        await self._http.wait_closed()
+        await self._ws.wait_closed()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def health(self) -> Dict[str, Any]:
+        lat = sorted(self.latency_ms)
+        return {"ok": True, "running": self.running, "queued": self.queued, **self.stats,
+                "p50_ms": round(lat[len(lat) // 2], 1) if lat else None,
+                "p99_ms": round(lat[int(len(lat) * 0.99)], 1) if lat else None}
+
+    #------------- Requests -------------
+    def admit(self) -> bool:
+        """ Reserve a place in the queue, False (busy) if the running + waiting requests are at the limit """
+        if self.running + self.queued >= self.max_concurrency + self.max_queue:
+            self.stats["rejected"] += 1
+            return False
+        self.queued += 1
+        return True
+
+    def _work(self, text: Optional[str], pcm: Optional[bytes], session: Optional[str], put: Callable[[Any], None]) -> None:
+        TRACER.start_turn(source="server", session=session)
+        try:
+            if pcm is not None:
+                if self.stt is None:
+                    put({"type": "error", "error": "stt_desactivado"})
+                    return
+                text = self.stt.worker_lopp(pcm)
+                put({"type": "transcript", "text": text or ""})
+                if not text:
+                    return
+            for out in self.agent.ask_iter(text, session):
+                put({"type": "answer", **out})
+        except Exception as e:
+            self.stats["errors"] += 1
+            self.log.exception("Error atendiendo una petición")
+            put({"type": "error", "error": type(e).__name__, "msg": str(e)})
+        finally:
+            TRACER.end_turn()
+
+    async def run(self, text: Optional[str], pcm: Optional[bytes], session: Optional[str], emit: Emit) -> None:
+        """ Run one admitted request, streaming its results through `emit` """
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        deadline = t0 + self.request_timeout
+        try:
+            await asyncio.wait_for(self._slots.acquire(), deadline - loop.time())
+        except asyncio.TimeoutError:
+            self.queued -= 1
+            self.stats["timeouts"] += 1
+            await emit({"type": "error", "error": "timeout"})
+            return
+        self.queued -= 1
+        self.running += 1
+        QUEUE_WAIT.observe(loop.time() - t0)
+
+        q: asyncio.Queue = asyncio.Queue()
+        put = lambda item: loop.call_soon_threadsafe(q.put_nowait, item)
+
+        def release(_):
+            self.running -= 1
+            self._slots.release()
+
+        fut = loop.run_in_executor(self.executor, self._work, text, pcm, session, put)
+        fut.add_done_callback(lambda f: loop.call_soon_threadsafe(release, f))
+        fut.add_done_callback(lambda f: put(None))
+        try:
+            while True:
+                item = await asyncio.wait_for(q.get(), deadline - loop.time())
+                if item is None:
+                    break
+                await emit(item)
+            ms = 1000.0 * (loop.time() - t0)
+            self.latency_ms.append(ms)
+            REQUEST_SECONDS.observe(ms / 1000.0)
+            self.stats["served"] += 1
+            await emit({"type": "done", "ms": round(ms, 1)})
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            await emit({"type": "error", "error": "timeout"})
+
+    #------------- HTTP -------------
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.read_timeout)
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {k.strip().lower(): v.strip() for k, v in (l.split(":", 1) for l in lines[1:] if ":" in l)}
+            length = int(headers.get("content-length", 0))
+            if length > self.max_body:
+                return await self._reply(writer, 413, {"error": "cuerpo_demasiado_grande"})
+            body = await asyncio.wait_for(reader.readexactly(length), self.read_timeout) if length else b""
+
+            if method == "GET" and path == "/health":
+                return await self._reply(writer, 200, self.health())
+            if method != "POST" or path != "/ask":
+                return await self._reply(writer, 404, {"error": "no_encontrado"})
+
+            if headers.get("content-type", "").startswith("audio/"):
+                text, pcm, session = None, body, headers.get("x-session")
+            else:
+                req = json.loads(body or b"{}")
+                text, pcm, session = str(req.get("text") or "").strip(), None, req.get("session")
+                if not text:
+                    return await self._reply(writer, 400, {"error": "sin_texto"})
+            if not self.admit():
+                return await self._reply(writer, 503, {"type": "error", "error": "busy"}, {"Retry-After": "1"})
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\n"
+                         b"Transfer-Encoding: chunked\r\nConnection: close\r\n\r\n")
+
+            async def emit(obj: Dict[str, Any]) -> None:
+                line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+                writer.write(b"%x\r\n%s\r\n" % (len(line), line))
+                await asyncio.wait_for(writer.drain(), self.read_timeout)
+
+            await emit({"type": "queued", "ahead": self.running + self.queued - 1})
+            await self.run(text, pcm, session, emit)
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            self.log.debug(f"Cliente HTTP descartado: {type(e).__name__}")
+        finally:
+            writer.close()
+
+    async def _reply(self, writer: asyncio.StreamWriter, status: int, obj: Dict[str, Any], extra: Dict[str, str] | None = None) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 503: "Service Unavailable"}[status]
+        head = f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        head += "".join(f"{k}: {v}\r\n" for k, v in (extra or {}).items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await asyncio.wait_for(writer.drain(), self.read_timeout)
+
+    #------------- WebSocket -------------
+    async def _handle_ws(self, ws) -> None:
+        default_session = f"ws-{id(ws)}"
+        try:
+            async for msg in ws:
+                async def emit(obj: Dict[str, Any]) -> None:
+                    await asyncio.wait_for(ws.send(json.dumps(obj, ensure_ascii=False)), self.read_timeout)
+
+                if isinstance(msg, bytes):
+                    text, pcm, session = None, msg, default_session
+                else:
+                    try:
+                        req = json.loads(msg)
+                    except ValueError:
+                        req = {"text": msg}
+                    text, pcm = str(req.get("text") or "").strip(), None
+                    session = req.get("session", default_session)
+                    if not text:
+                        await emit({"type": "error", "error": "sin_texto"})
+                        continue
+                if not self.admit():
+                    await emit({"type": "error", "error": "busy"})
+                    continue
+                await emit({"type": "queued", "ahead": self.running + self.queued - 1})
+                await self.run(text, pcm, session, emit)
+        except (websockets.ConnectionClosed, asyncio.TimeoutError):
+            pass
+
+
+class RemoteAgent:
+    """
+    Thin client of AgentServer with the interface of LlmAgent (`ask(text) -> List[str]`), for OctybotAgent
+    on a robot without a local LLM. Every robot uses its own session (its hostname by default).
+    The actions streamed back (moves, telemetry questions) run here, with this robot's GetInfo.
+    """
+
+    def __init__(self, url: str = LLM_SERVER_URL, session: str | None = None, timeout: float = SERVER_REQUEST_TIMEOUT_S):
+        self.log = logging.getLogger("Remote_Agent")
+        self.url = url.rstrip("/")
+        self.session_id = session or socket.gethostname()
+        self.timeout = timeout
+        self.http = requests.Session()
+        self._router = None
+
+    @property
+    def router(self):
+        """ Router + GetInfo of this robot (no LLM), created on the first action """
+        if self._router is None:
+            from llm.llm_tools import GetInfo
+            from llm.llm_router import Router
+            self._router = Router(None, GetInfo())
+        return self._router
+
+    def run_action(self, ev: Dict[str, Any]) -> str:
+        """ Run the action of an answer on this robot, returns the text to speak """
+        action = ev.get("action")
+        if not action:
+            return ev["answer"]
+        kind = action.get("type")
+        if kind in ("battery", "pose", "nearby"):
+            return self.router.handle(None, kind)
+        info = self.router.get_info
+        try:
+            if kind == "goto":
+                info.publish_nav_cmd(action.get("target") or {}, bool(action.get("simulate")))
+            elif kind == "natural_move": #already clamped and in radians on the server
+                info.publish_natural_move(action.get("yaw", 0.0), action.get("distance", 0.0), False)
+            elif kind == "cancel":
+                info.tool_cancel_navigation()
+            else:
+                self.log.warning(f"Acción desconocida del servidor: {action}")
+        except Exception:
+            self.log.exception(f"Error ejecutando la acción {kind}")
+        return ev["answer"]
+
+    def _stream(self, **kwargs) -> Iterator[Dict[str, Any]]:
+        try:
+            with self.http.post(f"{self.url}/ask", stream=True, timeout=(3.0, self.timeout), **kwargs) as r:
+                if r.status_code == 503:
+                    yield {"type": "error", "error": "busy"}
+                    return
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if line:
+                        yield json.loads(line)
+        except (requests.RequestException, ValueError) as e:
+            self.log.warning(f"Servidor del agente no disponible: {e}")
+            yield {"type": "error", "error": "sin_conexion"}
+
+    def ask_iter(self, text: str, session: str | None = None) -> Iterator[Dict[str, Any]]:
+        yield from self._stream(json={"text": text, "session": session or self.session_id})
+
+    def ask(self, text: str, session: str | None = None) -> List[str]:
+        return self._answers(self.ask_iter(text, session))
+
+    def ask_audio(self, pcm: bytes, session: str | None = None) -> List[str]:
+        """ Send the raw PCM (int16 mono 16 kHz) and let the server transcribe it """
+        return self._answers(self._stream(data=pcm, headers={"Content-Type": "audio/L16; rate=16000",
+                                                             "X-Session": session or self.session_id}))
+
+    def _answers(self, events: Iterator[Dict[str, Any]]) -> List[str]:
+        outs = []
+        for ev in events:
+            if ev.get("type") == "answer":
+                outs.append(self.run_action(ev))
+            elif ev.get("type") == "error":
+                self.log.warning(f"Error del servidor: {ev}")
+                outs.append("Lo siento, el servidor está ocupado." if ev.get("error") in ("busy", "timeout")
+                            else "No me puedo conectar con el servidor.")
+        return outs
+
+
+class StubAgent:
+    """ Stand-in agent for the load test: every clause takes `ms` of blocking work, like a short LLM answer """
+
+    def __init__(self, ms: float = 50.0):
+        self.ms = ms
+
+    def ask_iter(self, text: str, session: str | None = None) -> Iterator[Dict[str, str]]:
+        for clause in text.split(" y "):
+            time.sleep(self.ms / 1000.0)
+            yield {"kind": "general", "answer": f"respuesta a {clause!r}"}
+
+
+async def load_test(server: AgentServer, clients: int, requests_per_client: int) -> Dict[str, Any]:
+    """ `clients` WebSocket clients send requests back to back, measuring latency and outcomes """
+    url = f"ws://127.0.0.1:{server.ws_port}"
+    lat: List[float] = []
+    outcome = {"done": 0, "busy": 0, "timeout": 0}
+
+    async def client(i: int) -> None:
+        async with websockets.connect(url) as ws:
+            for j in range(requests_per_client):
+                t0 = time.perf_counter()
+                await ws.send(json.dumps({"text": f"pregunta {j} del robot {i} y otra mas", "session": f"robot-{i}"}))
+                while True:
+                    ev = json.loads(await ws.recv())
+                    if ev["type"] == "done":
+                        outcome["done"] += 1
+                        lat.append(1000.0 * (time.perf_counter() - t0))
+                        break
+                    if ev["type"] == "error":
+                        outcome["busy" if ev["error"] == "busy" else "timeout"] += 1
+                        await asyncio.sleep(0.05)
+                        break
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    wall = time.perf_counter() - t0
+    lat.sort()
+    return {"clients": clients, **outcome, "req/s": round(outcome["done"] / wall, 1),
+            "p50_ms": round(lat[len(lat) // 2], 1) if lat else None, "p99_ms": round(lat[int(len(lat) * 0.99)], 1) if lat else None}
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    import sys
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+    logging.getLogger("websockets").setLevel(logging.WARNING)
+
+    if "--load-test" in sys.argv:
+        # Stand-in agent (2 clauses x 50 ms per request), 2 workers and a queue of 8: throughput, latency
+        # and refused requests as the number of robots grows
+        async def main():
+            server = AgentServer(StubAgent(50.0), host="127.0.0.1", http_port=0, ws_port=0, request_timeout=5.0)
+            await server.start()
+            for clients in (1, 2, 4, 8, 16, 32):
+                print(await load_test(server, clients, 10))
+            r = await asyncio.to_thread(RemoteAgent(f"http://127.0.0.1:{server.http_port}").ask, "hola y adios")
+            print(f"Cliente HTTP (RemoteAgent): {r}")
+            print(f"Salud: {server.health()}")
+            await server.close()
+        asyncio.run(main())
+        exit(0)
+
+    from utils.utils import LoadModel
+    from llm.llm import LlmAgent
+    model = LoadModel()
+    agent = LlmAgent(model_path=str(model.ensure_model("llm")[0]), remote=True)
+    stt = None
+    if "--stt" in sys.argv:
+        from stt.speech_to_text import SpeechToText
+        stt = SpeechToText(str(model.ensure_model("stt")[0]), "small")
+
+    async def serve():
+        server = AgentServer(agent, stt)
+        await server.start()
+        if USE_METRICS:
+            MetricsServer().start()
+        await asyncio.Future()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print(" Saliendo")
@@ -0,0 +1,253 @@
+from __future__ import annotations
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+import ctypes, logging, threading, time
+
+from config.settings import (SESSION_MAX_TOKENS, SESSION_EVICTION, SESSION_KEEP_RATIO, SESSION_IDLE_S,
+                             SESSION_MAX_SESSIONS, SESSION_SAVE_STATE)
+from config.llm_system_prompt_def import GENERAL_SYSTEM_PROMPT
+
+#Conversation of the request being handled, set by LlmAgent.ask() (None = stateless answer)
+CURRENT_SESSION: ContextVar[Optional[str]] = ContextVar("CURRENT_SESSION", default=None)
+
+
+@dataclass
+class Turn:
+    user: str
+    answer: str
+    ids: List[int] = field(default_factory=list) #exact tokens this turn added to the context, empty until tokenized
+
+
+@dataclass
+class SeqState:
+    """ KV cache of sequence 0 only (no logits, no scores): ~36 KB per token on Qwen2.5-3B """
+    n_tokens: int
+    data: Any #ctypes byte array
+
+    @property
+    def mb(self) -> float:
+        return len(self.data) / 2**20
+
+
+def save_seq_state(llm) -> Optional[SeqState]:
+    """
+    Copy the KV of sequence 0 of a llama_cpp.Llama. Llama.save_state() would also copy the scores
+    (n_batch x n_vocab floats, ~300 MB with a 152k vocabulary) and the whole context buffer.
+    """
+    import llama_cpp
+    ctx = llm._ctx.ctx
+    size = llama_cpp.llama_state_seq_get_size(ctx, 0)
+    if not size:
+        return None
+    buf = (ctypes.c_uint8 * size)()
+    n = llama_cpp.llama_state_seq_get_data(ctx, buf, size, 0)
+    return SeqState(llm.n_tokens, buf) if n == size else None
+
+
+def load_seq_state(llm, state: SeqState, ids: List[int]) -> bool:
+    """ Restore sequence 0 from `state`, whose tokens are `ids`; False if llama.cpp refused it """
+    import llama_cpp
+    if not llama_cpp.llama_state_seq_set_data(llm._ctx.ctx, state.data, len(state.data), 0):
+        llm.n_tokens = 0
+        return False
+    llm.input_ids[:len(ids)] = ids
+    llm.n_tokens = len(ids)
+    return True
+
+
+def common_prefix(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+class ChatSession:
+    """
+    One conversation kept inside llama.cpp's context (ChatML, the template of the Qwen models).
+    - The tokens of every turn are stored exactly as they were evaluated and never re-tokenized, so each
+      new turn shares the whole previous conversation as prefix and only its own tokens are evaluated.
+    - If another prompt used the context meanwhile, the KV state saved after the last turn is restored
+      instead of evaluating the transcript again (SESSION_SAVE_STATE). Only the KV of the sequence is kept,
+      a few MB per conversation (`state_mb` in the stats).
+    - Over `max_tokens`, the oldest turns are dropped until the conversation is back to `keep_ratio`
+      of the budget (evicting in one go, the re-evaluation it causes is paid once every few turns);
+      with eviction "summary" their questions stay as a short line of the system prompt.
+    - Turns answered by another model (the small tier) are `record()`ed as text and tokenized by the next `ask()`.
+    """
+
+    def __init__(self, system: str = GENERAL_SYSTEM_PROMPT, max_tokens: int = SESSION_MAX_TOKENS,
+                 eviction: str = SESSION_EVICTION, keep_ratio: float = SESSION_KEEP_RATIO,
+                 save_state: bool = SESSION_SAVE_STATE):
+        self.log = logging.getLogger("LLM_Session")
+        self.system = system
+        self.max_tokens = max_tokens
+        self.eviction = eviction
+        self.keep_ratio = keep_ratio
+        self.save_state = save_state
+        self.turns: List[Turn] = []
+        self.summary: List[str] = []
+        self._sys_ids: Optional[List[int]] = None
+        self._state: Optional[SeqState] = None
+        self.last_used = time.monotonic()
+        self.stats: List[Dict[str, Any]] = []
+
+    def tokens(self) -> List[int]:
+        return self._sys_ids + [t for turn in self.turns for t in turn.ids]
+
+    def _system_ids(self, llm) -> List[int]:
+        if self._sys_ids is None:
+            system = self.system
+            if self.summary:
+                system += " Antes, el usuario preguntó: " + "; ".join(self.summary) + "."
+            self._sys_ids = llm.tokenize(f"<|im_start|>system\n{system}<|im_end|>\n".encode("utf-8"), add_bos=False, special=True)
+        return self._sys_ids
+
+    def _evict(self, llm, incoming: int, answer_tokens: int) -> int:
+        """ Drop the oldest turns if the next one does not fit, returns how many were dropped """
+        if len(self._system_ids(llm)) + sum(len(t.ids) for t in self.turns) + incoming + answer_tokens <= self.max_tokens:
+            return 0
+        target, dropped = self.keep_ratio * self.max_tokens, 0
+        while self.turns and len(self._sys_ids) + sum(len(t.ids) for t in self.turns) + incoming + answer_tokens > target:
+            turn = self.turns.pop(0)
+            dropped += 1
+            if self.eviction == "summary":
+                self.summary = (self.summary + [turn.user[:80]])[-6:]
+        self._sys_ids = None #the system prompt changes with the summary, and the prefix with the turns
+        self._system_ids(llm)
+        self._state = None
+        return dropped
+
+    def record(self, text: str, answer: str) -> None:
+        """ Add a turn answered outside this context, so the follow-ups see it """
+        self.turns.append(Turn(text, answer))
+        self.last_used = time.monotonic()
+
+    def ask(self, llm, text: str, max_tokens: int = 100, temp: float = 0.2, top_p: float = 0.9) -> str:
+        """ Answer `text` in this conversation with the llama_cpp.Llama `llm` (the caller holds its lock) """
+        stop = {llm.token_eos(), *llm.tokenize(b"<|im_end|>", add_bos=False, special=True)}
+        for turn in self.turns:
+            if not turn.ids: #recorded turn, evaluated below with the rest of the new tokens
+                turn.ids = llm.tokenize(f"<|im_start|>user\n{turn.user}<|im_end|>\n<|im_start|>assistant\n"
+                                        f"{turn.answer}<|im_end|>\n".encode("utf-8"), add_bos=False, special=True)
+        user_ids = llm.tokenize(f"<|im_start|>user\n{text}<|im_end|>\n<|im_start|>assistant\n".encode("utf-8"),
+                                add_bos=False, special=True)
+        dropped = self._evict(llm, len(user_ids), max_tokens)
+        history = self.tokens()
+
+        restored = False
+        cached = common_prefix(llm.input_ids[:llm.n_tokens], history)
+        if cached < len(history) and self._state is not None and self._state.n_tokens == len(history):
+            restored = load_seq_state(llm, self._state, history)
+            cached = len(history) if restored else 0
+        prompt = history + user_ids
+        n_eval = len(prompt) - min(cached, len(prompt) - 1)
+
+        t0 = time.perf_counter()
+        first: float | None = None
+        out: List[int] = []
+        for tok in llm.generate(prompt, temp=temp, top_p=top_p, repeat_penalty=1.0):
+            if first is None:
+                first = time.perf_counter() - t0
+            if tok in stop or len(out) >= max_tokens:
+                break
+            out.append(tok)
+        answer = llm.detokenize(out).decode("utf-8", errors="ignore").strip()
+
+        end_ids = llm.tokenize(b"<|im_end|>\n", add_bos=False, special=True)
+        self.turns.append(Turn(text, answer, user_ids + out + end_ids))
+        #Evaluate the end of the turn now (drafted tokens past the answer are discarded), the next turn
+        #then starts right at its own tokens
+        full = self.tokens()
+        llm.n_tokens = common_prefix(llm.input_ids[:llm.n_tokens], full)
+        if llm.n_tokens < len(full):
+            llm.eval(full[llm.n_tokens:])
+        save_ms = 0.0
+        if self.save_state:
+            t_save = time.perf_counter()
+            self._state = save_seq_state(llm)
+            save_ms = 1000.0 * (time.perf_counter() - t_save)
+        self.last_used = time.monotonic()
+        self.stats.append({"turn": len(self.stats) + 1, "context": len(prompt), "eval_tokens": n_eval, "restored": restored,
+                           "state_mb": round(self._state.mb, 2) if self._state is not None else 0.0, "save_ms": round(save_ms, 1),
+                           "dropped": dropped, "prompt_ms": round(1000.0 * (first or 0.0), 1),
+                           "total_ms": round(1000.0 * (time.perf_counter() - t0), 1), "answer_tokens": len(out)})
+        return answer
+
+
+class SessionStore:
+    """ Conversations by id (e.g. "local" for the robot itself, one per client in server mode), LRU + idle expiry """
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, idle_s: float = SESSION_IDLE_S):
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ChatSession:
+        """ The conversation of `session_id`, a new one if it did not exist or was idle too long """
+        now = time.monotonic()
+        with self._lock:
+            s = self._sessions.pop(session_id, None)
+            if s is None or now - s.last_used > self.idle_s:
+                s = ChatSession()
+            self._sessions[session_id] = s
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+            return s
+
+    def has_history(self, session_id: Optional[str]) -> bool:
+        with self._lock:
+            s = self._sessions.get(session_id) if session_id is not None else None
+            return s is not None and bool(s.turns) and time.monotonic() - s.last_used <= self.idle_s
+
+    def drop(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+#A conversation with follow-ups that only make sense with the previous turns
+FOLLOW_UP_CONVERSATION = (
+    "¿Quién fue Benito Juárez?",
+    "¿Y cuándo nació?",
+    "¿En qué estado?",
+    "¿Qué leyes impulsó?",
+    "¿Y quién fue su sucesor?",
+    "¿Cuántos años gobernó ese sucesor?",
+    "Resume en una frase todo lo que me dijiste.",
+    "¿Qué otro presidente de esa época me recomiendas conocer?",
+    "¿Por qué?",
+    "Gracias, ¿y cuál es la capital de ese estado que mencionaste?",
+)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Prompt-eval time per turn as the conversation grows: incremental session vs re-evaluating the transcript
+    import sys
+    from utils.utils import LoadModel
+    from llm.llm_client import LLM
+
+    llm = LLM(model_path=str(LoadModel().ensure_model("llm")[0]))
+    turns = int(sys.argv[sys.argv.index("--turns") + 1]) if "--turns" in sys.argv else len(FOLLOW_UP_CONVERSATION)
+    questions = [FOLLOW_UP_CONVERSATION[i % len(FOLLOW_UP_CONVERSATION)] for i in range(turns)]
+
+    for label, incremental in (("sesión incremental", True), ("transcripción completa", False)):
+        session = ChatSession()
+        with llm.using():
+            for q in questions:
+                if not incremental:
+                    llm._llm.reset() #forget the KV cache: the whole transcript is evaluated again
+                    session._state = None
+                answer = session.ask(llm._llm, q)
+                st = session.stats[-1]
+                print(f"{label:22s} turno {st['turn']:2d}: contexto {st['context']:4d} tok, evaluados {st['eval_tokens']:4d}, "
+                      f"prompt {st['prompt_ms']:7.1f} ms, total {st['total_ms']:7.1f} ms, "
+                      f"estado {st['state_mb']:.1f} MB en {st['save_ms']:.1f} ms"
+                      f"{', descartados ' + str(st['dropped']) if st['dropped'] else ''} | {answer[:60]!r}")
+        ms = [s["prompt_ms"] for s in session.stats]
+        print(f"{label:22s} prompt medio {sum(ms) / len(ms):.1f} ms, último {ms[-1]:.1f} ms\n")
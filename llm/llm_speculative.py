@@ -0,0 +1,172 @@
+from __future__ import annotations
+from typing import List, Optional
+import logging, os
+import numpy as np
+from llama_cpp import Llama
+from llama_cpp.llama_speculative import LlamaDraftModel, LlamaPromptLookupDecoding
+
+from config.settings import (CONTEXT_LLM, THREADS_LLM, N_BACH_LLM, SPECULATIVE_LLM,
+                             SPECULATIVE_NUM_PRED_TOKENS, SPECULATIVE_NGRAM_SIZE)
+
+
+def last_logits(llm: Llama) -> np.ndarray:
+    """
+    Logits of the last evaluated token, straight from the llama.cpp context (a view, copy it to keep it).
+    `llm.scores` is only filled when the model is built with logits_all=True, which costs n_ctx x n_vocab floats.
+    """
+    return np.ctypeslib.as_array(llm._ctx.get_logits(), shape=(llm.n_vocab(),))
+
+
+class GgufDraftModel(LlamaDraftModel):
+    """
+    Draft tokens from a small GGUF of the same family (same tokenizer, e.g. Qwen2.5-0.5B for Qwen2.5-3B),
+    greedy. The draft keeps its own KV cache: only the tokens after the common prefix with the last call
+    are evaluated, so every round costs the accepted tokens plus `num_pred_tokens` small decode steps.
+    """
+
+    def __init__(self, model_path: str, num_pred_tokens: int = SPECULATIVE_NUM_PRED_TOKENS,
+                 n_ctx: int = CONTEXT_LLM, threads: int = THREADS_LLM):
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Modelo borrador no encontrado: {model_path}")
+        self.num_pred_tokens = num_pred_tokens
+        self._llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=threads, n_batch=N_BACH_LLM,
+                          n_gpu_layers=0, use_mmap=True, use_mlock=False, verbose=False)
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        llm = self._llm
+        ids = [int(t) for t in input_ids]
+        n_room = llm.n_ctx() - len(ids)
+        if n_room <= 1:
+            return np.array([], dtype=np.intc)
+
+        #Reuse the cached prefix, eval() drops the KV cache after n_tokens
+        prefix, cached = 0, llm.input_ids[:llm.n_tokens]
+        for a, b in zip(cached, ids):
+            if a != b:
+                break
+            prefix += 1
+        llm.n_tokens = min(prefix, len(ids) - 1)
+        llm.eval(ids[llm.n_tokens:])
+
+        draft: List[int] = []
+        for _ in range(min(self.num_pred_tokens, n_room - 1)):
+            tok = int(np.argmax(last_logits(llm)))
+            if tok == llm.token_eos():
+                break
+            draft.append(tok)
+            llm.eval([tok])
+        return np.array(draft, dtype=np.intc)
+
+
+class DraftStats(LlamaDraftModel):
+    """
+    Wrap a draft model and count proposed vs accepted tokens.
+    llama.cpp keeps the accepted draft plus one sampled token, so the accepted count of a round
+    is how much the sequence grew until the next call, minus one.
+    """
+
+    def __init__(self, draft: LlamaDraftModel):
+        self.draft = draft
+        self.reset()
+
+    def reset(self) -> None:
+        self.rounds = 0
+        self.proposed = 0
+        self.accepted = 0
+        self._last_len: Optional[int] = None
+        self._last_n = 0
+
+    def _close_round(self, n_ids: int) -> None:
+        if self._last_len is not None and n_ids > self._last_len:
+            self.accepted += max(0, min(self._last_n, n_ids - self._last_len - 1))
+        self._last_len = None
+
+    def end(self, n_ids: int) -> None:
+        """ Close the last round of a completion, `n_ids` = prompt + generated tokens """
+        self._close_round(n_ids)
+
+    def __call__(self, input_ids: np.ndarray, /, **kwargs) -> np.ndarray:
+        self._close_round(len(input_ids))
+        out = self.draft(input_ids, **kwargs)
+        self.rounds += 1
+        self.proposed += len(out)
+        self._last_len, self._last_n = len(input_ids), len(out)
+        return out
+
+    @property
+    def acceptance(self) -> float:
+        return self.accepted / self.proposed if self.proposed else 0.0
+
+
+def make_draft_model(mode: str = SPECULATIVE_LLM, draft_path: str | None = None) -> Optional[LlamaDraftModel]:
+    """ "off" -> None, "prompt_lookup" -> n-gram drafting from the prompt, "draft" -> small GGUF draft """
+    mode = (mode or "off").strip()
+    if mode == "prompt_lookup":
+        return LlamaPromptLookupDecoding(max_ngram_size=SPECULATIVE_NGRAM_SIZE, num_pred_tokens=SPECULATIVE_NUM_PRED_TOKENS)
+    if mode == "draft":
+        if not draft_path:
+            raise ValueError("SPECULATIVE_LLM='draft' necesita un modelo en la sección llm_draft de models.yml")
+        return GgufDraftModel(draft_path)
+    if mode != "off":
+        logging.getLogger("LLM").warning(f"SPECULATIVE_LLM desconocido: {mode!r}, se desactiva")
+    return None
+
+
+#General questions that reach answer_general (not in GENERAL_RAG, no robot intent)
+QUESTION_CORPUS = (
+    "¿Cuándo fue la Independencia de México?",
+    "¿Quién escribió Don Quijote de la Mancha?",
+    "¿Cuál es la capital de Francia y cuántos habitantes tiene?",
+    "Cuéntame un chiste corto sobre robots.",
+    "¿Qué es la inteligencia artificial?",
+    "¿Por qué el cielo es azul?",
+    "¿Cuántos planetas tiene el sistema solar?",
+    "¿Qué es la fotosíntesis?",
+    "Dame tres consejos para dormir mejor.",
+    "¿Quién fue Benito Juárez?",
+    "¿Cuál es el río más largo del mundo?",
+    "Explica qué es un robot autónomo en una frase.",
+)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Benchmark: tokens/s of answer_general on QUESTION_CORPUS without and with speculative decoding
+    # python -m llm.llm_speculative [--modes off,prompt_lookup,draft] [--repeat N]
+    import sys, time
+    from utils.utils import LoadModel
+    from llm.llm_client import LLM
+
+    args = sys.argv[1:]
+    modes = args[args.index("--modes") + 1].split(",") if "--modes" in args else ["off", "prompt_lookup", "draft"]
+    repeat = int(args[args.index("--repeat") + 1]) if "--repeat" in args else 1
+    loader = LoadModel()
+    model_path = str(loader.ensure_model("llm")[0])
+
+    for mode in modes:
+        draft_path = None
+        if mode == "draft":
+            drafts = loader.extract_section_models("llm_draft")
+            if not drafts:
+                print("draft: no hay modelos en la sección llm_draft de models.yml, se omite")
+                continue
+            draft_path = str(loader.ensure_model("llm_draft")[0])
+        llm = LLM(model_path=model_path, draft_path=draft_path, speculative=mode)
+        llm.ensure()
+        llm.answer_general("Hola") #warm-up
+        if llm.draft_stats is not None:
+            llm.draft_stats.reset()
+
+        tokens, elapsed = 0, 0.0
+        for _ in range(repeat):
+            for q in QUESTION_CORPUS:
+                t0 = time.perf_counter()
+                llm.answer_general(q)
+                elapsed += time.perf_counter() - t0
+                tokens += llm.last_usage.get("completion_tokens", 0)
+        line = f"{mode:14s} {tokens / elapsed:6.1f} tok/s ({tokens} tokens en {elapsed:.1f} s)"
+        if llm.draft_stats is not None:
+            s = llm.draft_stats
+            line += f", borrador aceptado {s.accepted}/{s.proposed} ({100.0 * s.acceptance:.0f}%) en {s.rounds} rondas"
+        print(line)
+        del llm
@@ -0,0 +1,156 @@
+from __future__ import annotations
+from typing import Dict, Any, Optional, NamedTuple
+import json, logging, socket, threading, time
+
+from config.settings import TELEMETRY_STALE_S, TELEMETRY_UDP_HOST, TELEMETRY_UDP_PORT, TELEMETRY_ROS_BATTERY_TOPIC, TELEMETRY_ROS_POSE_TOPIC
+from llm.llm_data import Battery, Pose
+
+
+class Sample(NamedTuple):
+    value: Any
+    stamp: float | None #time.monotonic() of the update, None = set by hand (never stale)
+
+
+class TelemetryStore:
+    """
+    Latest battery and pose of the robot.
+    Writers replace an immutable `Sample` (a single reference assignment, atomic in CPython), so
+    readers never take a lock and never wait for the ingestion thread.
+    """
+
+    def __init__(self, stale_s: float = TELEMETRY_STALE_S):
+        self.stale_s = stale_s
+        self._battery: Optional[Sample] = None
+        self._pose: Optional[Sample] = None
+        self.updates = 0
+
+    def update_battery(self, percentage: float | None, manual: bool = False) -> None:
+        self._battery = Sample(Battery(percentage=percentage), None if manual else time.monotonic())
+        self.updates += 1
+
+    def update_pose(self, x: float, y: float, yaw: float = 0.0, frame_id: str = "map") -> None:
+        self._pose = Sample(Pose(x=float(x), y=float(y), yaw=float(yaw), frame_id=frame_id, name="robot"), time.monotonic())
+        self.updates += 1
+
+    def age(self, sample: Optional[Sample]) -> float | None:
+        if sample is None or sample.stamp is None:
+            return None
+        return time.monotonic() - sample.stamp
+
+    def is_stale(self, sample: Optional[Sample]) -> bool:
+        age = self.age(sample)
+        return age is not None and age > self.stale_s
+
+    def battery(self) -> Optional[Sample]:
+        return self._battery
+
+    def pose(self) -> Optional[Sample]:
+        return self._pose
+
+    def ingest(self, msg: Dict[str, Any]) -> None:
+        """ Apply one telemetry message: {"battery": 0.84} and/or {"pose": {"x", "y", "yaw", "frame_id"}} """
+        if "battery" in msg:
+            self.update_battery(msg["battery"])
+        pose = msg.get("pose")
+        if isinstance(pose, dict) and "x" in pose and "y" in pose:
+            self.update_pose(pose["x"], pose["y"], pose.get("yaw", 0.0), pose.get("frame_id", "map"))
+
+
+class UdpTelemetryListener(threading.Thread):
+    """ Stand-in feed: JSON datagrams (see `TelemetryStore.ingest`) received on a local UDP port """
+
+    def __init__(self, store: TelemetryStore, host: str = TELEMETRY_UDP_HOST, port: int = TELEMETRY_UDP_PORT):
+        super().__init__(name="TelemetryUDP", daemon=True)
+        self.log = logging.getLogger("Telemetry")
+        self.store = store
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.errors = 0
+
+    def run(self) -> None:
+        self.log.info(f"Telemetría UDP escuchando en el puerto {self.port}")
+        while True:
+            try:
+                data, _ = self.sock.recvfrom(4096)
+            except OSError:
+                break
+            try:
+                self.store.ingest(json.loads(data))
+            except (ValueError, TypeError, AttributeError):
+                self.errors += 1
+
+    def close(self) -> None:
+        self.sock.close()
+
+
+def start_ros2_telemetry(store: TelemetryStore,
+                         battery_topic: str = TELEMETRY_ROS_BATTERY_TOPIC, pose_topic: str = TELEMETRY_ROS_POSE_TOPIC):
+    """
+    Subscribe to sensor_msgs/BatteryState and geometry_msgs/PoseWithCovarianceStamped (e.g. /amcl_pose)
+    and spin the node in a daemon thread. Requires a sourced ROS 2 environment (rclpy).
+    """
+    import math
+    import rclpy
+    from rclpy.node import Node
+    from sensor_msgs.msg import BatteryState
+    from geometry_msgs.msg import PoseWithCovarianceStamped
+
+    if not rclpy.ok():
+        rclpy.init()
+    node = Node("octybot_telemetry")
+
+    def on_battery(msg):
+        store.update_battery(msg.percentage)
+
+    def on_pose(msg):
+        p, q = msg.pose.pose.position, msg.pose.pose.orientation
+        yaw = math.degrees(math.atan2(2.0 * (q.w * q.z + q.x * q.y), 1.0 - 2.0 * (q.y * q.y + q.z * q.z)))
+        store.update_pose(p.x, p.y, yaw, msg.header.frame_id or "map")
+
+    node.create_subscription(BatteryState, battery_topic, on_battery, 10)
+    node.create_subscription(PoseWithCovarianceStamped, pose_topic, on_pose, 10)
+    threading.Thread(target=rclpy.spin, args=(node,), name="TelemetryROS2", daemon=True).start()
+    return node
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Benchmark: paced UDP feed at increasing rates while a reader polls the store as fast as it can
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+
+    store = TelemetryStore()
+    listener = UdpTelemetryListener(store, "127.0.0.1", 0)
+    listener.start()
+    tx = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    msgs = [json.dumps({"battery": (i % 100) / 100.0, "pose": {"x": i * 0.001, "y": 0.0, "yaw": 0.0}}).encode() for i in range(1000)]
+
+    for rate in (100, 1_000, 5_000, 20_000):
+        stop = threading.Event()
+        lat = []
+
+        def reader():
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                store.battery(), store.pose()
+                lat.append(time.perf_counter() - t0)
+
+        threading.Thread(target=reader, daemon=True).start()
+        before, n, t0 = store.updates, rate, time.perf_counter()
+        for i in range(n):
+            tx.sendto(msgs[i % 1000], ("127.0.0.1", listener.port))
+            delay = t0 + (i + 1) / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        time.sleep(0.1)
+        stop.set()
+        age = store.age(store.battery())
+        applied = (store.updates - before) // 2
+        lat.sort()
+        print(f"{rate:>6} msg/s: aplicados {applied}/{n} ({100.0 * applied / n:.1f}%), "
+              f"lectura p50 {1e6 * lat[len(lat) // 2]:.2f} µs, p99 {1e6 * lat[int(len(lat) * 0.99)]:.2f} µs, "
+              f"edad tras 100 ms sin datos {1000.0 * age:.0f} ms")
+        time.sleep(0.2)
+    store.stale_s = 0.1
+    print(f"Feed detenido, ¿lectura desactualizada? {store.is_stale(store.battery())} ✅")
@@ -0,0 +1,228 @@
+from __future__ import annotations
+from typing import Any, Dict, List, Optional, Tuple
+import logging, math, os, re, threading, time
+import numpy as np
+
+from config.settings import (CONTEXT_LLM, THREADS_LLM, N_BACH_LLM, GPU_LAYERS_LLM,
+                             TIER_SMALL_MAX_SCORE, TIER_MIN_CONFIDENCE)
+from config.llm_system_prompt_def import GENERAL_SYSTEM_PROMPT
+from llm.llm_intentions import utterance
+from utils.memory import Reloadable
+from llm.llm_session import CURRENT_SESSION
+from utils.tracing import TRACER
+
+#Cues of questions that need reasoning or a long answer (normalized text: no accents, lowercase)
+_REASONING_RE = re.compile(
+    r"\b(explica\w*|por ?que|como funciona\w*|diferencias?|compara\w*|ventajas|desventajas|analiza\w*|describe|"
+    r"resume\w*|resumen|historia|opina\w*|opinion|recomienda\w*|consejos?|escribe|redacta|cuento|poema|"
+    r"demuestra|calcula\w*|traduce|pasos|ejemplos?)\b")
+_INTERROGATIVE_RE = re.compile(r"\b(que|quien|quienes|cuando|donde|cual|cuales|cuanto|cuanta|cuantos|cuantas|como|por que)\b")
+_ARITHMETIC_RE = re.compile(r"\b\d+(?:[.,]\d+)?\s*(?:mas|menos|por|entre|x|\+|-|\*|/)\s*\d+(?:[.,]\d+)?\b")
+_UNSURE_RE = re.compile(r"\b(no (lo )?se|no estoy segur[oa]|no tengo (esa )?informacion|no puedo responder)\b")
+
+
+def complexity(text: str) -> int:
+    """
+    Cheap complexity score of a general question (no model involved):
+    +1 over 8 words, +1 more over 16, +2 for reasoning/long-answer cues, +1 for more than one question,
+    -1 for plain arithmetic. Questions up to TIER_SMALL_MAX_SCORE go to the small model.
+    """
+    plain = utterance(text).plain
+    words = len(plain.split())
+    score = (words > 8) + (words > 16)
+    if _REASONING_RE.search(plain):
+        score += 2
+    if len(_INTERROGATIVE_RE.findall(plain)) > 1:
+        score += 1
+    if _ARITHMETIC_RE.search(plain):
+        score -= 1
+    return score
+
+
+class SmallModel(Reloadable):
+    """
+    Small GGUF (same chat template as the large one, ChatML) with a hand-rolled decode loop.
+    When a token is yielded, the context still holds the logits it was sampled from (read with
+    last_logits(), `scores` stays empty without logits_all): confidence = geometric mean of the token probabilities.
+    """
+
+    def __init__(self, model_path: str, max_tokens: int = 100):
+        self.log = logging.getLogger("LLM_Small")
+        self.model_path = model_path
+        self.max_tokens = max_tokens
+        self._llm = None
+        self._lock = threading.RLock()
+        size_mb = os.path.getsize(model_path) / 2**20 if os.path.exists(model_path) else 0.0
+        self._init_reloadable("llm_small", size_mb, self._lock)
+
+    def _is_loaded(self) -> bool:
+        return self._llm is not None
+
+    def _unload(self):
+        self._llm.close()
+        self._llm = None
+
+    def _load(self):
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Modelo pequeño no encontrado: {self.model_path}")
+        from llama_cpp import Llama
+        self._llm = Llama(model_path=self.model_path, n_ctx=CONTEXT_LLM, n_threads=THREADS_LLM, n_batch=N_BACH_LLM,
+                          n_gpu_layers=GPU_LAYERS_LLM, use_mmap=True, use_mlock=False, verbose=False)
+        self._stop = {self._llm.token_eos(), *self._llm.tokenize(b"<|im_end|>", add_bos=False, special=True)}
+
+    def answer(self, user_prompt: str) -> Tuple[str, float]:
+        """ (answer, confidence 0.0-1.0) """
+        prompt = (f"<|im_start|>system\n{GENERAL_SYSTEM_PROMPT}<|im_end|>\n"
+                  f"<|im_start|>user\n{user_prompt}<|im_end|>\n<|im_start|>assistant\n")
+        out: List[int] = []
+        logprob = 0.0
+        from llm.llm_speculative import last_logits
+        with TRACER.span("llm.small", cold=not self.loaded) as sp, self.using():
+            llm = self._llm
+            tokens = llm.tokenize(prompt.encode("utf-8"), add_bos=False, special=True)
+            t0 = first = time.perf_counter()
+            for tok in llm.generate(tokens, temp=0.2, top_p=0.9, repeat_penalty=1.0):
+                if not out:
+                    first = time.perf_counter() #the first token comes right after the prompt evaluation
+                if tok in self._stop or len(out) >= self.max_tokens:
+                    break
+                logits = last_logits(llm).astype(np.float64)
+                logits -= logits.max()
+                logprob += logits[tok] - math.log(np.exp(logits).sum())
+                out.append(tok)
+            text = llm.detokenize(out).decode("utf-8", errors="ignore").strip()
+            confidence = math.exp(logprob / len(out)) if out else 0.0
+            sp.set(prompt_eval_ms=round(1000.0 * (first - t0), 1), prompt_tokens=len(tokens),
+                   decode_ms=round(1000.0 * (time.perf_counter() - first), 1), decode_tokens=len(out),
+                   confidence=round(confidence, 3))
+        from llm.llm_client import observe_generation
+        observe_generation("small", time.perf_counter() - t0, len(out), 1000.0 * (time.perf_counter() - first))
+        return text, confidence
+
+
+class TieredLLM:
+    """
+    Drop-in for LLM in the Router: general questions go to the small model when `complexity()` is low,
+    and escalate to the large model when the small answer is empty, unsure or below TIER_MIN_CONFIDENCE.
+    With session memory, small answers are recorded in the conversation and every follow-up goes to the large model.
+    Motion planning (function calling) always uses the large model.
+    """
+
+    def __init__(self, large, small: SmallModel, max_score: int = TIER_SMALL_MAX_SCORE,
+                 min_confidence: float = TIER_MIN_CONFIDENCE):
+        self.log = logging.getLogger("LLM_Tiering")
+        self.large = large
+        self.small = small
+        self.max_score = max_score
+        self.min_confidence = min_confidence
+        self.stats = {"small": 0, "escalated": 0, "large": 0}
+        self.last: Dict[str, Any] = {}
+
+    def ensure(self):
+        self.large.ensure()
+        self.small.ensure()
+
+    def engines(self) -> List[Reloadable]:
+        return self.large.engines() + [self.small]
+
+    def route(self, user_prompt: str) -> str:
+        """ "small" or "large", before running any model (follow-ups need the conversation of the large one) """
+        sessions = getattr(self.large, "sessions", None)
+        if sessions is not None and sessions.has_history(CURRENT_SESSION.get()):
+            return "large"
+        return "small" if complexity(user_prompt) <= self.max_score else "large"
+
+    def answer_general(self, user_prompt: str) -> str:
+        if self.route(user_prompt) == "small":
+            t0 = time.perf_counter()
+            text, conf = self.small.answer(user_prompt)
+            small_ms = 1000.0 * (time.perf_counter() - t0)
+            if text and conf >= self.min_confidence and not _UNSURE_RE.search(utterance(text).plain):
+                sessions, session_id = getattr(self.large, "sessions", None), CURRENT_SESSION.get()
+                if sessions is not None and session_id is not None: #so the follow-up, on the large model, sees it
+                    sessions.get(session_id).record(user_prompt, text)
+                self.stats["small"] += 1
+                self.last = {"tier": "small", "confidence": round(conf, 3), "small_ms": round(small_ms, 1)}
+                return text
+            self.stats["escalated"] += 1
+            self.log.info(f"Respuesta del modelo pequeño poco confiable ({conf:.2f}), se escala al grande")
+            self.last = {"tier": "escalated", "confidence": round(conf, 3), "small_ms": round(small_ms, 1)}
+        else:
+            self.stats["large"] += 1
+            self.last = {"tier": "large"}
+        return self.large.answer_general(user_prompt)
+
+    def plan_motion(self, user_prompt: str) -> Optional[Dict[str, Any]]:
+        return self.large.plan_motion(user_prompt)
+
+
+#General questions with the tier they should need and words a correct answer contains (normalized)
+LABELED_CORPUS = (
+    ("¿Cuánto es 2 más 2?", "small", ("4", "cuatro")),
+    ("¿Cuánto es 10 entre 2?", "small", ("5", "cinco")),
+    ("¿Cuál es la capital de Francia?", "small", ("paris",)),
+    ("¿Cuál es la capital de Japón?", "small", ("tokio",)),
+    ("¿Cuántos días tiene una semana?", "small", ("7", "siete")),
+    ("¿De qué color es el cielo?", "small", ("azul",)),
+    ("¿Quién escribió Don Quijote?", "small", ("cervantes",)),
+    ("¿Cuántos planetas tiene el sistema solar?", "small", ("8", "ocho")),
+    ("¿Cuándo fue la Independencia de México?", "small", ("1810",)),
+    ("¿En qué continente está Brasil?", "small", ("america",)),
+    ("¿Qué idioma se habla en Portugal?", "small", ("portugues",)),
+    ("Dime un sinónimo de rápido", "small", ("veloz", "agil", "ligero", "pronto")),
+    ("¿Por qué el cielo es azul?", "large", ("luz", "dispersion", "rayleigh")),
+    ("Explica cómo funciona un motor eléctrico", "large", ("magnet", "corriente", "bobina")),
+    ("¿Cuál es la diferencia entre un virus y una bacteria?", "large", ("celul", "vivo")),
+    ("Dame tres consejos para dormir mejor", "large", ("horario", "pantalla", "cafe", "rutina")),
+    ("Compara la energía solar con la eólica", "large", ("sol", "viento")),
+    ("¿Quién fue Benito Juárez y qué hizo por México?", "large", ("presidente", "reforma")),
+    ("Escribe un poema corto sobre un robot", "large", ("robot",)),
+    ("¿Cuáles son las ventajas de usar robots en un hospital?", "large", ("pacientes", "tareas", "personal")),
+)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Routing of the labeled corpus (no model needed), and with --bench latency/quality of small, large and tiered
+    import sys
+
+    hits = 0
+    for q, label, _ in LABELED_CORPUS:
+        score = complexity(q)
+        tier = "small" if score <= TIER_SMALL_MAX_SCORE else "large"
+        hits += tier == label
+        print(f"{score:+d} {tier:5s} {'✅' if tier == label else '❌'} {q}")
+    print(f"Ruteo igual a la etiqueta: {hits}/{len(LABELED_CORPUS)}")
+
+    if "--bench" in sys.argv:
+        from utils.utils import LoadModel
+        from llm.llm_client import LLM
+
+        loader = LoadModel()
+        large = LLM(model_path=str(loader.ensure_model("llm")[0]))
+        tiered = TieredLLM(large, SmallModel(str(loader.ensure_model("llm_small")[0])))
+        tiered.ensure()
+
+        def correct(answer: str, expected) -> bool:
+            plain = utterance(answer).plain
+            return any(e in plain for e in expected)
+
+        systems = (("grande", large.answer_general), ("pequeño", lambda q: tiered.small.answer(q)[0]),
+                   ("escalonado", tiered.answer_general))
+        #The confidence must be a probability and depend on the answer, else the escalation is arbitrary
+        conf = [tiered.small.answer(q)[1] for q, _, _ in LABELED_CORPUS]
+        assert all(0.0 < c <= 1.0 for c in conf), f"Confianza fuera de (0, 1]: {conf}"
+        assert max(conf) - min(conf) > 1e-3, f"La confianza no varía con la respuesta: {conf}"
+        print(f"Confianza del pequeño: min {min(conf):.3f}, media {sum(conf) / len(conf):.3f}, max {max(conf):.3f}")
+
+        for name, fn in systems:
+            fn("Hola") #warm-up
+            lat, ok = [], 0
+            for q, _, expected in LABELED_CORPUS:
+                t0 = time.perf_counter()
+                ok += correct(fn(q), expected)
+                lat.append(1000.0 * (time.perf_counter() - t0))
+            lat.sort()
+            print(f"{name:10s} correctas {ok}/{len(LABELED_CORPUS)}, p50 {lat[len(lat) // 2]:.0f} ms, "
+                  f"p90 {lat[int(len(lat) * 0.9)]:.0f} ms, media {sum(lat) / len(lat):.0f} ms")
+        print(f"Escalonado: {tiered.stats}")
@@ -1,55 +1,127 @@
 from __future__ import annotations
-from typing import Dict, Any, Optional, Callable
-import math, json, logging, requests, os, subprocess
+from typing import Dict, Any, List, Optional, Callable
+import math, json, logging, os, subprocess
 
 from llm.llm_data import Battery, PosesIndex
+from llm.llm_maps import MapsClient
+from llm.llm_motion import MotionClient
+from llm.llm_telemetry import TelemetryStore, UdpTelemetryListener, start_ros2_telemetry
 from llm.llm_patterns import ORIENT_INTENT_RE, MAPS_COUNT_RE
-from config.settings import MAX_MOVE_DISTANCE_LLM, PATH_POSES
-from llm.llm_intentions import norm_text, extract_place_query
+from config.settings import (MAX_MOVE_DISTANCE_LLM, PATH_POSES, USE_MOTION_BRIDGE, USE_TELEMETRY, TELEMETRY_SOURCE,
+                             NEARBY_RADIUS_M, NEARBY_MAX_PLACES)
+from llm.llm_intentions import utterance
 
 class GetInfo:
     def __init__(
         self,
         last_batt: Optional[Battery] = None,
         on_nav_cmd: Optional[Callable[[Dict[str, Any]], None]] = None,
+        execute: bool = True,
     ) -> None:
+        """ Every motion command goes to `on_nav_cmd` (printed by default) and, if execute, is also run here:
+            over the motion bridge when it is reachable, otherwise with one `ros2 run` per move.
+            execute=False (agent server): no telemetry feed and nothing moves here, `on_nav_cmd` hands the
+            commands to the robot that asked """
         self.log = logging.getLogger("Publish") 
+        self.execute = execute
         self.poses = PosesIndex(os.path.expanduser(PATH_POSES)) 
-        self.last_batt: Optional[Battery] = None or last_batt
+        self.telemetry = TelemetryStore()
+        if last_batt is not None:
+            self.telemetry.update_battery(last_batt.percentage, manual=True)
+        self.telemetry_feed = self._start_telemetry() if USE_TELEMETRY and execute else None
+        self.maps = MapsClient()
+        self.motion = MotionClient() if USE_MOTION_BRIDGE and execute else None
+        self.moves: List[subprocess.Popen] = [] #Legacy ros2 processes, reaped as they finish
 
         self.on_nav_cmd = on_nav_cmd or (lambda payload: print(f"[nav_cmd] {json.dumps(payload, ensure_ascii=False)}"))
         
 
+    #------- Telemetry ----------
+
+    def _start_telemetry(self):
+        """ Start the live feed that keeps self.telemetry updated, None if it could not be started """
+        try:
+            if TELEMETRY_SOURCE == "ros2":
+                return start_ros2_telemetry(self.telemetry)
+            feed = UdpTelemetryListener(self.telemetry)
+            feed.start()
+            return feed
+        except (ImportError, OSError) as e:
+            self.log.warning(f"Telemetría '{TELEMETRY_SOURCE}' no disponible: {e}")
+            return None
+
     #------- Battery ----------
 
     def set_battery(self, percentage: Optional[float]) -> None:
-        self.last_batt = Battery(percentage=percentage)
+        """ Manual reading (never stale), replaced by the next one from the telemetry feed """
+        self.telemetry.update_battery(percentage, manual=True)
     
     def tool_get_battery(self) -> Dict[str, Any]:
-        """ Return the battery percentage as dict with 'percentage' (0.0-100.0), or error if no data """
-        if self.last_batt is None or self.last_batt.percentage is None:
+        """ Return the battery percentage as dict with 'percentage' (0.0-100.0), or error if no data.
+            Old readings also carry 'stale': True and their 'age_s' """
+        sample = self.telemetry.battery()
+        if sample is None or sample.value.percentage is None:
             return {"error":"sin_datos_bateria","percentage": None}
-        pct = float(self.last_batt.percentage)
+        pct = float(sample.value.percentage)
         if pct > 1.5: pct /= 100.0
-        return {"percentage": round(pct*100.0,1)}
+        out = {"percentage": round(pct*100.0,1)}
+        if self.telemetry.is_stale(sample):
+            out.update(stale=True, age_s=round(self.telemetry.age(sample), 1))
+        return out
+
+    #------- Pose ----------
+
+    def tool_get_pose(self) -> Dict[str, Any]:
+        """ Return the current pose of the robot (x, y, yaw, frame_id) and the closest known place as 'near',
+            or error if no data. Old readings also carry 'stale': True and their 'age_s' """
+        sample = self.telemetry.pose()
+        if sample is None:
+            return {"error":"sin_datos_pose"}
+        pose = sample.value
+        out = {k: getattr(pose, k) for k in ("x","y","yaw","frame_id")}
+        near = self.poses.nearest(pose.x, pose.y, pose.frame_id, k=1)
+        if near:
+            dist, place = near[0]
+            out.update(near=place.name, near_dist=round(dist, 2))
+        if self.telemetry.is_stale(sample):
+            out.update(stale=True, age_s=round(self.telemetry.age(sample), 1))
+        return out
+
+    def tool_get_nearby(self, radius: float = NEARBY_RADIUS_M, k: int = NEARBY_MAX_PLACES) -> Dict[str, Any]:
+        """ Return the (at most k) places within radius meters of the robot, closest first, as
+            'places': [{'name', 'distance'}], or error if the pose is unknown """
+        sample = self.telemetry.pose()
+        if sample is None:
+            return {"error":"sin_datos_pose","places": []}
+        pose = sample.value
+        places = [{"name": p.name, "distance": round(d, 2)} for d, p in self.poses.within(pose.x, pose.y, radius, pose.frame_id)[:k]]
+        out = {"places": places, "radius": radius}
+        if self.telemetry.is_stale(sample):
+            out.update(stale=True, age_s=round(self.telemetry.age(sample), 1))
+        return out
 
     #------- Navigation --------
 
     def publish_nav_cmd(self, pose: Dict[str,Any], simulate: bool):
         """ Emit a nav command via callback """
         payload = {"type":"goto","simulate": bool(simulate), "target": {k: pose.get(k) for k in ("x","y","yaw","frame_id","name")}}
+        current = self.telemetry.pose()
+        if current is not None and not self.telemetry.is_stale(current):
+            payload["start"] = {k: getattr(current.value, k) for k in ("x","y","yaw","frame_id")}
         self.log.info(f"[nav_cmd] simulate={simulate} target={payload['target']}")
         self.on_nav_cmd(payload)
+        if self.motion is not None and self.motion.reachable():
+            self.motion.send(payload)
 
     def tool_nav_to_place(self, text: str, simulate: bool=False) -> Dict[str,Any]:
         """ Navigate to a place by name, 
             If simulate=True, only simulate the navigation (no movement commands)
             If simulate=False, emit a nav command via callback"""
-        key = extract_place_query(text)
-        pose = self.poses.lookup(key)
-        if 'error' in pose: return {"error":"destino_no_encontrado","q": key}
+        u = utterance(text)
+        pose = self.poses.lookup(u)
+        if 'error' in pose: return {"error":"destino_no_encontrado","q": u.place}
         # auto simulate por intención
-        t = norm_text(text, True)
+        t = u.clean
         is_orient = any(w in t for w in ORIENT_INTENT_RE.findall(t)) 
         simulate = True if is_orient else False
         self.publish_nav_cmd(pose, simulate)
@@ -63,13 +135,14 @@ class GetInfo:
         adjusted_dist = max(-max_dist_m, min(max_dist_m, float(dist)))
         adjusted_yaw = max(-12.57, min(12.57, float(yaw)))
 
-        payload = {"yaw":yaw, "distance":adjusted_dist, "flag":flag}
-        self.on_nav_cmd({"type": "natural_move", **payload})
-
-        if adjusted_dist != 0:
-            subprocess.Popen(['ros2', 'run', 'rp_nav2', 'drive_calibrator.py', 'linear', str(adjusted_dist)], start_new_session=True)
-        elif adjusted_yaw != 0:
-            subprocess.Popen(['ros2', 'run', 'rp_nav2', 'drive_calibrator.py', 'angular', str(adjusted_yaw)], start_new_session=True)
+        payload = {"type": "natural_move", "yaw":adjusted_yaw, "distance":adjusted_dist, "flag":flag}
+        self.on_nav_cmd(payload)
+        if self.motion is not None and self.motion.reachable():
+            self.motion.send(payload)
+        elif self.execute: #Legacy path: one ros2 process per move
+            if self.motion is not None:
+                self.log.warning("Puente de movimiento no disponible, uso ros2 run")
+            self._run_legacy_move(adjusted_yaw, adjusted_dist)
 
         if -max_dist_m > dist or dist > max_dist_m:
             return f"Estoy avanzando, pero recuerda que no puedo avanzar más de {max_dist_m} metros"
@@ -79,33 +152,34 @@ class GetInfo:
             return "Avanzando"
         return "No encontré destino, ni instucción de movimiento."
     
+    def _run_legacy_move(self, yaw: float, dist: float) -> None:
+        """ Start `drive_calibrator.py` for one move, reaping the processes of the moves already finished """
+        self.moves = [p for p in self.moves if p.poll() is None]
+        if dist != 0:
+            self.moves.append(subprocess.Popen(['ros2', 'run', 'rp_nav2', 'drive_calibrator.py', 'linear', str(dist)], start_new_session=True))
+        elif yaw != 0:
+            self.moves.append(subprocess.Popen(['ros2', 'run', 'rp_nav2', 'drive_calibrator.py', 'angular', str(yaw)], start_new_session=True))
+
+    def tool_cancel_navigation(self) -> Dict[str,Any]:
+        """ Cancel the motion in progress and drop the queued ones """
+        self.on_nav_cmd({"type": "cancel"})
+        for p in self.moves:
+            if p.poll() is None:
+                p.terminate()
+        if self.motion is not None and self.motion.reachable():
+            return self.motion.cancel()
+        return {"ok": True}
+
     # ------------------- Maps ------------------------
     
     def tool_get_maps_from_backend(self) -> list:
-        try:
-            response = requests.get("http://0.0.0.0:9009/maps/maps", json={}, params={}, timeout=2.0)
-            response_body = response.json()
-
-            # Check if the 'data' key exists and is a list
-            if 'data' in response_body and isinstance(response_body['data'], list):
-                # Use a list comprehension to extract the 'name' from each dictionary in the 'data' list
-                message = [item.get('name') for item in response_body['data'] if isinstance(item, dict) and 'name' in item]
-            else:
-                print("Error: 'data' key not found or not a list in the response.")
-                message = []
-
-        except requests.exceptions.Timeout:
-            message = "The request timed out after 2 seconds."
-        except requests.exceptions.RequestException as ex:
-            message = f"Server NOT available. {ex}"
-
-        return message
+        """ Return the names of the maps loaded in the backend (served from the MapsClient cache), [] if unavailable """
+        return self.maps.get_maps()
 
     def tool_classify_maps_intention(self, text: str) -> Dict[str,Any]:
         """ Navigate to a place by name, 
             If simulate=True, only simulate the navigation (no movement commands)
             If simulate=False, emit a nav command via callback"""
-        # auto simulate por intención
-        t = norm_text(text, True)
+        t = utterance(text).clean
         is_count = any(w in t for w in MAPS_COUNT_RE.findall(t)) 
         return True if is_count else False
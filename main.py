@@ -4,7 +4,14 @@ from stt.wake_word import WakeWord
 from stt.audio_listener import AudioListener
 from stt.speech_to_text import SpeechToText
 from llm.llm import LlmAgent
+from llm.llm_server import RemoteAgent
 from tts.text_to_speech import TTS
+from utils.memory import MemoryManager
+from utils.tracing import TRACER
+from utils.metrics import MetricsServer
+from config.settings import (SPECULATIVE_LLM, USE_LLM_TIERING, USE_MEMORY_MANAGER, MEMORY_IDLE_LLM_S,
+                             MEMORY_IDLE_STT_S, MEMORY_IDLE_TTS_S, MEMORY_PREFETCH_ON_WAKE, LLM_SERVER_URL,
+                             USE_METRICS)
     
 
 class OctybotAgent:
@@ -17,11 +24,31 @@ class OctybotAgent:
         self.wake_word = WakeWord(str(model.ensure_model("wake_word")[0]))
         self.stt = SpeechToText(str(model.ensure_model("stt")[0]), "small") #Other Model "base", id = 1
 
-        #LLM
-        self.llm = LlmAgent(model_path = str(model.ensure_model("llm")[0]))
+        #LLM (local, or a shared server on the site network)
+        if LLM_SERVER_URL:
+            self.llm = RemoteAgent(LLM_SERVER_URL)
+        else:
+            draft = str(model.ensure_model("llm_draft")[0]) if SPECULATIVE_LLM == "draft" else None
+            small = str(model.ensure_model("llm_small")[0]) if USE_LLM_TIERING else None
+            self.llm = LlmAgent(model_path = str(model.ensure_model("llm")[0]), draft_path = draft, small_path = small)
 
         #Text-to-Speech
         self.tts = TTS(str(model.ensure_model("tts")[0]), str(model.ensure_model("tts")[1]))
+
+        #Memory budget: Vosk keeps listening, the rest unload when idle and reload on use
+        self.memory = None
+        if USE_MEMORY_MANAGER:
+            self.memory = MemoryManager()
+            self.memory.register(self.stt, idle_s = MEMORY_IDLE_STT_S)
+            self.memory.register(self.tts, idle_s = MEMORY_IDLE_TTS_S)
+            for engine in (self.llm.llm.engines() if isinstance(self.llm, LlmAgent) else []):
+                self.memory.register(engine, idle_s = MEMORY_IDLE_LLM_S)
+            if MEMORY_PREFETCH_ON_WAKE:
+                self.wake_word.on_wake = lambda: self.memory.prefetch("stt", "llm", "llm_small", "tts")
+            self.memory.start()
+
+        #Prometheus endpoint (engines, caches and RSS are read when scraped)
+        self.metrics = MetricsServer().start() if USE_METRICS else None
         
         self.log.info("Octybot Agent Listo ✅")
     
@@ -45,12 +72,18 @@ class OctybotAgent:
             
         self.audio_listener.stop_stream()
         for out in self.llm.ask(text_transcribed):
-            get_audio = self.tts.synthesize(out)
-            self.tts.play_audio_with_amplitude(get_audio)
+            self.tts.speak_queued(out) #Synthesis of the next answer overlaps the playback of this one
+        self.tts.wait_playback()
+        TRACER.end_turn(text=text_transcribed)
     
     def stop(self):
+        if self.memory is not None:
+            self.memory.stop()
         self.audio_listener.deleate()
         self.tts.stop_tts()
+        TRACER.close()
+        if self.metrics is not None:
+            self.metrics.stop()
 
     
 
@@ -61,7 +94,8 @@ if "__main__" == __name__:
 
     try:
         llm = OctybotAgent()
-        last_batt=llm.llm.get_info.set_battery(percentage=0.67),
+        if isinstance(llm.llm, LlmAgent):
+            last_batt=llm.llm.get_info.set_battery(percentage=0.67),
         print("Hola soy tu Agente vistual Octybot 🤖:")
         print("Prueba a decir 'ok robot' y darme una instrucción - Presiona (Ctrl+C para salir):")
         print("(Ejemplos: '¿Dónde estoy?', '¿Cuál es tu batería?', 'Ve a la enfermería', '¿Cuándo fue la Independencia de México y cuál es mi batería?')")
@@ -1,7 +1,14 @@
 import pyaudio
-from config.settings import AUDIO_LISTENER_DEVICE_ID, AUDIO_LISTENER_SAMPLE_RATE, AUDIO_LISTENER_CHANNELS, AUDIO_LISTENER_FRAMES_PER_BUFFER
+import numpy as np
+from config.settings import (
+    AUDIO_LISTENER_DEVICE_ID, AUDIO_LISTENER_SAMPLE_RATE, AUDIO_LISTENER_CHANNELS, AUDIO_LISTENER_FRAMES_PER_BUFFER,
+    AUDIO_LISTENER_NATIVE_CAPTURE, AUDIO_LISTENER_NATIVE_SAMPLE_RATE, AUDIO_LISTENER_NATIVE_CHANNELS, AUDIO_LISTENER_RESAMPLER_TAPS
+)
+from stt.resampler import PolyphaseResampler, downmix
 import logging
 
+from utils.metrics import METRICS
+
 def define_device_id(pa:pyaudio.PyAudio = None, prefered:int = AUDIO_LISTENER_DEVICE_ID, log:logging.getLogger = None) -> int:
 
     """ Define the device id to use for audio input."""
@@ -33,25 +40,71 @@ class AudioListener:
         self.channels = AUDIO_LISTENER_CHANNELS 
         self.frames_per_buffer = AUDIO_LISTENER_FRAMES_PER_BUFFER
         self.stream = None
+
+        #Input overruns (the audio loop fell behind and PortAudio's input buffer filled up), exported on scrape.
+        #Checked with get_read_available() before each read: a non-raising read never reports the overflow
+        self.overruns = 0
+        self.capacity = None #Frames the input buffer holds, from the stream's input latency
+        METRICS.collect("octybot_audio_overruns_total", "Microphone reads that found the input buffer full (samples dropped)",
+                        "counter", lambda: [({}, self.overruns)], source="audio_listener")
+
+        #Native capture: the device runs at its own rate/channels and we resample here
+        self.native = AUDIO_LISTENER_NATIVE_CAPTURE
+        self.resampler = None
+        if self.native:
+            self.channels = 1 #The frames we return are always mono
+            info = (self.audio_interface.get_device_info_by_index(self.device_index) if self.device_index is not None
+                    else self.audio_interface.get_default_input_device_info())
+            self.native_rate = int(AUDIO_LISTENER_NATIVE_SAMPLE_RATE or info.get("defaultSampleRate", self.sample_rate))
+            self.native_channels = int(AUDIO_LISTENER_NATIVE_CHANNELS or max(1, info.get("maxInputChannels", 1)))
+            self.resampler = PolyphaseResampler(self.native_rate, self.sample_rate, AUDIO_LISTENER_RESAMPLER_TAPS)
+            self.pending = np.empty(0, dtype=np.int16)
+            self.log.info(f"Captura nativa: {self.native_rate} Hz x{self.native_channels} -> {self.sample_rate} Hz mono")
         self.log.info(f"AudioListener initialized with device_index={self.device_index}, sample_rate={self.sample_rate}, channels={self.channels}, frames_per_buffer={self.frames_per_buffer} ✅ ")
 
     def start_stream(self):
         """ Start the audio stream if not already started."""
         if self.stream is None:
+            if self.native:
+                self.resampler.reset()
+                self.pending = np.empty(0, dtype=np.int16)
             self.stream = self.audio_interface.open(
                 format=pyaudio.paInt16,
-                channels=self.channels,
-                rate=self.sample_rate,
+                channels=self.native_channels if self.native else self.channels,
+                rate=self.native_rate if self.native else self.sample_rate,
                 input=True,
                 input_device_index=self.device_index,
                 frames_per_buffer=self.frames_per_buffer,
             )
+            rate = self.native_rate if self.native else self.sample_rate
+            self.capacity = max(self.frames_per_buffer, int(self.stream.get_input_latency() * rate))
 
     def read_frame(self, frame_samples: int) -> bytes:
         """ Read a frame of audio data from the stream."""
         if self.stream is None:
             raise RuntimeError("El Audio stream no se ha comenzado o está fallando la lectura.")
-        return self.stream.read(frame_samples, exception_on_overflow=False)
+        if self.native:
+            return self.read_frame_native(frame_samples)
+        return self.read_stream(frame_samples)
+
+    def read_stream(self, n: int) -> bytes:
+        """ stream.read() without raising on overflow, a full input buffer before the read counts as an overrun """
+        if self.stream.get_read_available() >= self.capacity:
+            self.overruns += 1
+        return self.stream.read(n, exception_on_overflow=False)
+
+    def read_frame_native(self, frame_samples: int) -> bytes:
+        """ Read native-rate audio, downmix + resample it and return exactly `frame_samples` int16 mono samples."""
+        while self.pending.size < frame_samples:
+            missing = frame_samples - self.pending.size
+            n_native = -(-missing * self.resampler.down // self.resampler.up) #ceil, only what we need → ~1 frame of latency
+            raw = self.read_stream(max(1, n_native))
+            mono = downmix(np.frombuffer(raw, dtype=np.int16), self.native_channels)
+            out = self.resampler.process(mono)
+            out = np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+            self.pending = np.concatenate((self.pending, out))
+        frame, self.pending = self.pending[:frame_samples], self.pending[frame_samples:]
+        return frame.tobytes()
 
     def stop_stream(self):
         """ Stop the audio stream if it is running."""
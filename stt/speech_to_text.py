@@ -2,26 +2,39 @@
 from typing import Optional
 from pathlib import Path
 
-import logging
+import logging, time
 import numpy as np
 
 import whisper
-from config.settings  import SAMPLE_RATE_STT, LANGUAGE, SELF_VOCABULARY_STT
+from config.settings  import SAMPLE_RATE_STT, LANGUAGE, SELF_VOCABULARY_STT, SAVE_WAV_STT, PATH_TO_SAVE_STT
+from utils.audio_archive import AudioArchiver
+from utils.memory import Reloadable
+from utils.tracing import TRACER
+from utils.metrics import METRICS, RTF_BUCKETS, SECONDS_BUCKETS
 
-class SpeechToText:
+STT_SECONDS = METRICS.histogram("octybot_stt_seconds", "Whisper transcription time (s)", SECONDS_BUCKETS)
+STT_RTF = METRICS.histogram("octybot_stt_rtf", "Whisper transcription time / audio duration", RTF_BUCKETS)
+
+class SpeechToText(Reloadable):
     def __init__(self, model_path:str, model_name:str) -> None:
         
         self.log = logging.getLogger("Speech_To_Text")    
 
         model_path = Path(model_path)
-
-        self.model = whisper.load_model(model_name, download_root = model_path.parent)
+        self.model_name = model_name
+        self.download_root = model_path.parent
+        self.model = None
+        self._init_reloadable("stt", model_path.stat().st_size / 2**20 if model_path.exists() else 0.0)
+        self.ensure()
+        self.archiver = AudioArchiver(Path(PATH_TO_SAVE_STT) / "stt", "stt") if SAVE_WAV_STT else None
 
     
     def worker_lopp(self, audio_bytes: bytes) -> Optional[str | None]:
         """With this we can see if we recieve text or none"""
         if audio_bytes is None:
             return None
+        if self.archiver is not None:
+            self.archiver.submit(audio_bytes, SAMPLE_RATE_STT)
         try:
             text = self.stt_from_bytes(audio_bytes)
             if text:  
@@ -34,6 +47,15 @@ class SpeechToText:
         except Exception as e:
             self.log.info(f"Error en STT: {e}")
 
+    def _is_loaded(self) -> bool:
+        return self.model is not None
+
+    def _load(self) -> None:
+        self.model = whisper.load_model(self.model_name, download_root = self.download_root)
+
+    def _unload(self) -> None:
+        self.model = None
+
     def stt_from_bytes (self, audio_bytes: bytes) -> Optional[str]:
         """
         Convert bytes Int16→tensor float32 normalizado y ejecuta Whisper.
@@ -50,21 +72,27 @@ class SpeechToText:
         if SAMPLE_RATE_STT != 16000:
             self.log.info(f"Whisper Solo Funciona a 16 Khz, estás enviando información a {SAMPLE_RATE_STT}hz")
 
-        result = self.model.transcribe(
-            x,
-            temperature = 0.0, 
-            fp16=False, 
-            language = LANGUAGE, 
-            task="transcribe",
-            initial_prompt = SELF_VOCABULARY_STT,
-            carry_initial_prompt=True,
-            condition_on_previous_text = False,
-            word_timestamps = True,
-            hallucination_silence_threshold = 0.8,
-            no_speech_threshold = 0.5,
-            compression_ratio_threshold=2.4,
-            beam_size=1
-            )
+        with TRACER.span("stt", audio_s=round(len(x) / 16000.0, 2), cold=not self.loaded) as sp, self.using():
+            t0 = time.perf_counter()
+            result = self.model.transcribe(
+                x,
+                temperature = 0.0, 
+                fp16=False, 
+                language = LANGUAGE, 
+                task="transcribe",
+                initial_prompt = SELF_VOCABULARY_STT,
+                carry_initial_prompt=True,
+                condition_on_previous_text = False,
+                word_timestamps = True,
+                hallucination_silence_threshold = 0.8,
+                no_speech_threshold = 0.5,
+                compression_ratio_threshold=2.4,
+                beam_size=1
+                )
+            sp.set(chars=len(result["text"] or ""))
+            elapsed = time.perf_counter() - t0
+            STT_SECONDS.observe(elapsed)
+            STT_RTF.observe(elapsed / (len(x) / 16000.0))
 
         return(result["text"])or None
     
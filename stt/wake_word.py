@@ -1,5 +1,5 @@
 from __future__ import annotations
-import logging, json
+import logging, json, time
 import webrtcvad
 import vosk
 
@@ -10,11 +10,13 @@ from config.settings import (
     MIN_SILENCE_MS_TO_DRAIN_STT, ACTIVATION_PHRASE_WAKE_WORD, LISTEN_SECONDS_STT, 
     AUDIO_LISTENER_SAMPLE_RATE, VARIANTS_WAKE_WORD, AUDIO_LISTENER_CHANNELS, AVATAR
 )
+from utils.tracing import TRACER
+from utils.metrics import METRICS
 
 if AVATAR:
     import webbrowser, subprocess, sys
     from pathlib import Path
-    from avatar.avatar_server import send_mode_sync
+    from avatar.avatar_server import AvatarClient
 
 
 class WakeWord:
@@ -28,6 +30,7 @@ class WakeWord:
         
         #State Machine 
         self.on_say = (lambda s: print(f"[Wake_word] {s}"))
+        self.on_wake = None #Called when the wake word starts to be heard (e.g. to preload Whisper and the LLM)
 
         grammar = json.dumps(self.variants, ensure_ascii=False)
         model_path = model_path
@@ -56,10 +59,23 @@ class WakeWord:
         self.max = int(self.listen_seconds * self.sample_rate * AUDIO_LISTENER_CHANNELS * 2) #2 bytes per int16 sample
         self.max_2 = int(1 * self.sample_rate * AUDIO_LISTENER_CHANNELS * 2) #2 bytes per int16 sample
 
+        #Tracing: wake time and last voiced frame of the current request
+        self.wake_ns = 0
+        self.last_speech_ns = 0
+
+        #Metrics: plain counters on the 10 ms path, read only when /metrics is scraped
+        self.vad_frames = 0
+        self.vad_speech_frames = 0
+        self.detections = METRICS.counter("octybot_wake_detections_total", "Wake word detections by stage")
+        METRICS.collect("octybot_vad_frames_total", "10 ms frames seen by the VAD", "counter",
+                        lambda: [({"speech": "true"}, self.vad_speech_frames),
+                                 ({"speech": "false"}, self.vad_frames - self.vad_speech_frames)], source="wake_word")
+
         #Initialize Avatar Server if needed
         if AVATAR:
             subprocess.Popen([sys.executable, "-m", "avatar.avatar_server"], stdin=subprocess.DEVNULL, stdout = subprocess.PIPE, stderr = subprocess.PIPE, text=True)
             webbrowser.open(Path("avatar/OctoV.html").resolve().as_uri(), new=0, autoraise=True)
+            self.avatar = AvatarClient(as_json=False) #Persistent connection, the audio loop only enqueues
 
     def wake_word_detector(self, frame:bytes) -> None | bytes:
         
@@ -78,11 +94,14 @@ class WakeWord:
         - Requires: `self.sample_rate`, `self.vad`, `self.rec`, `self.matches_wake()`.
         """
         flag = True if self.vad.is_speech(frame, self.sample_rate) else False
+        self.vad_frames += 1
+        self.vad_speech_frames += flag
 
         if (self.listening or self.listening_confirm) and flag: #If I'm listening or If I got a confirmation i save the info
+            self.last_speech_ns = time.monotonic_ns()
             drained = self.buffer_add(frame)  
             if drained is not None:
-                send_mode_sync(mode = "TTS", as_json=False) if AVATAR else None
+                self.avatar.send_mode_nowait("TTS") if AVATAR else None
                 return drained
         
         if not flag: # If I hear silence
@@ -90,7 +109,7 @@ class WakeWord:
                 self.partial_hits -= 1         
             if (self.listening or self.listening_confirm) and self.partial_hits <= -self.silence_frames_to_drain: #If I'm listening and I pass my umbral of silence
                 self.partial_hits = 0
-                send_mode_sync(mode = "TTS", as_json=False) if AVATAR else None
+                self.avatar.send_mode_nowait("TTS") if AVATAR else None
                 if self.listening_confirm and self.size > 0: # If I have the wake_word comfirm and I have something
                     print(self.size, flush=True)
                     print(MIN_SILENCE_MS_TO_DRAIN_STT, flush=True)
@@ -105,6 +124,7 @@ class WakeWord:
             if text and self.matches_wake(text):
                 self.log.info(f"[FULL] Wake word: {text!r}")
                 if not self.listening_confirm:           
+                    self.detections.inc(stage="confirmed")
                     self.listening_confirm = True
                     self.listening = True   
                     print("Confirmo Grabación")
@@ -118,8 +138,13 @@ class WakeWord:
                 if self.matches_wake(partial): #If I got something that looks like partial     
                     if not self.listening: 
                         self.listening = True
-                        send_mode_sync(mode = "USER", as_json=False) if AVATAR else None
+                        self.avatar.send_mode_nowait("USER") if AVATAR else None
                         print("Empiezo a Grabar (primer partial)")
+                        TRACER.start_turn(wake=partial)
+                        self.detections.inc(stage="partial")
+                        self.wake_ns = self.last_speech_ns = time.monotonic_ns()
+                        if self.on_wake is not None:
+                            self.on_wake()
                         drained = self.buffer_add(frame) if flag else None
                         if drained is not None:
                             return drained
@@ -142,7 +167,7 @@ class WakeWord:
         if self.size > self.max_2 and self.listening and not self.listening_confirm:
             self.on_say("Límite de tiempo alcanzado sin confirmación, limpiando buffer")
             self.buffer_clear()
-            send_mode_sync(mode = "TTS", as_json=False) if AVATAR else None
+            self.avatar.send_mode_nowait("TTS") if AVATAR else None
         return None
 
     def buffer_clear(self) -> None:
@@ -166,6 +191,10 @@ class WakeWord:
             self.buffer.clear()
 
         print("Limpio el Buffer")
+        #The wake-to-drain time, and how long the silence detection waited after the last voiced frame
+        now = time.monotonic_ns()
+        TRACER.record("listen", self.wake_ns or now, now, audio_s=round(len(data) / (2 * self.sample_rate), 2))
+        TRACER.record("endpoint", self.last_speech_ns or now, now)
         self.size = 0
         self.listening = False
         self.listening_confirm = False
@@ -0,0 +1,130 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+import numpy as np
+import pyaudio
+
+from config.settings import AUDIO_PUBLISHER_FRAMES_PER_BUFFER, AUDIO_PUBLISHER_DEBUG, AVATAR_AMPLITUDE_FPS
+from utils.tracing import TRACER
+
+
+def rms_envelope(pcm_i16: np.ndarray, sample_rate: int, fps: float = AVATAR_AMPLITUDE_FPS) -> np.ndarray:
+    """ RMS of every 1/fps window of int16 mono audio, scaled to uint8 (0-255), in one vectorized pass """
+    hop = max(1, int(round(sample_rate / fps)))
+    n = -(-len(pcm_i16) // hop)
+    x = np.zeros(n * hop, dtype=np.float32)
+    x[:len(pcm_i16)] = pcm_i16
+    rms = np.sqrt(np.mean(np.square(x.reshape(n, hop)), axis=1))
+    return np.clip(rms * (255.0 / 16384.0), 0, 255).astype(np.uint8)
+
+
+class PlaybackWorker(threading.Thread):
+    """
+    Long-lived playback thread: owns one PyAudio output stream and plays the int16 mono
+    buffers pushed with `put()` back to back, so the producer can synthesize the next
+    sentence while the current one is playing.
+
+    Metrics (see `stats()`):
+    - latency: time from `put()` to the moment the buffer starts playing.
+    - gap: silence between two buffers of the same burst because the queue ran dry (underrun).
+
+    If `envelope_callback(levels, fps, t_start)` is given, the RMS envelope of each buffer is computed
+    in `put()` and handed over with the monotonic time its playback starts (avatar amplitude stream).
+    """
+
+    def __init__(self, sample_rate: int, amplitude_callback=None, chunk_size: int = 1024, envelope_callback=None):
+        super().__init__(name="PlaybackWorker", daemon=True)
+        self.log = logging.getLogger("Playback")
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.amplitude_callback = amplitude_callback
+        self.envelope_callback = envelope_callback
+        self.q: "queue.Queue[tuple[float, np.ndarray, np.ndarray | None, object] | None]" = queue.Queue()
+        self._stop_evt = threading.Event()
+
+        self.pa = pyaudio.PyAudio()
+        self.stream = self.pa.open(format=pyaudio.paInt16,
+                                   channels=1,
+                                   rate=self.sample_rate,
+                                   output=True,
+                                   frames_per_buffer=AUDIO_PUBLISHER_FRAMES_PER_BUFFER)
+
+        #Metrics
+        self._lock = threading.Lock()
+        self.latencies: deque[float] = deque(maxlen=1000)
+        self.gaps: deque[float] = deque(maxlen=1000)
+        self.underruns = 0
+        self._prev_end = None
+
+    def put(self, pcm_i16: np.ndarray, sample_rate: int | None = None) -> None:
+        """ Queue int16 mono samples for playback (non-blocking), `sample_rate` is the rate they were produced at """
+        if pcm_i16 is not None and len(pcm_i16):
+            env = rms_envelope(pcm_i16, sample_rate or self.sample_rate) if self.envelope_callback else None
+            self.q.put((time.perf_counter(), pcm_i16, env, TRACER.current()))
+
+    def wait(self) -> None:
+        """ Block until every queued buffer has been played """
+        self.q.join()
+        self._prev_end = None
+
+    def run(self) -> None:
+        while not self._stop_evt.is_set():
+            item = self.q.get()
+            try:
+                if item is None:
+                    break
+                enqueued_at, pcm_i16, env, turn = item
+                start = time.perf_counter()
+                start_ns = time.monotonic_ns()
+                if env is not None:
+                    self.envelope_callback(env, AVATAR_AMPLITUDE_FPS, time.monotonic())
+                with self._lock:
+                    self.latencies.append(start - enqueued_at)
+                    if self._prev_end is not None:
+                        gap = start - self._prev_end
+                        self.gaps.append(gap)
+                        if gap > self.chunk_size / self.sample_rate:
+                            self.underruns += 1
+                self.play(pcm_i16)
+                self._prev_end = time.perf_counter()
+                TRACER.record("tts.play", start_ns, time.monotonic_ns(), turn=turn,
+                              audio_s=round(len(pcm_i16) / self.sample_rate, 2), wait_ms=round(1000.0 * (start - enqueued_at), 1))
+            except Exception as e:
+                self.log.warning(f"Error reproduciendo audio: {e}")
+            finally:
+                self.q.task_done()
+
+    def play(self, pcm_i16: np.ndarray) -> None:
+        for idx in range(0, len(pcm_i16), self.chunk_size):
+            chunk = pcm_i16[idx:idx + self.chunk_size]
+            self.stream.write(np.ascontiguousarray(chunk).tobytes())
+            if self.amplitude_callback:
+                # amplitude = mean absolute value
+                self.amplitude_callback(np.abs(chunk.astype(np.float32)).mean())
+
+    def stats(self) -> dict:
+        """ Latency/gap summary in milliseconds """
+        with self._lock:
+            lat, gaps = list(self.latencies), list(self.gaps)
+        ms = lambda xs, f: round(1000.0 * float(f(xs)), 2) if xs else 0.0
+        return {
+            "buffers": len(lat),
+            "latency_mean_ms": ms(lat, np.mean), "latency_max_ms": ms(lat, np.max),
+            "gap_mean_ms": ms(gaps, np.mean), "gap_max_ms": ms(gaps, np.max),
+            "underruns": self.underruns,
+        }
+
+    def log_stats(self) -> None:
+        if AUDIO_PUBLISHER_DEBUG:
+            self.log.info(f"Playback: {self.stats()}")
+
+    def stop(self) -> None:
+        """ Stop the thread and release the output stream """
+        self._stop_evt.set()
+        self.q.put(None)
+        self.join(timeout=2.0)
+        self.stream.stop_stream()
+        self.stream.close()
+        self.pa.terminate()
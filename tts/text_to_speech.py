@@ -1,22 +1,36 @@
 # audio/tts.py
 import torch
-import io
-import wave
+import time
 import numpy as np
 import pyaudio
 import logging
+import threading
 from pathlib import Path
 from piper.voice import PiperVoice, SynthesisConfig
-from config.settings import  SAMPLE_RATE_TTS, SAVE_WAV_TTS, PATH_TO_SAVE_TTS, NAME_OF_OUTS_TTS, VOLUME_TTS, SPEED_TTS
+from config.settings import  SAMPLE_RATE_TTS, SAVE_WAV_TTS, PATH_TO_SAVE_TTS, NAME_OF_OUTS_TTS, VOLUME_TTS, SPEED_TTS, USE_TTS_CACHE, AVATAR
+from tts.tts_cache import TTSCache
+from tts.playback import PlaybackWorker
+from utils.audio_archive import AudioArchiver
+from utils.memory import Reloadable
+from utils.tracing import TRACER
+from utils.metrics import METRICS, RTF_BUCKETS, collect_cache
 
-class TTS:
+TTS_RTF = METRICS.histogram("octybot_tts_rtf", "TTS synthesis time / audio duration", RTF_BUCKETS)
+
+if AVATAR:
+    from avatar.avatar_server import AvatarClient
+
+class TTS(Reloadable):
     def __init__(self, model_path:str, model_path_conf:str):
         print("-> Loading Whisper TTS model...")
         self.log = logging.getLogger("[Text-to-Speech]")    
-        self.voice = PiperVoice.load(model_path = model_path,config_path = model_path_conf )
+        self.model_path, self.model_path_conf = model_path, model_path_conf
+        self.voice = None
+        self.voice_rate = SAMPLE_RATE_TTS #Sample rate of the voice, kept while it is unloaded
+        self._init_reloadable("tts", Path(model_path).stat().st_size / 2**20 if Path(model_path).exists() else 0.0)
+        self.ensure()
         self.sample_rate = SAMPLE_RATE_TTS
-        self.count_of_audios = 0
-        self.out_path = Path(PATH_TO_SAVE_TTS) / Path(NAME_OF_OUTS_TTS) / Path(f"{NAME_OF_OUTS_TTS}_{self.count_of_audios}.wav")
+        self.archiver = AudioArchiver(Path(PATH_TO_SAVE_TTS) / NAME_OF_OUTS_TTS, NAME_OF_OUTS_TTS) if SAVE_WAV_TTS else None
         
         self.syn_config = SynthesisConfig(
             volume = VOLUME_TTS,  # half as loud
@@ -25,38 +39,151 @@ class TTS:
             noise_w_scale = 1.0,  # more speaking variation
             normalize_audio=False, # use raw audio from voice
         )
+        self.cache = TTSCache(Path(model_path).name, self.syn_config) if USE_TTS_CACHE else None
+        if self.cache is not None:
+            collect_cache("tts", self.cache.stats)
 
 
         self.pa = None
         self.stream = None
+        self.player = None #Persistent playback thread, created on the first speak_queued()
+        self.underruns = 0 #Underruns of the playback workers already stopped, the live one adds its own
+        self._underruns_lock = threading.Lock()
+        METRICS.collect("octybot_audio_underruns_total", "Playback gaps because the TTS queue ran dry", "counter",
+                        lambda: [({}, self.total_underruns())], source="tts")
+        self.avatar = AvatarClient() if AVATAR else None #Receives the amplitude envelope of what is playing
         
 
         self.log.info("Text-To-Speech Inicializado")
 
+    def _is_loaded(self) -> bool:
+        return self.voice is not None
+
+    def _load(self) -> None:
+        self.voice = PiperVoice.load(model_path = self.model_path,config_path = self.model_path_conf )
+        self.voice_rate = self.voice.config.sample_rate
+
+    def _unload(self) -> None:
+        self.voice = None
+
     def synthesize(self, text: str):
         """Convert Text to Speech using Piper, return mono audio float32 [-1,1]"""
         if not text:
             return None
-        
-        if SAVE_WAV_TTS:
-            self.out_path.parent.mkdir(parents=True, exist_ok=True)
-            with wave.open(str(self.out_path), "wb") as wav_file:
-                self.voice.synthesize_wav(text, wav_file, syn_config=self.syn_config)
-                self.count_of_audios += 1
-                self.out_path = Path(PATH_TO_SAVE_TTS) / Path(NAME_OF_OUTS_TTS) / Path(f"{NAME_OF_OUTS_TTS}_{self.count_of_audios}.wav")
-
-        mem = io.BytesIO()
-        with wave.open(mem, "wb") as w:
-            # Piper setea params internamente; solo pásale el writer
-            self.voice.synthesize_wav(text,w, syn_config=self.syn_config)
-
-        # Lee el WAV del buffer y devuélvelo como float32 normalizado
-        mem.seek(0)
-        with wave.open(mem, "rb") as r:
-            frames = r.readframes(r.getnframes())
-            pcm_i16 = np.frombuffer(frames, dtype=np.int16)
-        audio_f32 = (pcm_i16.astype(np.float32) / 32768.0)
-        return audio_f32
+        chunks = list(self.synthesize_stream(text))
+        if not chunks: #Piper yields nothing for e.g. punctuation-only text
+            return None
+        pcm_i16 = np.concatenate(chunks)
+        if self.archiver is not None:
+            self.archiver.submit(pcm_i16, self.voice_rate)
+        return pcm_i16.astype(np.float32) / 32768.0
+
+    def synthesize_stream(self, text: str):
+        """Yield mono int16 numpy arrays, one per sentence, as soon as Piper produces them (no WAV/float round trip)"""
+        if not text:
+            return
+        #Busy until the last chunk (or until the generator is closed): the memory manager skips an engine in use,
+        #so Piper is never "unloaded" while this generator still holds the voice
+        with self.using():
+            for chunk in self.voice.synthesize(text, syn_config=self.syn_config):
+                yield chunk.audio_int16_array
+
+    def pcm_for(self, text: str):
+        """
+        Yield the int16 audio of `text`: the cached buffer on a cache hit, otherwise Piper's
+        per-sentence chunks as they are produced (stored in the cache / WAV once complete).
+        """
+        cached = self.cache.get(text) if self.cache is not None else None
+        if cached is not None:
+            yield cached
+            if self.archiver is not None:
+                self.archiver.submit(cached, self.voice_rate)
+            return
+
+        wav_chunks = [] if (self.archiver is not None or self.cache is not None) else None
+        for pcm_i16 in self.synthesize_stream(text):
+            if wav_chunks is not None:
+                wav_chunks.append(pcm_i16)
+            yield pcm_i16
+
+        if wav_chunks:
+            pcm_i16 = np.concatenate(wav_chunks)
+            if self.cache is not None:
+                self.cache.put(text, pcm_i16)
+            if self.archiver is not None:
+                self.archiver.submit(pcm_i16, self.voice_rate)
+
+    def speak_stream(self, text: str, amplitude_callback=None) -> dict:
+        """
+        Synthesize and play `text` sentence by sentence: each Piper chunk is written to the
+        output stream as int16 as soon as it exists, so playback starts after the first sentence.
+        Returns timing stats: time to first sample, synthesis CPU time and total time (seconds).
+        """
+        stats = {"first_sample_s": None, "synth_cpu_s": 0.0, "total_s": 0.0, "samples": 0}
+        if not text:
+            return stats
+
+        t0 = time.perf_counter()
+        self.start_stream()
+        chunks = self.pcm_for(text)
+        while True:
+            c0 = time.process_time()
+            pcm_i16 = next(chunks, None)
+            stats["synth_cpu_s"] += time.process_time() - c0
+            if pcm_i16 is None:
+                break
+            if stats["first_sample_s"] is None:
+                stats["first_sample_s"] = time.perf_counter() - t0
+            self.write_int16(pcm_i16, amplitude_callback)
+            stats["samples"] += len(pcm_i16)
+
+        stats["total_s"] = time.perf_counter() - t0
+        self.log.info(f"TTS stream: primer audio {stats['first_sample_s'] or 0.0:.3f}s, CPU síntesis {stats['synth_cpu_s']:.3f}s, total {stats['total_s']:.3f}s")
+        return stats
+
+    def speak_queued(self, text: str) -> None:
+        """
+        Push the audio of `text` to the persistent playback worker and return once it is synthesized,
+        so the caller can synthesize the next utterance while this one is still playing.
+        """
+        if not text:
+            return
+        if self.player is None:
+            self.player = PlaybackWorker(self.sample_rate,
+                                         envelope_callback=self.avatar.send_envelope_nowait if self.avatar else None)
+            self.player.start()
+        with TRACER.span("tts.synth", chars=len(text), cold=not self.loaded) as sp:
+            hits = self.cache.hits if self.cache is not None else 0
+            samples, t0 = 0, time.perf_counter()
+            for pcm_i16 in self.pcm_for(text):
+                self.player.put(pcm_i16, self.voice_rate)
+                samples += len(pcm_i16)
+            sp.set(audio_s=round(samples / self.sample_rate, 2))
+        if samples:
+            cached = self.cache is not None and self.cache.hits > hits
+            TTS_RTF.observe((time.perf_counter() - t0) / (samples / self.sample_rate), cached=str(cached).lower())
+
+    def total_underruns(self) -> int:
+        """ Playback underruns since start, across playback workers """
+        with self._underruns_lock:
+            return self.underruns + (self.player.underruns if self.player is not None else 0)
+
+    def wait_playback(self) -> None:
+        """Block until the playback worker has played everything queued"""
+        if self.player is not None:
+            self.player.wait()
+            self.player.log_stats()
+
+    def write_int16(self, audio_int16: np.ndarray, amplitude_callback=None, chunk_size: int = 1024) -> None:
+        """Write int16 mono samples to the open output stream in chunks of `chunk_size`"""
+        for idx in range(0, len(audio_int16), chunk_size):
+            chunk = audio_int16[idx:idx + chunk_size]
+            self.stream.write(chunk.tobytes())
+
+            if amplitude_callback:
+                # amplitude = mean absolute value
+                amplitude = np.abs(chunk.astype(np.float32)).mean()
+                amplitude_callback(amplitude)
 
     def play_audio_with_amplitude(self, audio_data, amplitude_callback=None):
         """
@@ -75,31 +202,20 @@ class TTS:
 
         self.start_stream()
 
-        # Convert float32 [-1..1] to int16
-        audio_int16 = np.clip(audio_data * 32767.0, -32767.0, 32767.0).astype(np.int16)
-
-
-        chunk_size = 1024
-        idx = 0
-        total_frames = len(audio_int16)
-
-        while idx < total_frames:
-            chunk_end = min(idx + chunk_size, total_frames)
-            chunk = audio_int16[idx:chunk_end]
-            self.stream.write(chunk.tobytes())
-
-            if amplitude_callback:
-                # amplitude = mean absolute value
-                amplitude = np.abs(chunk.astype(np.float32)).mean()
-                amplitude_callback(amplitude)
+        # Convert float32 [-1..1] to int16 (int16 input is played as-is)
+        if audio_data.dtype == np.int16:
+            audio_int16 = audio_data
+        else:
+            audio_int16 = np.clip(audio_data * 32767.0, -32767.0, 32767.0).astype(np.int16)
 
-            idx += chunk_size
+        self.write_int16(audio_int16, amplitude_callback)
         self.stop_tts
         return True
 
     def start_stream(self):
         """ Start the audio stream if not already started."""
-        self.pa = pyaudio.PyAudio()
+        if self.pa is None:
+            self.pa = pyaudio.PyAudio()
 
         if self.stream is None:
             self.stream = self.pa.open(format=pyaudio.paInt16,
@@ -109,9 +225,24 @@ class TTS:
 
     def stop_tts(self):
         """Stop the stream"""
-        self.stream.stop_stream()
-        self.stream.close()
-        self.pa.terminate()
+        if self.archiver is not None:
+            self.archiver.stop()
+            self.archiver = None
+        if self.avatar is not None:
+            self.avatar.close()
+            self.avatar = None
+        if self.player is not None:
+            self.player.stop()
+            with self._underruns_lock:
+                self.underruns += self.player.underruns
+                self.player = None
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+        if self.pa is not None:
+            self.pa.terminate()
+            self.pa = None
         
  #———— Example Usage ————
 if "__main__" == __name__:
@@ -122,12 +253,25 @@ if "__main__" == __name__:
     model = LoadModel()
     tts = TTS(str(model.ensure_model("tts")[0]), str(model.ensure_model("tts")[1]))
 
+    import sys
+    if "--bench" in sys.argv:
+        # Time-to-first-sample and CPU: whole utterance (synthesize + play) vs streaming
+        text = "Hola, soy Octybot. Estoy listo para ayudarte. ¿A dónde quieres que vaya hoy? Puedo llevarte a la enfermería."
+        t0, c0 = time.perf_counter(), time.process_time()
+        audio = tts.synthesize(text)
+        first = time.perf_counter() - t0
+        tts.play_audio_with_amplitude(audio)
+        print(f"[FULL]   primer audio {first:.3f}s, CPU {time.process_time() - c0:.3f}s, total {time.perf_counter() - t0:.3f}s")
+        c0 = time.process_time()
+        st = tts.speak_stream(text)
+        print(f"[STREAM] primer audio {st['first_sample_s']:.3f}s, CPU {time.process_time() - c0:.3f}s, total {st['total_s']:.3f}s")
+        exit(0)
+
     try: 
         print("Este es el nodo de prueba del Text to Speech 🔊 - Presione Ctrl+C para salir\n")
         while True:
             text = input("Escribe algo: ")
-            get_audio = tts.synthesize(text)
-            tts.play_audio_with_amplitude(get_audio)
+            tts.speak_stream(text)
 
     except KeyboardInterrupt:
         tts.stop_tts()
@@ -0,0 +1,125 @@
+import json
+import hashlib
+import logging
+from collections import OrderedDict
+from dataclasses import asdict, is_dataclass
+from pathlib import Path
+from typing import Any, Dict, List
+import numpy as np
+
+from config.settings import PATH_TTS_CACHE, MAX_ENTRIES_TTS_CACHE
+
+
+class TTSCache:
+    """
+    On-disk cache of synthesized phrases stored as raw int16 PCM (one `.pcm` file per phrase).
+    Hits are returned as read-only `np.memmap` arrays, so playback can start without synthesis.
+    - The key is text + voice model + SynthesisConfig, changing any of them misses the cache.
+    - Pre-warmed phrases (RAG answers, router replies) are pinned and never evicted.
+    - Dynamic phrases are kept in LRU order, at most `max_entries` of them.
+    """
+
+    def __init__(self, voice_id: str, syn_config, root: str = PATH_TTS_CACHE, max_entries: int = MAX_ENTRIES_TTS_CACHE):
+        self.log = logging.getLogger("TTS_Cache")
+        self.root = Path(root).expanduser()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.root / "index.json"
+        self.max_entries = max_entries
+        config = asdict(syn_config) if is_dataclass(syn_config) else dict(vars(syn_config))
+        self.salt = json.dumps({"voice": voice_id, "config": config}, sort_keys=True)
+        self.entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.load()
+
+    def load(self) -> None:
+        """ Load the index, dropping entries whose PCM file is gone """
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for k, meta in data.items():
+                if (self.root / f"{k}.pcm").exists():
+                    self.entries[k] = meta
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self.log.warning(f"No se pudo leer el índice del cache TTS: {e}")
+
+    def save(self) -> None:
+        tmp = self.index_path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        tmp.replace(self.index_path)
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.salt}\n{text.strip()}".encode("utf-8")).hexdigest()
+
+    def get(self, text: str) -> np.ndarray | None:
+        """ Return the cached int16 PCM for `text` (memory-mapped), or None on a miss """
+        k = self.key(text)
+        meta = self.entries.get(k)
+        if meta is None or not meta.get("samples"):
+            self.misses += 1
+            return None
+        self.entries.move_to_end(k)
+        self.hits += 1
+        return np.memmap(self.root / f"{k}.pcm", dtype=np.int16, mode="r", shape=(meta["samples"],))
+
+    def put(self, text: str, pcm_i16: np.ndarray, pinned: bool = False) -> None:
+        """ Store int16 mono PCM for `text`; dynamic entries may evict the least recently used ones """
+        k = self.key(text)
+        pcm_i16 = np.ascontiguousarray(pcm_i16, dtype=np.int16)
+        pcm_i16.tofile(self.root / f"{k}.pcm")
+        pinned = pinned or self.entries.get(k, {}).get("pinned", False)
+        self.entries[k] = {"text": text.strip(), "samples": int(pcm_i16.size), "pinned": pinned}
+        self.entries.move_to_end(k)
+        self.evict()
+        self.save()
+
+    def evict(self) -> None:
+        dynamic = [k for k, meta in self.entries.items() if not meta.get("pinned")]
+        for k in dynamic[:max(0, len(dynamic) - self.max_entries)]:
+            self.entries.pop(k, None)
+            (self.root / f"{k}.pcm").unlink(missing_ok=True)
+
+    def warm(self, texts, synthesize) -> int:
+        """ Synthesize and pin every text that is not cached yet, `synthesize(text)` must return int16 PCM """
+        added = 0
+        for text in dict.fromkeys(t.strip() for t in texts if t and t.strip()):
+            if self.key(text) in self.entries:
+                self.entries[self.key(text)]["pinned"] = True
+                continue
+            self.put(text, synthesize(text), pinned=True)
+            added += 1
+        self.save()
+        return added
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0}
+
+
+def fixed_phrases(rag_path: str) -> List[str]:
+    """ Every `answer` of the GENERAL_RAG file plus the fixed replies of the Router """
+    from llm.llm_router import FIXED_REPLIES
+    with open(Path(rag_path).expanduser(), "r", encoding="utf-8") as f:
+        obj = json.load(f)
+    answers = [it.get("answer", "") for lst in obj.values() if isinstance(lst, list) for it in lst if isinstance(it, dict)]
+    return answers + list(FIXED_REPLIES)
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Pre-warm the cache at build/install time: python -m tts.tts_cache
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+
+    from config.settings import PATH_GENERAL_RAG
+    from utils.utils import LoadModel
+    from tts.text_to_speech import TTS
+
+    model = LoadModel()
+    tts = TTS(str(model.ensure_model("tts")[0]), str(model.ensure_model("tts")[1]))
+    phrases = fixed_phrases(PATH_GENERAL_RAG)
+    added = tts.cache.warm(phrases, lambda t: np.concatenate(list(tts.synthesize_stream(t))))
+    print(f"Cache TTS listo: {added} frases nuevas, {len(tts.cache.entries)} en total en {tts.cache.root} ✅")
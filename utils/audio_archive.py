@@ -0,0 +1,102 @@
+import time
+import wave
+import queue
+import shutil
+import logging
+import threading
+import subprocess
+from collections import deque
+from pathlib import Path
+import numpy as np
+
+from config.settings import ARCHIVE_FORMAT, ARCHIVE_MAX_MB, ARCHIVE_MAX_FILES
+
+
+class AudioArchiver(threading.Thread):
+    """
+    Background writer for audio we want to keep (TTS outputs, STT captures).
+    `submit()` never blocks: if the writer falls behind the clip is dropped and counted.
+    - Files are `<prefix>_<timestamp>_<n>.wav|flac` inside `folder`.
+    - FLAC is encoded with ffmpeg (already a system dependency), WAV is used if it's missing.
+    - Rotation: the oldest files are deleted while the folder is over `max_files` or `max_mb`.
+    """
+
+    def __init__(self, folder: str, prefix: str, fmt: str = ARCHIVE_FORMAT,
+                 max_mb: float = ARCHIVE_MAX_MB, max_files: int = ARCHIVE_MAX_FILES, max_pending: int = 32):
+        super().__init__(name=f"AudioArchiver-{prefix}", daemon=True)
+        self.log = logging.getLogger("Audio_Archive")
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.fmt = fmt.lower()
+        if self.fmt == "flac" and shutil.which("ffmpeg") is None:
+            self.log.warning("ffmpeg no está instalado, se guardará en WAV")
+            self.fmt = "wav"
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_files = max_files
+        self.q: queue.Queue = queue.Queue(maxsize=max_pending)
+        self.count = 0
+        self.dropped = 0
+
+        # Existing files, oldest first, so the quota also covers previous runs
+        old = sorted((p for p in self.folder.glob(f"{prefix}_*") if p.is_file()), key=lambda p: p.stat().st_mtime)
+        self.files = deque((p, p.stat().st_size) for p in old)
+        self.total_bytes = sum(size for _, size in self.files)
+        self.start()
+
+    def submit(self, pcm_i16, sample_rate: int) -> bool:
+        """ Queue int16 mono PCM (ndarray or bytes) to be written, returns False if it was dropped """
+        try:
+            self.q.put_nowait((pcm_i16, int(sample_rate)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            self.log.warning(f"Archivo de audio lleno, clip descartado ({self.dropped})")
+            return False
+
+    def run(self) -> None:
+        while True:
+            item = self.q.get()
+            try:
+                if item is None:
+                    break
+                self.write(*item)
+            except Exception as e:
+                self.log.warning(f"No se pudo guardar el audio: {e}")
+            finally:
+                self.q.task_done()
+
+    def write(self, pcm_i16, sample_rate: int) -> Path:
+        data = pcm_i16.tobytes() if isinstance(pcm_i16, np.ndarray) else bytes(pcm_i16)
+        path = self.folder / f"{self.prefix}_{time.strftime('%Y%m%d-%H%M%S')}_{self.count}.{self.fmt}"
+        self.count += 1
+
+        if self.fmt == "flac":
+            subprocess.run(
+                ["ffmpeg", "-loglevel", "error", "-y", "-f", "s16le", "-ar", str(sample_rate), "-ac", "1",
+                 "-i", "pipe:0", str(path)],
+                input=data, check=True,
+            )
+        else:
+            with wave.open(str(path), "wb") as wav_file:
+                wav_file.setnchannels(1)
+                wav_file.setsampwidth(2)
+                wav_file.setframerate(sample_rate)
+                wav_file.writeframes(data)
+
+        size = path.stat().st_size
+        self.files.append((path, size))
+        self.total_bytes += size
+        self.rotate()
+        return path
+
+    def rotate(self) -> None:
+        while self.files and (len(self.files) > self.max_files or self.total_bytes > self.max_bytes):
+            path, size = self.files.popleft()
+            path.unlink(missing_ok=True)
+            self.total_bytes -= size
+
+    def stop(self) -> None:
+        """ Write what is still queued and stop the thread """
+        self.q.put(None)
+        self.join(timeout=5.0)
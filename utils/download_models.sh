@@ -106,6 +106,30 @@ if [[ -n "$LLM_LEN" && "$LLM_LEN" != "0" ]]; then
   done
 fi
 
+# ====== LLM small (opcional; para USE_LLM_TIERING) ======
+SMALL_LEN="$(yq -r '(.llm_small  // []) | length'  "$MODELS_FILE" 2>/dev/null || echo 0)"
+if [[ -n "$SMALL_LEN" && "$SMALL_LEN" != "0" ]]; then
+  echo "[LLM] Descargando modelos pequeños..."
+  for i in $(seq 0 $((SMALL_LEN-1))); do
+    NAME="$(yq -r ".llm_small[$i].name // \"\"" "$MODELS_FILE")"
+    URL="$(yq -r  ".llm_small[$i].url  // \"\"" "$MODELS_FILE")"
+    [[ -n "$URL" && "$URL" != "null" ]] || continue
+    download_file_or_zip "$URL" "$CACHE_DIR/llm_small" "$NAME"
+  done
+fi
+
+# ====== LLM draft (opcional; para SPECULATIVE_LLM = "draft") ======
+DRAFT_LEN="$(yq -r '(.llm_draft  // []) | length'  "$MODELS_FILE" 2>/dev/null || echo 0)"
+if [[ -n "$DRAFT_LEN" && "$DRAFT_LEN" != "0" ]]; then
+  echo "[LLM] Descargando modelos borrador..."
+  for i in $(seq 0 $((DRAFT_LEN-1))); do
+    NAME="$(yq -r ".llm_draft[$i].name // \"\"" "$MODELS_FILE")"
+    URL="$(yq -r  ".llm_draft[$i].url  // \"\"" "$MODELS_FILE")"
+    [[ -n "$URL" && "$URL" != "null" ]] || continue
+    download_file_or_zip "$URL" "$CACHE_DIR/llm_draft" "$NAME"
+  done
+fi
+
 # ====== Vosk (opcional; vosk: [{name, url}, ...]) ======
 VOSK_LEN="$(yq -r '(.wake_word // []) | length' "$MODELS_FILE" 2>/dev/null || echo 0)"
 if [[ -n "$VOSK_LEN" && "$VOSK_LEN" != "0" ]]; then
@@ -0,0 +1,272 @@
+from __future__ import annotations
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import ctypes, gc, logging, os, threading, time, weakref
+
+from config.settings import MEMORY_BUDGET_MB, MEMORY_CHECK_S
+from utils.metrics import METRICS
+
+_PAGE_MB = os.sysconf("SC_PAGE_SIZE") / (1024.0 * 1024.0) if hasattr(os, "sysconf") else 4096 / (1024.0 * 1024.0)
+
+def rss_mb() -> float:
+    """ Resident memory of this process in MB (/proc/self/statm, ru_maxrss where it doesn't exist) """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def release_memory() -> None:
+    """ Collect the dropped engine and give the freed heap back to the OS (glibc keeps it otherwise) """
+    gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+#Every engine created in the process, for the metrics (weak: a dropped engine disappears from them)
+_ENGINES: "weakref.WeakSet[Reloadable]" = weakref.WeakSet()
+
+METRICS.collect("octybot_process_rss_mb", "Resident memory of the process (MB)", "gauge", lambda: [({}, rss_mb())])
+METRICS.collect("octybot_engine_memory_mb", "RSS growth measured when the engine loaded, 0 while unloaded (MB)", "gauge",
+                lambda: [({"engine": e.engine_name}, e.footprint_mb if e.loaded else 0.0) for e in list(_ENGINES)])
+METRICS.collect("octybot_engine_loaded", "1 if the engine model is in memory", "gauge",
+                lambda: [({"engine": e.engine_name}, int(e.loaded)) for e in list(_ENGINES)])
+METRICS.collect("octybot_engine_loads_total", "Loads of the engine model", "counter",
+                lambda: [({"engine": e.engine_name}, e.loads) for e in list(_ENGINES)])
+
+class Reloadable:
+    """
+    Mixin for heavy engines that can be unloaded and loaded again (LLM, Whisper, Piper...).
+    The engine implements `_load()`, `_unload()` and `_is_loaded()`, calls `_init_reloadable()` in its
+    __init__ and wraps every use of the model in `with self.using():` (loads it if needed, marks it busy).
+    `unload()` waits for nothing: it is skipped while the engine is in use.
+    """
+
+    def _init_reloadable(self, name: str, size_hint_mb: float = 0.0, lock=None) -> None:
+        self.engine_name = name
+        self.size_hint_mb = size_hint_mb #e.g. size of the model file, used before the first load
+        self.footprint_mb = 0.0 #RSS growth measured on the last load
+        self.load_ms: float | None = None
+        self.last_used = time.monotonic()
+        self.loads = 0
+        self.unloads = 0
+        self._engine_lock = lock or threading.RLock()
+        self._memory: Optional["MemoryManager"] = None
+        self._mem_log = logging.getLogger("Memory")
+        _ENGINES.add(self)
+
+    def _load(self) -> None:
+        raise NotImplementedError
+
+    def _unload(self) -> None:
+        raise NotImplementedError
+
+    def _is_loaded(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def loaded(self) -> bool:
+        return self._is_loaded()
+
+    @property
+    def estimate_mb(self) -> float:
+        return max(self.footprint_mb, self.size_hint_mb)
+
+    def ensure(self) -> None:
+        """ Load the engine if it is not resident, making room first if there is a memory manager """
+        with self._engine_lock:
+            if self._is_loaded():
+                return
+            if self._memory is not None:
+                self._memory.make_room(self)
+            rss0, t0 = rss_mb(), time.perf_counter()
+            self._load()
+            if not self._is_loaded():
+                return
+            self.load_ms = 1000.0 * (time.perf_counter() - t0)
+            self.footprint_mb = max(0.0, rss_mb() - rss0)
+            self.loads += 1
+            self.last_used = time.monotonic()
+            self._mem_log.info(f"✅ {self.engine_name} cargado en {self.load_ms:.0f} ms "
+                               f"(+{self.footprint_mb:.0f} MB, RSS {rss_mb():.0f} MB)")
+
+    @contextmanager
+    def using(self):
+        with self._engine_lock:
+            self.ensure()
+            self.last_used = time.monotonic()
+            try:
+                yield self
+            finally:
+                self.last_used = time.monotonic()
+
+    def unload(self, reason: str = "") -> bool:
+        """ Drop the model and return its memory, False if it was not loaded or is in use right now """
+        if not self._engine_lock.acquire(blocking=False):
+            return False
+        try:
+            if not self._is_loaded():
+                return False
+            rss0, t0 = rss_mb(), time.perf_counter()
+            self._unload()
+            release_memory()
+            self.unloads += 1
+            self._mem_log.info(f"{self.engine_name} descargado{f' ({reason})' if reason else ''} en "
+                               f"{1000.0 * (time.perf_counter() - t0):.0f} ms (-{max(0.0, rss0 - rss_mb()):.0f} MB, RSS {rss_mb():.0f} MB)")
+            return True
+        finally:
+            self._engine_lock.release()
+
+
+class MemoryManager(threading.Thread):
+    """
+    Keep the heavy engines within a memory budget:
+    - every `check_s`, engines idle for longer than their `idle_s` are unloaded,
+    - and while the process RSS is over `budget_mb`, the least recently used ones too;
+    - before an engine loads, others are unloaded (LRU) until its estimated size fits;
+    - `prefetch()` reloads engines in background (e.g. STT and LLM as soon as the wake word fires).
+    Pinned engines (e.g. the wake word, which listens all the time) are never unloaded.
+    """
+
+    def __init__(self, budget_mb: float = MEMORY_BUDGET_MB, check_s: float = MEMORY_CHECK_S):
+        super().__init__(name="MemoryManager", daemon=True)
+        self.log = logging.getLogger("Memory")
+        self.budget_mb = budget_mb
+        self.check_s = check_s
+        self.engines: Dict[str, Reloadable] = {}
+        self.idle_s: Dict[str, float | None] = {}
+        self.pinned: set = set()
+        self._stop = threading.Event()
+        self._prefetching: set = set()
+        self._lock = threading.Lock()
+
+    def register(self, engine: Reloadable, idle_s: float | None = None, pinned: bool = False) -> Reloadable:
+        """ idle_s None = only unloaded under memory pressure """
+        self.engines[engine.engine_name] = engine
+        self.idle_s[engine.engine_name] = idle_s
+        if pinned:
+            self.pinned.add(engine.engine_name)
+        engine._memory = self
+        return engine
+
+    def _unloadable(self, exclude: Optional[Reloadable] = None) -> List[Reloadable]:
+        """ Resident engines that may be unloaded, least recently used first """
+        out = [e for n, e in self.engines.items() if n not in self.pinned and e is not exclude and e.loaded]
+        return sorted(out, key=lambda e: e.last_used)
+
+    def make_room(self, engine: Reloadable) -> None:
+        need = rss_mb() + engine.estimate_mb - self.budget_mb
+        for other in self._unloadable(exclude=engine):
+            if need <= 0:
+                break
+            est = other.estimate_mb
+            if other.unload(f"hace falta memoria para {engine.engine_name}"):
+                need -= est
+        if need > 0:
+            self.log.warning(f"{engine.engine_name} se carga sobre el presupuesto ({need:.0f} MB de más)")
+
+    def check(self) -> List[str]:
+        """ One pass of the policy, returns the names of the engines unloaded """
+        now, out = time.monotonic(), []
+        for e in self._unloadable():
+            idle = self.idle_s.get(e.engine_name)
+            if idle is not None and now - e.last_used > idle and e.unload(f"inactivo {now - e.last_used:.0f} s"):
+                out.append(e.engine_name)
+        for e in self._unloadable():
+            if rss_mb() <= self.budget_mb:
+                break
+            if e.unload("presupuesto de memoria"):
+                out.append(e.engine_name)
+        return out
+
+    def prefetch(self, *names: str) -> None:
+        """ Load the given engines in a background thread, in order, if they are not resident """
+        todo = [n for n in names if n in self.engines and not self.engines[n].loaded]
+        with self._lock:
+            todo = [n for n in todo if n not in self._prefetching]
+            self._prefetching.update(todo)
+        if not todo:
+            return
+
+        def load():
+            for n in todo:
+                try:
+                    self.engines[n].ensure()
+                except Exception as e:
+                    self.log.warning(f"No se pudo precargar {n}: {e}")
+                finally:
+                    with self._lock:
+                        self._prefetching.discard(n)
+
+        threading.Thread(target=load, name="MemoryPrefetch", daemon=True).start()
+
+    def report(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {"rss_mb": round(rss_mb(), 1), "budget_mb": self.budget_mb, "engines": {
+            n: {"loaded": e.loaded, "pinned": n in self.pinned, "estimate_mb": round(e.estimate_mb, 1),
+                "load_ms": None if e.load_ms is None else round(e.load_ms, 1), "idle_s": round(now - e.last_used, 1),
+                "loads": e.loads, "unloads": e.unloads}
+            for n, e in self.engines.items()}}
+
+    def run(self) -> None:
+        while not self._stop.wait(self.check_s):
+            try:
+                self.check()
+            except Exception:
+                self.log.exception("Error en el gestor de memoria")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Stand-in engines that allocate real memory: idle unload, budget enforcement and predictive reload
+    import numpy as np
+    logging.basicConfig(level=logging.INFO, format="[%(levelname)s %(asctime)s] [%(name)s] %(message)s")
+
+    class FakeEngine(Reloadable):
+        def __init__(self, name: str, mb: int, load_s: float):
+            self.mb, self.load_s, self.data = mb, load_s, None
+            self._init_reloadable(name, size_hint_mb=mb)
+
+        def _load(self):
+            time.sleep(self.load_s)
+            self.data = np.ones(self.mb * 1024 * 1024 // 8) #touched, so it is resident
+
+        def _unload(self):
+            self.data = None
+
+        def _is_loaded(self):
+            return self.data is not None
+
+    base = rss_mb()
+    manager = MemoryManager(budget_mb=base + 550, check_s=0.2) #stt + llm fit, the three do not
+    stt = manager.register(FakeEngine("stt", 200, 0.3), idle_s=1.0)
+    llm = manager.register(FakeEngine("llm", 300, 0.5), idle_s=0.5)
+    tts = manager.register(FakeEngine("tts", 100, 0.1), idle_s=None)
+    manager.start()
+
+    for e in (stt, llm, tts):
+        with e.using():
+            pass
+    print(f"Tras usar los tres (presupuesto {manager.budget_mb:.0f} MB): {manager.report()}")
+    time.sleep(1.5)
+    print(f"Tras 1.5 s sin uso: { {n: r['loaded'] for n, r in manager.report()['engines'].items()} }, RSS {rss_mb():.0f} MB")
+
+    t0 = time.perf_counter()
+    with stt.using():
+        pass
+    print(f"Carga perezosa de stt: espera {1000.0 * (time.perf_counter() - t0):.0f} ms")
+    stt.unload("prueba")
+    manager.prefetch("stt", "llm") #the wake word fired, the user is still speaking
+    time.sleep(1.0)
+    t0 = time.perf_counter()
+    with stt.using(), llm.using():
+        pass
+    print(f"Con precarga al detectar la palabra de activación: espera {1000.0 * (time.perf_counter() - t0):.0f} ms")
+    print(manager.report())
+    manager.stop()
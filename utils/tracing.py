@@ -0,0 +1,233 @@
+from __future__ import annotations
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import glob, json, logging, os, queue, threading, time, uuid
+
+from config.settings import USE_TRACING, PATH_TRACE, TRACE_MAX_BYTES, TRACE_BACKUPS
+
+_TURN: ContextVar[Optional["_Turn"]] = ContextVar("TRACE_TURN", default=None)
+
+
+class _Turn:
+    __slots__ = ("id", "t0_ns", "attrs")
+
+    def __init__(self, attrs: Dict[str, Any]):
+        self.id = uuid.uuid4().hex[:12]
+        self.t0_ns = time.monotonic_ns()
+        self.attrs = attrs
+
+
+class Span:
+    """ One timed stage, used as `with TRACER.span("stt") as sp: ...; sp.set(tokens=n)` """
+    __slots__ = ("tracer", "name", "attrs", "turn", "t0_ns")
+
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer, self.name, self.attrs = tracer, name, attrs
+        self.turn = tracer.current()
+        self.t0_ns = 0
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.t0_ns = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.t0_ns, time.monotonic_ns(), turn=self.turn, **self.attrs)
+
+
+class _NoSpan:
+    """ Span of a disabled tracer: nothing is timed nor written """
+    __slots__ = ()
+
+    def set(self, **attrs) -> None:
+        pass
+
+    def __enter__(self) -> "_NoSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Tracer:
+    """
+    Per-turn spans on the monotonic clock, written as JSON lines to a rotating file:
+        {"turn": "3f2a...", "span": "stt", "t_ms": 812.4, "dur_ms": 640.2, "thread": "MainThread", "audio_s": 2.1}
+    `t_ms` is the start of the span since the start of its turn. A turn is started at the wake word and
+    ended after playback; the current turn follows the context (server requests) and, in threads that did
+    not start one (e.g. playback), falls back to the last turn started. The file is written by a
+    background thread (QueueListener), so a span costs two clock reads and a queue put.
+    """
+
+    def __init__(self, path: str = PATH_TRACE, max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS,
+                 enabled: bool = USE_TRACING):
+        self.enabled = enabled
+        self.path = path
+        self._last: Optional[_Turn] = None
+        self._listener: Optional[QueueListener] = None
+        self._log = logging.getLogger("Trace")
+        self._log.propagate = False
+        self._lock = threading.Lock()
+        self._max_bytes, self._backups = max_bytes, backups
+
+    def _writer(self) -> logging.Logger:
+        """ Open the trace file on the first span (nothing is created while tracing is off) """
+        if self._listener is None:
+            with self._lock:
+                if self._listener is None:
+                    Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                    handler = RotatingFileHandler(self.path, maxBytes=self._max_bytes, backupCount=self._backups,
+                                                  encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    q: queue.Queue = queue.Queue(-1)
+                    self._listener = QueueListener(q, handler)
+                    self._listener.start()
+                    self._log.addHandler(QueueHandler(q))
+                    self._log.setLevel(logging.INFO)
+        return self._log
+
+    def current(self) -> Optional[_Turn]:
+        return _TURN.get() or self._last
+
+    def current_id(self) -> Optional[str]:
+        turn = self.current()
+        return turn.id if turn is not None else None
+
+    def start_turn(self, **attrs) -> Optional[str]:
+        """ Start a new turn in this context, returns its id """
+        if not self.enabled:
+            return None
+        turn = _Turn(attrs)
+        _TURN.set(turn)
+        self._last = turn
+        return turn.id
+
+    def end_turn(self, **attrs) -> None:
+        """ Write the span of the whole turn (from start_turn to now) """
+        turn = self.current()
+        if not self.enabled or turn is None:
+            return
+        self.record("turn", turn.t0_ns, time.monotonic_ns(), turn=turn, **turn.attrs, **attrs)
+        _TURN.set(None)
+        if self._last is turn:
+            self._last = None
+
+    def span(self, name: str, **attrs):
+        return Span(self, name, attrs) if self.enabled else _NO_SPAN
+
+    def record(self, name: str, start_ns: int, end_ns: int, turn: Optional[_Turn] = None, **attrs) -> None:
+        """ Write a span measured elsewhere (e.g. the end-of-speech wait, known only once it is over) """
+        if not self.enabled:
+            return
+        turn = turn or self.current()
+        t0 = turn.t0_ns if turn is not None else start_ns
+        rec = {"turn": turn.id if turn is not None else None, "span": name, "t_ms": round((start_ns - t0) / 1e6, 2),
+               "dur_ms": round((end_ns - start_ns) / 1e6, 2), "thread": threading.current_thread().name}
+        if name == "turn":
+            rec["ts"] = round(time.time() - (end_ns - start_ns) / 1e9, 3)
+        rec.update(attrs)
+        self._writer().info(json.dumps(rec, ensure_ascii=False, default=str))
+
+    def flush(self) -> None:
+        """ Wait for the queued spans to be written (stop() + restart of the writer thread) """
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener.start()
+
+    def close(self) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+
+
+#The tracer of the process, every module records through it
+TRACER = Tracer()
+
+
+def read_spans(path: str = PATH_TRACE) -> List[Dict[str, Any]]:
+    """ Spans of the trace file and its rotated backups, oldest first """
+    files = sorted(glob.glob(f"{path}.*"), key=lambda p: -int(p.rsplit(".", 1)[1]) if p.rsplit(".", 1)[1].isdigit() else 0)
+    spans = []
+    for p in files + ([path] if os.path.exists(path) else []):
+        with open(p, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    pass
+    return spans
+
+
+def summarize(spans: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """ Per span name: count, p50/p90/p99/max of dur_ms, and mean share of the turn time """
+    turn_ms = {s["turn"]: s["dur_ms"] for s in spans if s.get("span") == "turn"}
+    by_name: Dict[str, List[Dict[str, Any]]] = {}
+    for s in spans:
+        by_name.setdefault(s.get("span"), []).append(s)
+
+    def pct(v, p):
+        return round(v[min(len(v) - 1, int(len(v) * p))], 1)
+
+    out = {}
+    for name, items in by_name.items():
+        d = sorted(s["dur_ms"] for s in items)
+        shares = [s["dur_ms"] / turn_ms[s["turn"]] for s in items if turn_ms.get(s.get("turn"))]
+        out[name] = {"n": len(d), "p50": pct(d, 0.5), "p90": pct(d, 0.9), "p99": pct(d, 0.99), "max": d[-1],
+                     "share": round(sum(shares) / len(shares), 3) if shares and name != "turn" else None}
+    return dict(sorted(out.items(), key=lambda kv: -kv[1]["p50"]))
+
+
+ #———— Example Usage ————
+if "__main__" == __name__:
+    # Summary of the trace: python -m utils.tracing [--file logs/trace.jsonl] [--turn ID | --last]
+    # --demo first writes a few synthetic turns to a temporary file
+    import sys, random, tempfile
+    args = sys.argv[1:]
+    path = args[args.index("--file") + 1] if "--file" in args else PATH_TRACE
+
+    if "--demo" in args:
+        path = os.path.join(tempfile.mkdtemp(), "trace.jsonl")
+        demo = Tracer(path, enabled=True)
+        rng = random.Random(0)
+        for _ in range(20):
+            demo.start_turn(source="demo")
+            t_end = time.monotonic_ns()
+            time.sleep(rng.uniform(0.005, 0.01))
+            demo.record("endpoint", t_end, time.monotonic_ns())
+            with demo.span("stt", audio_s=2.0):
+                time.sleep(rng.uniform(0.02, 0.04))
+            with demo.span("llm.general") as sp:
+                time.sleep(rng.uniform(0.03, 0.08))
+                sp.set(prompt_tokens=60, completion_tokens=40)
+            with demo.span("tts.synth", chars=48):
+                time.sleep(rng.uniform(0.01, 0.02))
+            demo.end_turn()
+        demo.close()
+
+    spans = read_spans(path)
+    if not spans:
+        print(f"No hay spans en {path} (activa USE_TRACING)")
+        exit(0)
+    turn = args[args.index("--turn") + 1] if "--turn" in args else None
+    if "--last" in args:
+        turn = next((s["turn"] for s in reversed(spans) if s.get("span") == "turn"), None)
+    if turn:
+        # Waterfall of one turn
+        for s in sorted((s for s in spans if s.get("turn") == turn), key=lambda s: s["t_ms"]):
+            extra = {k: v for k, v in s.items() if k not in ("turn", "span", "t_ms", "dur_ms", "thread", "ts")}
+            print(f"{s['t_ms']:9.1f} ms +{s['dur_ms']:8.1f} ms  {s['span']:16s} [{s['thread']}] {extra or ''}")
+        exit(0)
+
+    print(f"{len({s.get('turn') for s in spans})} turnos, {len(spans)} spans en {path}")
+    print(f"{'span':16s} {'n':>5s} {'p50 ms':>9s} {'p90 ms':>9s} {'p99 ms':>9s} {'max ms':>9s} {'% turno':>8s}")
+    for name, r in summarize(spans).items():
+        share = f"{100.0 * r['share']:7.1f}%" if r["share"] is not None else "       -"
+        print(f"{name:16s} {r['n']:5d} {r['p50']:9.1f} {r['p90']:9.1f} {r['p99']:9.1f} {r['max']:9.1f} {share}")